@@ -22,7 +22,7 @@ from pypet.pypetexceptions import DataNotInStorageError, NoSuchServiceError,\
     VersionMismatchError, GitDiffError
 from pypet.pypetlogging import HasLogger, rename_log_file
 from pypet.utils.explore import cartesian_product, find_unique_points
-from pypet.utils.hdf5compression import compact_hdf5_file
+from pypet.utils.hdf5compression import compact_hdf5_file, repack_hdf5_file
 from pypet.utils.helpful_functions import progressbar, racedirs
 from pypet.shareddata import SharedArray, SharedCArray, SharedEArray,\
     SharedVLArray, SharedPandasFrame, SharedTable, SharedResult,\
@@ -30,6 +30,7 @@ from pypet.shareddata import SharedArray, SharedCArray, SharedEArray,\
 from pypet.slots import HasSlots
 from pypet.utils.trajectory_utils import merge_all_in_folder
 from pypet.utils.decorators import manual_run
+from pypet.utils.runcache import RunCache
 from pypet.utils.pypettest import test
 
 
@@ -69,6 +70,7 @@ __all__ = [
     cartesian_product.__name__,
     load_trajectory.__name__,
     compact_hdf5_file.__name__,
+    repack_hdf5_file.__name__,
     KnowsTrajectory.__name__,
     StorageContextManager.__name__,
     SharedArray.__name__,
@@ -85,5 +87,6 @@ __all__ = [
     find_unique_points.__name__,
     merge_all_in_folder.__name__,
     manual_run.__name__,
+    RunCache.__name__,
     test.__name__
 ]
@@ -185,10 +185,25 @@ class Annotations(HasSlots):
 
 class WithAnnotations(HasLogger):
 
-    __slots__ = ('_annotations',)
+    __slots__ = ('_annotations_',)
 
     def __init__(self):
-        self._annotations = Annotations()  # The annotation object to handle annotations
+        self._annotations_ = None  # The annotation object is only created if needed
+
+    @property
+    def _annotations(self):
+        """To avoid the overhead of an empty annotation object for every node"""
+        if self._annotations_ is None:
+            self._annotations_ = Annotations()
+        return self._annotations_
+
+    @_annotations.setter
+    def _annotations(self, annotations):
+        self._annotations_ = annotations
+
+    def _has_annotations(self):
+        """Checks if there are any annotations without creating the annotation object"""
+        return self._annotations_ is not None and not self._annotations_.f_is_empty()
 
     @property
     def v_annotations(self):
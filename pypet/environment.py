@@ -29,6 +29,11 @@ import hashlib
 import time
 import datetime
 import inspect
+import copy as cp
+import json
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as futures_wait
 
 try:
     from sumatra.projects import load_project
@@ -65,6 +70,11 @@ try:
 except ImportError:
     zmq = None
 
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
 from pypet.pypetlogging import LoggingManager, HasLogger, simple_logging_config
 from pypet.trajectory import Trajectory
 from pypet.storageservice import HDF5StorageService, LazyStorageService
@@ -72,13 +82,20 @@ from pypet.utils.mpwrappers import QueueStorageServiceWriter, LockWrapper, \
     PipeStorageServiceSender, PipeStorageServiceWriter, ReferenceWrapper, \
     ReferenceStore, QueueStorageServiceSender, LockerServer, LockerClient, \
     ForkAwareLockerClient, TimeOutLockerServer, QueuingClient, QueuingServer, \
-    ForkAwareQueuingClient
+    ForkAwareQueuingClient, PicklingQueue, StreamingQueuingClient, StreamingQueuingServer, \
+    ForkAwareStreamingQueuingClient, wait_times
 from pypet.utils.siginthandling import sigint_handling
+from pypet.utils.runcache import RunCache
+from pypet.utils.resumejournal import ResumeJournal
+from pypet.utils.helpful_classes import MemoryModel
+from pypet.utils.explore import find_unique_points
+from pypet.utils.profiling import is_profiled, profile_call, stats_to_frame, merge_stats
+from pypet.utils.storagemetrics import StorageMetrics
 from pypet.utils.gitintegration import make_git_commit
 from pypet._version import __version__ as VERSION
 from pypet.utils.decorators import deprecated, kwargs_api_change, prefix_naming
 from pypet.utils.helpful_functions import is_debug, result_sort, format_time, port_to_tcp, \
-    racedirs
+    racedirs, make_trace_events
 from pypet.utils.storagefactory import storage_factory
 from pypet.utils.configparsing import parse_config
 from pypet.parameter import Parameter
@@ -284,6 +301,18 @@ def _single_run(kwargs):
 
         result_queue: A queue object to store results into in case a pool is used, otherwise None
 
+        run_cache: A :class:`~pypet.utils.runcache.RunCache` or `None`
+
+        code_version: Version of the code that is part of the cache key
+
+        duplicates: Indices of runs that are duplicates of the current run
+
+        deduplicate_mode: Whether data is linked or copied for duplicates
+
+        profile_runs: Every Nth run or indices of runs that are profiled, `None` for no profiling
+
+        dispatch_timestamp: Time when the run was handed to a worker
+
     :return:
 
         Results computed by the user's job function which are not stored into the trajectory.
@@ -291,32 +320,128 @@ def _single_run(kwargs):
         ``((traj.v_idx, result), run_information_dict)``
 
     """
-    pypet_root_logger = logging.getLogger('pypet')
     traj = kwargs['traj']
     runfunc = kwargs['runfunc']
     runargs = kwargs['runargs']
     kwrunparams = kwargs['runkwargs']
-    clean_up_after_run = kwargs['clean_up_runs']
-    automatic_storing = kwargs['automatic_storing']
-    wrap_mode = kwargs['wrap_mode']
 
-    idx = traj.v_idx
-    total_runs = len(traj)
+    cache_key, cached_entry = _start_single_run(kwargs)
+
+    if cached_entry is None:
+        # Run the job function of the user
+        if is_profiled(traj.v_idx, kwargs.get('profile_runs', None)):
+            result, stats = profile_call(runfunc, traj, *runargs, **kwrunparams)
+            _add_profile(traj, stats)
+        else:
+            result = runfunc(traj, *runargs, **kwrunparams)
+    else:
+        result = kwargs['run_cache'].restore_run(traj, cached_entry)
+
+    return _finish_single_run(kwargs, result, cache_key, cached_entry)
+
+
+def _add_profile(traj, stats):
+    """Adds the profile of the current run as a result and to the run information.
+
+    The raw statistics in the run information are merged by the environment.
+
+    """
+    traj.f_add_result('runs.$.profile', stats_to_frame(stats),
+                      comment='cProfile statistics of the job function')
+    traj.f_get_run_information(traj.v_idx, copy=False)['profile'] = stats
+
+
+def _start_single_run(kwargs):
+    """Starts a single run and looks it up in the run cache.
+
+    :return: Tuple of the cache key and the cached entry, `(None, None)` if no cache is used
+
+    """
+    pypet_root_logger = logging.getLogger('pypet')
+    traj = kwargs['traj']
 
     pypet_root_logger.info('\n=========================================\n '
               'Starting single run #%d of %d '
-              '\n=========================================\n' % (idx, total_runs))
+              '\n=========================================\n' % (traj.v_idx, len(traj)))
 
     # Measure start time
     traj.f_start_run(turn_into_run=True)
+    if kwargs.get('measure_memory', False):
+        # Only needed to learn the memory model
+        traj._start_memory_meter()
+    traj._cancelled_runs = kwargs.get('cancelled', None)
 
-    # Run the job function of the user
-    result = runfunc(traj, *runargs, **kwrunparams)
+    run_information = traj.f_get_run_information(traj.v_idx, copy=False)
+    dispatch_timestamp = kwargs.get('dispatch_timestamp', None)
+    if dispatch_timestamp is not None:
+        run_information['dispatch_time'] = max(run_information['timestamp'] -
+                                               dispatch_timestamp, 0.0)
+    run_information['process_id'] = os.getpid()
+    run_information['thread_id'] = threading.current_thread().ident
+
+    # Look up the run in the cache if desired
+    run_cache = kwargs.get('run_cache', None)
+    cache_key = None
+    cached_entry = None
+    if run_cache is not None:
+        cache_key = run_cache.make_key(traj, kwargs['code_version'])
+        if cache_key is not None:
+            cached_entry = run_cache.load(cache_key)
+
+    # Remember when the job function starts and how long we waited so far
+    kwargs['phase_marks'] = (time.time(), wait_times.lock, wait_times.ipc)
+
+    return cache_key, cached_entry
+
+
+def _finish_single_run(kwargs, result, cache_key=None, cached_entry=None):
+    """Stores the data of a single run and finalizes it.
+
+    :return: The nested result tuple, see :func:`~pypet.environment._single_run`
+
+    """
+    pypet_root_logger = logging.getLogger('pypet')
+    traj = kwargs['traj']
+    clean_up_after_run = kwargs['clean_up_runs']
+    automatic_storing = kwargs['automatic_storing']
+    wrap_mode = kwargs['wrap_mode']
+    run_cache = kwargs.get('run_cache', None)
+
+    idx = traj.v_idx
+    total_runs = len(traj)
+    cancelled = traj.f_is_cancelled()
+    traj._cancelled_runs = None
+    function_start, lock_start, ipc_start = kwargs.pop('phase_marks')
+    store_start = time.time()
 
     # Store data if desired
     if automatic_storing:
         traj.f_store()
 
+    cache_entry = None
+    if (run_cache is not None and cache_key is not None and
+            cached_entry is None and not cancelled):
+        # Results of cancelled runs are most likely incomplete
+        cache_entry = run_cache.make_run_entry(traj, result)
+
+    # Store the data for all runs that are duplicates of this one
+    duplicates = kwargs.get('duplicates', ())
+    if duplicates:
+        _store_duplicate_runs(traj, duplicates, kwargs['deduplicate_mode'])
+
+    if hasattr(traj.v_storage_service, 'sync'):
+        # Streamed data has to arrive before the run is reported as finished
+        traj.v_storage_service.sync()
+
+    run_information = traj.f_get_run_information(idx, copy=False)
+    run_information['function_time'] = store_start - function_start
+    run_information['store_time'] = time.time() - store_start
+    run_information['lock_time'] = wait_times.lock - lock_start
+    run_information['ipc_time'] = wait_times.ipc - ipc_start
+    if hasattr(traj.v_storage_service, 'pop_metrics'):
+        # Metrics are transferred to the environment together with the run information
+        run_information['storage_metrics'] = traj.v_storage_service.pop_metrics()
+
     # Add the index to the result and the run information
     if wrap_mode == pypetconstants.WRAP_MODE_LOCAL:
         result = ((traj.v_idx, result),
@@ -330,6 +455,16 @@ def _single_run(kwargs):
     # Measure time of finishing
     traj.f_finalize_run(store_meta_data=False,
                         clean_up=clean_up_after_run)
+    if cancelled:
+        # The run information dictionary is part of the result
+        traj.f_get_run_information(idx, copy=False)['completed'] = pypetconstants.RUN_CANCELLED
+    if cache_entry is not None:
+        # The run information is complete only after finalizing the run
+        cached_information = traj.f_get_run_information(idx)
+        cached_information.pop('storage_metrics', None)
+        run_cache.save_run(cache_key, cache_entry, cached_information)
+    elif cached_entry is not None:
+        run_cache.restore_run_information(traj, cached_entry)
 
     pypet_root_logger.info('\n=========================================\n '
               'Finished single run #%d of %d '
@@ -338,6 +473,36 @@ def _single_run(kwargs):
     return result
 
 
+def _store_duplicate_runs(traj, duplicates, deduplicate_mode):
+    """Stores the data of the current run for all runs that are duplicates of it.
+
+    The run groups below `results.runs` and `derived_parameters.runs` are either
+    linked (``deduplicate_mode='link'``) or all their leaves are copied
+    (``deduplicate_mode='copy'``) into the groups of the duplicates.
+
+    """
+    run_name = traj.v_crun
+    for branch in ('results', 'derived_parameters'):
+        if not traj.f_contains('%s.runs.%s' % (branch, run_name),
+                               shortcuts=False, with_links=False):
+            continue
+        runs_group = traj.f_get('%s.runs' % branch, shortcuts=False)
+        run_group = runs_group.f_get(run_name, shortcuts=False)
+        for idx in duplicates:
+            duplicate_name = traj.f_wildcard('$', idx)
+            if deduplicate_mode == 'link':
+                runs_group.f_add_link(duplicate_name, run_group)
+            else:
+                for leaf in run_group.f_iter_leaves(with_links=False):
+                    copied_leaf = cp.deepcopy(leaf)
+                    split_names = leaf.v_full_name.split('.')
+                    split_names[2] = duplicate_name
+                    copied_leaf._rename('.'.join(split_names))
+                    copied_leaf._stored = False
+                    traj.f_add_leaf(copied_leaf)
+            runs_group.f_store_child(duplicate_name, recursive=True)
+
+
 def _wrap_handling(kwargs):
     """ Starts running a queue handler and creates a log file for the queue."""
     _configure_logging(kwargs, extract=False)
@@ -352,6 +517,10 @@ def _wrap_handling(kwargs):
     handler.run()
     # profiler.disable()
     # profiler.dump_stats('./queue.profile2')
+    metrics_queue = kwargs.get('metrics_queue', None)
+    if metrics_queue is not None:
+        # Send the storage metrics of the writer back to the main process
+        metrics_queue.put(handler.metrics)
 
 
 @prefix_naming
@@ -482,7 +651,7 @@ class Environment(HasLogger):
         to run your experiment. Note if you use QUEUE mode (see below) the queue process
         is not included in this number and will add another extra process for storing.
         If you have *psutil* installed, you can set `ncores=0` to let *psutil* determine
-        the number of CPUs available.
+        the number of CPUs available. If `use_threads=True` this is the number of threads.
 
     :param use_scoop:
 
@@ -506,6 +675,54 @@ class Environment(HasLogger):
         If you choose ``use_pool=False`` you can also make use of the `cap` values,
         see below.
 
+    :param use_asyncio:
+
+        If ``True`` your job function is expected to be a coroutine function
+        (i.e. defined via ``async def``) and runs are executed concurrently on
+        an :mod:`asyncio` event loop in the main process. This is useful if your
+        single runs mostly wait on I/O, like simulators connected via subprocess pipes or
+        sockets. Every run receives its own shallow copy of the trajectory with only
+        the explored parameters copied. All storage requests are put on a non-blocking
+        queue and handled by a single storage thread, accordingly, data cannot be loaded
+        during single runs. Results, run information and post-processing behave
+        as in serial mode. Cannot be combined with `multiproc`.
+
+    :param concurrency_limit:
+
+        Maximum number of single runs that are executed concurrently
+        if `use_asyncio=True`.
+
+    :param use_threads:
+
+        If ``True`` single runs are executed by a pool of `ncores` threads
+        in the main process. This avoids pickling the trajectory and duplicating
+        memory across processes and yields speedups if your job function spends most of
+        its time in code that releases the GIL, like many numpy operations, numba
+        or cython code with ``nogil``. As for `use_asyncio`, every run receives its
+        own shallow copy of the trajectory with only the explored parameters copied,
+        so the current run index is isolated from all other runs.
+        All storage requests are handled by a single storage thread.
+        Cannot be combined with `multiproc` or `use_asyncio`.
+
+    :param profile_runs:
+
+        Profiles the job function of single runs with :mod:`cProfile`. Either an integer
+        `N` to profile every Nth run (``True`` profiles every run) or a list of run indices.
+        The statistics of a run are added as a pandas DataFrame result `profile`
+        (``results.runs.run_XXXXXXXXX.profile``) to the trajectory.
+        The statistics of all profiled runs are merged and available via
+        :attr:`~pypet.environment.Environment.profile_stats` after the experiment.
+        Cannot be combined with `use_asyncio`.
+
+    :param store_metrics:
+
+        Metrics of the storage service, i.e. counters like the number of processed nodes,
+        flushes, or written bytes, latency histograms per storage message, and the lock
+        contention per process are always collected from all processes and available via
+        :attr:`~pypet.environment.Environment.storage_metrics`.
+        If ``True`` they are also added to the trajectory as the result
+        ``results.environment.ENVNAME.storage_metrics`` at the end of every run.
+
     :param freeze_input:
 
         Can be set to ``True`` if the run function as well as all additional arguments
@@ -558,6 +775,13 @@ class Environment(HasLogger):
         If an estimate is given a new process is not started if
         the threshold would be crossed including the estimate.
 
+        The peak memory growth of every completed run is recorded in its run information
+        (see :func:`~pypet.trajectory.Trajectory.f_get_run_information`).
+        Once runs have completed, the estimate is replaced by a least squares
+        fit of the peak memory to the numerical explored parameter values.
+        Accordingly, the memory of the next run is predicted from its parameters
+        and runs are packed onto the available memory.
+
     :param swap_cap:
 
         Analogous to `cpu_cap` but the swap memory is considered.
@@ -627,6 +851,20 @@ class Environment(HasLogger):
             Sharing is established by running a queue server that
             distributes locks to the individual processes.
 
+        :const:`~pypet.pypetconstant.WRAP_MODE_NETSTREAM` ('NETSTREAM')
+
+            Similar to 'NETQUEUE' but data is streamed to the queue server
+            without waiting for a response for every storage request.
+            The server grants every process ``queue_maxsize`` credits,
+            i.e. the number of storage requests that can be in flight before
+            the process has to wait for the server to catch up.
+            At the end of every run a process waits until the server
+            has received all of its data.
+            Storage requests can be sent in batches of ``stream_batch_size``.
+            If pickle protocol 5 is available (Python 3.8 or the
+            `pickle5` package) numpy arrays are sent without copying them
+            into the pickle.
+
          If you don't want wrapping at all use
          :const:`~pypet.pypetconstants.WRAP_MODE_NONE` ('NONE')
 
@@ -634,6 +872,12 @@ class Environment(HasLogger):
 
         Maximum size of the Storage Queue, in case of ``'QUEUE'`` wrapping.
         ``0`` means infinite, ``-1`` (default) means the educated guess of ``2 * ncores``.
+        In case of ``'NETSTREAM'`` wrapping the number of credits granted to every process.
+
+    :param stream_batch_size:
+
+        Number of storage requests sent together in case of ``'NETSTREAM'`` wrapping.
+        Cannot exceed the number of credits.
 
     :param port:
 
@@ -713,8 +957,8 @@ class Environment(HasLogger):
         you can resume your trajectory after the last single run that was still
         successfully stored via your storage service.
 
-        The environment will create several `.ecnt` and `.rcnt` files in a folder that you specify
-        (see below).
+        The environment will create an `.ecnt` file and an append-only journal of the results
+        of all finished runs in a folder that you specify (see below).
         Using this data you can resume crashed trajectories.
 
         In order to resume trajectories use :func:`~pypet.environment.Environment.resume`.
@@ -724,8 +968,10 @@ class Environment(HasLogger):
         that is manipulated during runtime (like a multiprocessing manager list)
         in the positional and keyword arguments passed to the run function.
 
-        If you use post-processing, the expansion of trajectories and continuing of trajectories
-        is NOT supported properly. There is no guarantee that both work together.
+        If you use post-processing, expansions of the trajectory are recorded as small
+        deltas and replayed when the trajectory is resumed. Be aware that your
+        post-processing is called again after resuming and should, thus, decide whether to
+        expand the trajectory based on the trajectory's state (like its length).
 
 
         .. _dill: https://pypi.python.org/pypi/dill
@@ -777,6 +1023,46 @@ class Environment(HasLogger):
         If `True` the program fails instead of triggering a commit if there are not committed
         changes found in the code base. In such a case a `GitDiffError` is raised.
 
+    :param run_cache:
+
+        Folder of a :class:`~pypet.utils.runcache.RunCache` or a cache instance.
+        If given, every run is looked up in the cache before it is executed.
+        The key of a run is a hash of the values of all parameters (explored and non-explored)
+        and the `code_version` (see below). If a run with the same key has already been
+        computed, your job function is not called. Instead, the cached results and
+        derived parameters are copied into the current run and the cached return
+        value is handed over as the result of the run. Links created during a run
+        are not cached. Default is `None`, i.e. no caching.
+
+    :param code_version:
+
+        Version of your code base that is part of the cache key, so results computed
+        by an outdated version of your code are not reused. If you did not pass a version
+        but a `git_repository`, the hexsha of the commit is used. You must
+        provide either one if you want to use a `run_cache`.
+
+    :param deduplicate_runs:
+
+        If `True`, runs are grouped by their unique parameter points
+        (see :func:`~pypet.utils.explore.find_unique_points`) and only the first run of every
+        group is executed. Its result is handed to all duplicates as well. Moreover,
+        the data of the executed run below `results.runs` and `derived_parameters.runs` is
+        stored for all duplicates. Only runs that still need to be executed are grouped,
+        already completed runs are never used as representatives.
+        Requires `automatic_storing` and cannot be combined with
+        :func:`~pypet.environment.Environment.run_map`.
+
+    :param deduplicate_exclude:
+
+        List of names of explored parameters that are ignored when looking for duplicates,
+        for instance, seeds or trial indices.
+
+    :param deduplicate_mode:
+
+        How data is stored for duplicates, either ``'link'`` to add links to the data of
+        the executed run or ``'copy'`` to store full copies of all results and
+        derived parameters.
+
     :param sumatra_project:
 
         If your simulation is managed by sumatra_, you can specify here the path to the
@@ -995,6 +1281,15 @@ class Environment(HasLogger):
 
         Analogous to the above.
 
+    :param run_timings:
+
+        Whether the `runs` overview table should be extended by the durations of the
+        phases of every single run (see
+        :func:`~pypet.trajectory.Trajectory.f_get_run_information`).
+        The durations are always kept in the run information of the trajectory
+        and can be exported as a timeline via
+        :func:`~pypet.environment.Environment.export_timeline`.
+
     Finally, you can also pass properties of the trajectory, like ``v_with_links=True``
     (you can leave the prefix ``v_``, i.e. ``with_links`` works, too).
     Thus, you can change the settings of the trajectory immediately.
@@ -1025,6 +1320,11 @@ class Environment(HasLogger):
                  ncores=1,
                  use_scoop=False,
                  use_pool=False,
+                 use_asyncio=False,
+                 concurrency_limit=16,
+                 use_threads=False,
+                 profile_runs=None,
+                 store_metrics=False,
                  freeze_input=False,
                  timeout=None,
                  cpu_cap=100.0,
@@ -1033,6 +1333,7 @@ class Environment(HasLogger):
                  niceness=None,
                  wrap_mode=pypetconstants.WRAP_MODE_LOCK,
                  queue_maxsize=-1,
+                 stream_batch_size=1,
                  port=None,
                  gc_interval=None,
                  clean_up_runs=True,
@@ -1044,6 +1345,11 @@ class Environment(HasLogger):
                  git_repository=None,
                  git_message='',
                  git_fail=False,
+                 run_cache=None,
+                 code_version=None,
+                 deduplicate_runs=False,
+                 deduplicate_exclude=(),
+                 deduplicate_mode='link',
                  sumatra_project=None,
                  sumatra_reason='',
                  sumatra_label=None,
@@ -1057,6 +1363,45 @@ class Environment(HasLogger):
                              'GitPython. Please install the GitPython package to use '
                              'pypet`s git integration.')
 
+        if run_cache is not None and code_version is None and git_repository is None:
+            raise ValueError('If you want to use a `run_cache` you need to specify '
+                             'a `code_version` or a `git_repository`.')
+
+        if use_asyncio and asyncio is None:
+            raise ValueError('Cannot use `asyncio` because it is not installed.')
+
+        if use_asyncio and multiproc:
+            raise ValueError('You can either use `multiproc` or `use_asyncio`, '
+                             'but not both together.')
+
+        if use_threads and (multiproc or use_asyncio):
+            raise ValueError('You cannot use `use_threads` together with `multiproc` '
+                             'or `use_asyncio`.')
+
+        if concurrency_limit < 1:
+            raise ValueError('The `concurrency_limit` must be at least 1.')
+
+        if profile_runs is False:
+            profile_runs = None
+        elif profile_runs is True:
+            profile_runs = 1
+        if profile_runs is not None:
+            if use_asyncio:
+                raise ValueError('You cannot profile runs executed as coroutines '
+                                 '(`use_asyncio=True`).')
+            if isinstance(profile_runs, int):
+                if profile_runs < 1:
+                    raise ValueError('`profile_runs` must be at least 1.')
+            else:
+                profile_runs = frozenset(int(idx) for idx in profile_runs) or None
+
+        if deduplicate_mode not in ('link', 'copy'):
+            raise ValueError('`deduplicate_mode` must either be `link` or `copy`, not `%s`.' %
+                             str(deduplicate_mode))
+
+        if deduplicate_runs and not automatic_storing:
+            raise ValueError('Deduplication of runs only works with `automatic_storing=True`')
+
         if resumable and dill is None:
             raise ValueError('Please install `dill` if you want to use the feature to '
                              'resume halted trajectories')
@@ -1071,6 +1416,12 @@ class Environment(HasLogger):
         if wrap_mode == pypetconstants.WRAP_MODE_NETLOCK and zmq is None:
             raise ValueError('You need to install `zmq` for `NETLOCK` wrapping.')
 
+        if wrap_mode == pypetconstants.WRAP_MODE_NETSTREAM and zmq is None:
+            raise ValueError('You need to install `zmq` for `NETSTREAM` wrapping.')
+
+        if stream_batch_size < 1:
+            raise ValueError('`stream_batch_size` must be at least 1.')
+
         if (use_pool or use_scoop) and immediate_postproc:
             raise ValueError('You CANNOT perform immediate post-processing if you DO '
                              'use a pool or scoop.')
@@ -1096,9 +1447,10 @@ class Environment(HasLogger):
         if use_scoop and wrap_mode not in (pypetconstants.WRAP_MODE_LOCAL,
                                            pypetconstants.WRAP_MODE_NONE,
                                            pypetconstants.WRAP_MODE_NETLOCK,
-                                           pypetconstants.WRAP_MODE_NETQUEUE):
-            raise ValueError('SCOOP mode only works with `LOCAL`, `NETLOCK` or '
-                             '`NETQUEUE` wrap mode!')
+                                           pypetconstants.WRAP_MODE_NETQUEUE,
+                                           pypetconstants.WRAP_MODE_NETSTREAM):
+            raise ValueError('SCOOP mode only works with `LOCAL`, `NETLOCK`, '
+                             '`NETQUEUE`, or `NETSTREAM` wrap mode!')
 
         if niceness is not None and not hasattr(os, 'nice') and psutil is None:
             raise ValueError('You cannot set `niceness` if your operating system does not '
@@ -1131,7 +1483,8 @@ class Environment(HasLogger):
                              'set `ncores` manually.')
 
         if port is not None and wrap_mode not in (pypetconstants.WRAP_MODE_NETLOCK,
-                                                  pypetconstants.WRAP_MODE_NETQUEUE):
+                                                  pypetconstants.WRAP_MODE_NETQUEUE,
+                                                  pypetconstants.WRAP_MODE_NETSTREAM):
             raise ValueError('You can only specify a port for the `NETLOCK` wrapping.')
 
         if use_scoop and graceful_exit:
@@ -1161,8 +1514,12 @@ class Environment(HasLogger):
         if psutil is not None:
             # Total memory in MB
             self._total_memory = psutil.virtual_memory().total / 1024.0 / 1024.0
-            # Estimated memory needed by each process as ratio
-            self._est_per_process = self._memory_cap[1] / self._total_memory * 100.0
+        # Learns the memory needed by each run from the completed ones
+        self._memory_model = MemoryModel(prior=self._memory_cap[1])
+        self._predicted_memory = {}  # Predicted memory ratio of running processes
+        self._process_memory = {}  # Last measured memory growth of running processes
+        self._process_baseline = {}  # Memory ratio of running processes at their start
+        self._last_memory_check = 0.0
         self._swap_cap = swap_cap
         self._check_usage = check_usage
         self._last_cpu_check = 0.0
@@ -1185,6 +1542,12 @@ class Environment(HasLogger):
         self._postproc = None
         self._postproc_args = ()
         self._postproc_kwargs = {}
+        self._result_hook = None
+        self._result_hook_args = ()
+        self._result_hook_kwargs = {}
+        self._cancelled_runs = set()  # Indices of runs that should not be started
+        self._cancel_signal = None  # Container to signal cancellation to running runs
+        self._cancel_manager = None
         self._immediate_postproc = immediate_postproc
         self._user_pipeline = False
 
@@ -1229,6 +1592,22 @@ class Environment(HasLogger):
                                                        str(self.timestamp) +
                                                            VERSION).encode('utf-8')).hexdigest()
 
+        # Results are only reused if they were computed by the same code
+        if isinstance(run_cache, str):
+            run_cache = RunCache(run_cache)
+        if run_cache is not None and code_version is None:
+            code_version = self._hexsha
+        self._run_cache = run_cache
+        self._code_version = code_version
+
+        self._deduplicate_runs = deduplicate_runs
+        self._deduplicate_exclude = deduplicate_exclude
+        self._deduplicate_mode = deduplicate_mode
+        self._duplicates = {}  # Maps representative runs to their duplicates
+        self._duplicate_runs = set()  # Indices of duplicates that are not executed
+        self._completed_duplicates = []  # Duplicates that received the result of their
+        # representative but whose results have not been sorted
+
         # Create the name of the environment
         short_hexsha = self._hexsha[0:7]
         name = 'environment'
@@ -1286,6 +1665,8 @@ class Environment(HasLogger):
         self._resume_folder = resume_folder
         self._resume_path = resume_path
         self._delete_resume = delete_resume
+        self._resume_journal = None
+        self._resume_deltas = None
 
         # Check multiproc
         self._multiproc = multiproc
@@ -1298,6 +1679,7 @@ class Environment(HasLogger):
             # Educated guess of queue size
             queue_maxsize = 2 * ncores
         self._queue_maxsize = queue_maxsize
+        self._stream_batch_size = stream_batch_size
         if wrap_mode is None:
             # None cannot be used in HDF5 files, accordingly we need a string representation
             wrap_mode = pypetconstants.WRAP_MODE_NONE
@@ -1305,6 +1687,15 @@ class Environment(HasLogger):
         # Whether to use a pool of processes
         self._use_pool = use_pool
         self._use_scoop = use_scoop
+        self._use_asyncio = use_asyncio
+        self._concurrency_limit = concurrency_limit
+        self._use_threads = use_threads
+        self._storage_thread = None  # Thread storing data for `use_asyncio` and `use_threads`
+        self._storage_writer = None
+        self._profile_runs = profile_runs
+        self._profile_stats = None  # Merged `pstats.Stats` of all profiled runs
+        self._store_metrics = store_metrics
+        self._storage_metrics = StorageMetrics()  # Merged metrics of all storage services
         self._freeze_input = freeze_input
         self._gc_interval = gc_interval
         self._multiproc_wrapper = None # The wrapper Service
@@ -1427,6 +1818,17 @@ class Environment(HasLogger):
                                         comment='Maximum size of Storage Queue/Pipe in case of '
                                                 'multiprocessing and QUEUE/PIPE wrapping').f_lock()
 
+                if self._wrap_mode == pypetconstants.WRAP_MODE_NETSTREAM:
+                    config_name = 'environment.%s.queue_maxsize' % self.name
+                    self._traj.f_add_config(Parameter, config_name, self._queue_maxsize,
+                                        comment='Credits granted to every process in case of '
+                                                'NETSTREAM wrapping').f_lock()
+
+                    config_name = 'environment.%s.stream_batch_size' % self.name
+                    self._traj.f_add_config(Parameter, config_name, self._stream_batch_size,
+                                        comment='Number of storage requests sent together '
+                                                'in case of NETSTREAM wrapping').f_lock()
+
                 if self._wrap_mode == pypetconstants.WRAP_MODE_NETLOCK:
                     config_name = 'environment.%s.url' % self.name
                     self._traj.f_add_config(Parameter, config_name, self._url,
@@ -1452,6 +1854,43 @@ class Environment(HasLogger):
                                                 'is called.').f_lock()
 
 
+            if self._use_asyncio:
+                config_name = 'environment.%s.use_asyncio' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._use_asyncio,
+                                        comment='Whether runs are executed concurrently '
+                                                'on an asyncio event loop.').f_lock()
+
+                config_name = 'environment.%s.concurrency_limit' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._concurrency_limit,
+                                        comment='Maximum number of concurrently '
+                                                'executed runs.').f_lock()
+
+            if self._use_threads:
+                config_name = 'environment.%s.use_threads' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._use_threads,
+                                        comment='Whether runs are executed by a '
+                                                'pool of threads.').f_lock()
+
+                config_name = 'environment.%s.ncores' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._ncores,
+                                        comment='Number of threads').f_lock()
+
+            if self._profile_runs is not None:
+                config_name = 'environment.%s.profile_runs' % self._name
+                if isinstance(self._profile_runs, int):
+                    profile_runs = self._profile_runs
+                else:
+                    profile_runs = tuple(sorted(self._profile_runs))
+                self._traj.f_add_config(Parameter, config_name, profile_runs,
+                                        comment='Every Nth run or the indices of the runs '
+                                                'that are profiled').f_lock()
+
+            if self._store_metrics:
+                config_name = 'environment.%s.store_metrics' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._store_metrics,
+                                        comment='Whether storage metrics are added '
+                                                'to the trajectory').f_lock()
+
             config_name = 'environment.%s.clean_up_runs' % self._name
             self._traj.f_add_config(Parameter, config_name, self._clean_up_runs,
                                     comment='Whether or not results should be removed after the '
@@ -1466,6 +1905,31 @@ class Environment(HasLogger):
                                             'be created. If yes, everything is '
                                             'handled by `dill`.').f_lock()
 
+            if self._run_cache is not None:
+                config_name = 'environment.%s.run_cache' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._run_cache.folder,
+                                        comment='Folder of the cache of '
+                                                'single runs.').f_lock()
+
+                config_name = 'environment.%s.code_version' % self._name
+                self._traj.f_add_config(Parameter, config_name, str(self._code_version),
+                                        comment='Code version used to identify '
+                                                'cached runs.').f_lock()
+
+            if self._deduplicate_runs:
+                config_name = 'environment.%s.deduplicate_mode' % self._name
+                self._traj.f_add_config(Parameter, config_name, self._deduplicate_mode,
+                                        comment='Whether duplicate runs are only executed '
+                                                'once and how their data is stored, '
+                                                'i.e. `link` or `copy`.').f_lock()
+
+                if self._deduplicate_exclude:
+                    config_name = 'environment.%s.deduplicate_exclude' % self._name
+                    self._traj.f_add_config(Parameter, config_name,
+                                            list(self._deduplicate_exclude),
+                                            comment='Parameters ignored when looking '
+                                                    'for duplicate runs.').f_lock()
+
             config_name = 'environment.%s.graceful_exit' % self._name
             self._traj.f_add_config(Parameter, config_name, self._graceful_exit,
                                     comment='Whether or not to allow graceful handling '
@@ -1600,6 +2064,19 @@ class Environment(HasLogger):
     def current_idx(self, idx):
         self._current_idx = idx
 
+    @property
+    def profile_stats(self):
+        """Merged :class:`pstats.Stats` of all runs profiled so far,
+        `None` if no run was profiled, see `profile_runs`."""
+        return self._profile_stats
+
+    @property
+    def storage_metrics(self):
+        """Merged :class:`~pypet.utils.storagemetrics.StorageMetrics` of the storage
+        service of all processes and the writers of the storage processes or threads,
+        see `store_metrics`."""
+        return self._storage_metrics
+
     @property
     def hexsha(self):
         """The SHA1 identifier of the environment.
@@ -1677,6 +2154,92 @@ class Environment(HasLogger):
         self._postproc_args = args
         self._postproc_kwargs = kwargs
 
+    def add_result_hook(self, hook, *args, **kwargs):
+        """ Adds a hook that is called for every single result as soon as it arrives.
+
+        The environment will call this function via
+        ``hook(traj, result, *args, **kwargs)`` in the main process, where `result` is the
+        tuple of run index and the value returned by your run function.
+        Contrary to post-processing, the hook is called while other runs are
+        still executed, which allows adaptive parameter searches without waiting for
+        stragglers.
+
+        The hook can return a dictionary to expand the trajectory via `f_expand`.
+        The new runs are started as soon as resources are free.
+        Alternatively, it can return a tuple ``(expand_dict, cancel)``, where `cancel` is an
+        iterable of run indices that should be cancelled,
+        see :func:`~pypet.environment.Environment.cancel_runs`.
+        Note that in case of a pool or SCOOP runs are dispatched early, so cancelling
+        hardly skips any runs and the trajectory cannot be expanded by the hook.
+
+        :param hook:
+
+            The hook function
+
+        :param args:
+
+            Additional arguments passed to the hook
+
+        :param kwargs:
+
+            Additional keyword arguments passed to the hook
+
+        """
+        self._result_hook = hook
+        self._result_hook_args = args
+        self._result_hook_kwargs = kwargs
+
+    def export_timeline(self, filename=None):
+        """Exports the phases of all finished single runs as a timeline.
+
+        The timeline follows the Chrome trace event format and can be viewed with
+        ``chrome://tracing`` or https://ui.perfetto.dev. Every worker process or thread
+        is shown as a separate track.
+
+        :param filename: JSON file to write the timeline to, if `None` nothing is written
+
+        :return: The timeline as a dictionary
+
+        """
+        run_information = self._traj.f_get_run_information(copy=False).values()
+        timeline = make_trace_events(sorted(run_information, key=lambda x: x['idx']))
+        if filename is not None:
+            racedirs(os.path.dirname(os.path.abspath(filename)))
+            with open(filename, 'w') as fh:
+                json.dump(timeline, fh)
+            self._logger.info('Exported timeline to `%s`.' % filename)
+        return timeline
+
+    def cancel_runs(self, indices):
+        """ Cancels single runs.
+
+        Runs that have not been started yet are skipped and marked as cancelled,
+        i.e. the `completed` entry of their run information is set to ``-1``
+        (:const:`pypet.pypetconstants.RUN_CANCELLED`). Cancelled runs are not
+        repeated if the trajectory is resumed.
+
+        Runs that are currently executed receive a cooperative stop signal. Your job function
+        can poll :func:`~pypet.trajectory.Trajectory.f_is_cancelled` and return early.
+        These runs are marked as cancelled as well. In case of multiprocessing
+        the signal is only forwarded to running processes if a result hook was added
+        (see :func:`~pypet.environment.Environment.add_result_hook`),
+        because this requires an additional manager process.
+
+        Usually called from a result hook, but can also be called from other threads
+        of the main process.
+
+        :param indices: Iterable of run indices
+
+        """
+        indices = set(int(idx) for idx in indices)
+        self._cancelled_runs.update(indices)
+        if self._cancel_signal is not None and self._cancel_signal is not self._cancelled_runs:
+            self._cancel_signal.update(dict.fromkeys(indices, True))
+        if self._resume_deltas is not None:
+            self._resume_deltas.append(dict(cancel=sorted(indices)))
+            self._resume_deltas.sync()
+        self._logger.info('Cancelled %d run(s).' % len(indices))
+
     def pipeline(self, pipeline):
         """ You can make *pypet* supervise your whole experiment by defining a pipeline.
 
@@ -1823,9 +2386,18 @@ class Environment(HasLogger):
         return self._execute_runs(pipeline)
 
     def _trigger_resume_snapshot(self):
-        """ Makes the trajectory continuable in case the user wants that"""
+        """ Makes the trajectory continuable in case the user wants that
+
+        The snapshot is the static part of the resume state and only written once.
+        Later changes are recorded as deltas, see
+        :func:`~pypet.environment.Environment._trigger_expansion_snapshot`.
+
+        """
         dump_dict = {}
         dump_filename = os.path.join(self._resume_path, 'environment.ecnt')
+        if os.path.isfile(dump_filename):
+            self._logger.debug('Resume snapshot already exists, I will not write it again.')
+            return
 
         # Store the trajectory before the first runs
         prev_full_copy = self._traj.v_full_copy
@@ -1840,6 +2412,9 @@ class Environment(HasLogger):
         dump_dict['postproc'] = self._postproc
         dump_dict['postproc_args'] = self._postproc_args
         dump_dict['postproc_kwargs'] = self._postproc_kwargs
+        dump_dict['result_hook'] = self._result_hook
+        dump_dict['result_hook_args'] = self._result_hook_args
+        dump_dict['result_hook_kwargs'] = self._result_hook_kwargs
         dump_dict['start_timestamp'] = self._start_timestamp
 
         dump_file = open(dump_filename, 'wb')
@@ -1850,6 +2425,37 @@ class Environment(HasLogger):
         self._traj.v_full_copy = prev_full_copy
         self._traj.v_storage_service = prev_storage_service
 
+    def _trigger_expansion_snapshot(self, expand_dict):
+        """Records the expansion of the trajectory by post-processing as a resume delta
+
+        :param expand_dict: Dictionary used to expand the trajectory
+
+        """
+        delta = dict(expand_dict=expand_dict,
+                     args=self._args,
+                     kwargs=self._kwargs,
+                     postproc_args=self._postproc_args,
+                     postproc_kwargs=self._postproc_kwargs)
+        self._resume_deltas.append(delta)
+        # Runs of the expanded trajectory must never be journaled before the expansion
+        self._resume_deltas.sync()
+
+    def _replay_resume_deltas(self):
+        """Applies all resume deltas, i.e. expansions and cancellations, to the trajectory
+        of the static snapshot"""
+        deltas = ResumeJournal(os.path.join(self._resume_path, 'deltas.jnl')).read_records()
+        for delta in deltas:
+            if 'cancel' in delta:
+                self._cancelled_runs.update(delta['cancel'])
+                continue
+            self._traj.f_expand(delta['expand_dict'])
+            self._args = delta['args']
+            self._kwargs = delta['kwargs']
+            self._postproc_args = delta['postproc_args']
+            self._postproc_kwargs = delta['postproc_kwargs']
+        if deltas:
+            self._logger.info('Replayed %d change(s) of the trajectory.' % len(deltas))
+
     def _prepare_sumatra(self):
         """ Prepares a sumatra record """
         reason = self._sumatra_reason
@@ -1974,9 +2580,15 @@ class Environment(HasLogger):
         self._postproc_args = resume_dict['postproc_args']
         # Postproc Kwargs
         self._postproc_kwargs = resume_dict['postproc_kwargs']
+        # Result hook, snapshots of older versions do not contain one
+        self._result_hook = resume_dict.get('result_hook', None)
+        self._result_hook_args = resume_dict.get('result_hook_args', ())
+        self._result_hook_kwargs = resume_dict.get('result_hook_kwargs', {})
 
         # Unpack the trajectory
         self._traj.v_full_copy = resume_dict['full_copy']
+        # Expansions happened after the snapshot was taken
+        self._replay_resume_deltas()
         # Load meta data
         self._traj.f_load(load_parameters=pypetconstants.LOAD_NOTHING,
                           load_derived_parameters=pypetconstants.LOAD_NOTHING,
@@ -1984,19 +2596,9 @@ class Environment(HasLogger):
                           load_other_data=pypetconstants.LOAD_NOTHING)
 
         # Now we have to reconstruct previous results
-        result_list = []
-        full_filename_list = []
-        for filename in os.listdir(self._resume_path):
-            _, ext = os.path.splitext(filename)
-
-            if ext != '.rcnt':
-                continue
-
-            full_filename = os.path.join(self._resume_path, filename)
-            cnt_file = open(full_filename, 'rb')
-            result_list.append(dill.load(cnt_file))
-            cnt_file.close()
-            full_filename_list.append(full_filename)
+        journal = ResumeJournal(os.path.join(self._resume_path, 'results.jnl'))
+        result_list = list(journal.read().values())
+        self._logger.info('Found %d finished runs in the resume journal.' % len(result_list))
 
         new_result_list = []
         for result_tuple in result_list:
@@ -2116,7 +2718,17 @@ class Environment(HasLogger):
                        'automatic_storing': self._automatic_storing,
                        'wrap_mode': self._wrap_mode,
                        'niceness': self._niceness,
-                       'graceful_exit': self._graceful_exit}
+                       'graceful_exit': self._graceful_exit,
+                       'cancelled': self._cancel_signal,
+                       'profile_runs': self._profile_runs}
+        if self._check_usage:
+            result_dict['measure_memory'] = True
+        if self._deduplicate_runs:
+            result_dict['duplicates'] = ()
+            result_dict['deduplicate_mode'] = self._deduplicate_mode
+        if self._run_cache is not None:
+            result_dict['run_cache'] = self._run_cache
+            result_dict['code_version'] = self._code_version
         result_dict.update(kwargs)
         if self._multiproc:
             if self._use_pool or self._use_scoop:
@@ -2138,22 +2750,122 @@ class Environment(HasLogger):
                         del result_dict['niceness']
             else:
                 result_dict['clean_up_runs'] = False
+        elif self._use_asyncio or self._use_threads:
+            # Data is stored by the storage thread without any further wrapping
+            result_dict['wrap_mode'] = pypetconstants.WRAP_MODE_NONE
         return result_dict
 
+    def _find_duplicates(self, start_run_idx):
+        """Groups all runs from `start_run_idx` on that are not completed by unique
+        parameter points.
+
+        The first run of every group is the representative that is executed,
+        all others are duplicates. Groups found before are kept, since their
+        representatives may still be running, and their duplicates are not
+        considered again.
+
+        """
+        excluded = set(self._traj.f_get(name).v_full_name
+                       for name in self._deduplicate_exclude)
+        explored_parameters = [param for param in self._traj._explored_parameters.values()
+                               if param.v_full_name not in excluded]
+        if not explored_parameters:
+            return
+        for _, run_indices in find_unique_points(explored_parameters):
+            pending = [idx for idx in run_indices
+                       if idx >= start_run_idx and idx not in self._duplicate_runs and
+                       idx not in self._duplicates and not self._traj._is_completed(idx)]
+            if len(pending) > 1:
+                self._duplicates[pending[0]] = pending[1:]
+                self._duplicate_runs.update(pending[1:])
+        if self._duplicate_runs:
+            self._logger.info('Found %d duplicate runs that will not be executed but '
+                              'receive the data of %d representative runs.' %
+                              (len(self._duplicate_runs), len(self._duplicates)))
+
+    def _fan_out_duplicates(self, result, run_information, results):
+        """Hands the result and run information of a representative run to its duplicates.
+
+        :return: The number of duplicates
+
+        """
+        duplicates = self._duplicates.pop(result[0], ())
+        for idx in duplicates:
+            duplicate_information = run_information.copy()
+            duplicate_information['idx'] = idx
+            duplicate_information['name'] = self._traj.f_idx_to_run(idx)
+            # The summary must be complete before the run information is journaled
+            self._traj.f_set_crun(idx)
+            duplicate_information['parameter_summary'] = \
+                self._traj._summarize_explored_parameters()
+            self._traj.f_restore_default()
+            self._traj._update_run_information(duplicate_information)
+            self._completed_duplicates.append(idx)
+            results.append((idx, result[1]))
+            if self._resumable:
+                # Duplicates have been stored as well and must not run again on resume
+                self._trigger_result_snapshot(((idx, result[1]), duplicate_information))
+        return len(duplicates)
+
+    def _sort_duplicate_results(self, results, start_result_length):
+        """Sorts the results after duplicates have been completed"""
+        if self._completed_duplicates:
+            self._completed_duplicates = []
+            result_sort(results, start_result_length)
+
     def _make_index_iterator(self, start_run_idx):
-        """Returns an iterator over the run indices that are not completed"""
-        total_runs = len(self._traj)
-        for n in range(start_run_idx, total_runs):
+        """Returns an iterator over the run indices that are not completed
+
+        Runs added by a result hook while iterating are considered as well.
+
+        """
+        deduplicated_length = 0
+        n = start_run_idx - 1
+        while n + 1 < len(self._traj):
+            n += 1
+            if self._deduplicate_runs and deduplicated_length < len(self._traj):
+                # Only runs that have not been started yet are grouped
+                self._find_duplicates(n)
+                deduplicated_length = len(self._traj)
             self._current_idx = n + 1
             if self._stop_iteration:
                 self._logger.debug('I am stopping new run iterations now!')
                 break
-            if not self._traj._is_completed(n):
+            if n in self._duplicate_runs:
+                self._logger.debug('Run `%d` is a duplicate, I am skipping it.' % n)
+            elif n in self._cancelled_runs:
+                self._logger.debug('Run `%d` was cancelled, I am skipping it.' % n)
+                self._mark_cancelled(n)
+            elif not self._traj._is_completed(n):
                 self._traj.f_set_crun(n)
                 yield n
             else:
                 self._logger.debug('Run `%d` has already been completed, I am skipping it.' % n)
 
+    def _mark_cancelled(self, idx):
+        """Marks a run that has not been started as cancelled"""
+        run_information = self._traj.f_get_run_information(idx, copy=False)
+        if not run_information['completed']:
+            run_information['completed'] = pypetconstants.RUN_CANCELLED
+            self._traj._updated_run_information.add(idx)
+
+    def _start_cancel_signal(self):
+        """Creates the container that signals cancellation to running runs"""
+        if not self._multiproc:
+            # All runs share the memory of the main process
+            self._cancel_signal = self._cancelled_runs
+        elif self._result_hook is not None and not self._use_scoop:
+            self._cancel_manager = multip.Manager()
+            self._cancel_signal = self._cancel_manager.dict(
+                dict.fromkeys(self._cancelled_runs, True))
+
+    def _stop_cancel_signal(self):
+        """Removes the cancellation container and shuts down the manager if there is one"""
+        self._cancel_signal = None
+        if self._cancel_manager is not None:
+            self._cancel_manager.shutdown()
+            self._cancel_manager = None
+
     def _make_iterator(self, start_run_idx, copy_data=False, **kwargs):
         """ Returns an iterator over all runs and yields the keyword arguments """
         if (not self._freeze_input) or (not self._multiproc):
@@ -2176,6 +2888,7 @@ class Environment(HasLogger):
                     if self._freeze_input:
                         # Frozen pool needs current run index
                         kwargs['idx'] = idx
+                    kwargs['dispatch_timestamp'] = time.time()
                     if copy_data:
                         copied_kwargs = kwargs.copy()
                         if not self._freeze_input:
@@ -2189,6 +2902,9 @@ class Environment(HasLogger):
                     if self._freeze_input:
                         # Frozen pool needs current run index
                         kwargs['idx'] = idx
+                    if self._deduplicate_runs:
+                        kwargs['duplicates'] = self._duplicates.get(idx, ())
+                    kwargs['dispatch_timestamp'] = time.time()
                     if copy_data:
                         copied_kwargs = kwargs.copy()
                         if not self._freeze_input:
@@ -2224,11 +2940,13 @@ class Environment(HasLogger):
         postproc_res = self._postproc(self._traj, results,
                                       *self._postproc_args, **self._postproc_kwargs)
 
+        expand_dict = None
         if postproc_res is None:
             pass
         elif isinstance(postproc_res, dict):
-            if postproc_res:
-                self._traj.f_expand(postproc_res)
+            expand_dict = postproc_res
+            if expand_dict:
+                self._traj.f_expand(expand_dict)
         elif isinstance(postproc_res, tuple):
             expand_dict = postproc_res[0]
             if len(postproc_res) > 1:
@@ -2250,13 +2968,11 @@ class Environment(HasLogger):
             start_run_idx = old_traj_length
             repeat = True
 
-            if self._resumable:
-                self._logger.warning('Continuing a trajectory AND expanding it during runtime is '
-                                     'NOT supported properly, there is no guarantee that this '
-                                     'works!')
-
             self._traj.f_store(only_init=True)
 
+            if self._resumable:
+                self._trigger_expansion_snapshot(expand_dict)
+
             new_traj_length = len(self._traj)
             new_runs = new_traj_length - old_traj_length
 
@@ -2274,21 +2990,51 @@ class Environment(HasLogger):
                 # Versions but we want to support older as well
         return self._last_cpu_usage
 
+    def _explored_values(self, idx):
+        """Returns the values of all explored parameters of run `idx`"""
+        return [param.f_get_range(copy=False)[idx]
+                for param in self._traj._explored_parameters.values()]
+
+    def _predict_memory(self, idx):
+        """Predicts the memory needed by run `idx` as percentage of the total memory"""
+        prediction = self._memory_model.predict(self._explored_values(idx))
+        return prediction / self._total_memory * 100.0
+
+    def _learn_memory(self, run_information):
+        """Updates the memory model with the peak memory of a completed run"""
+        peak_memory = run_information.get('peak_memory', 0.0)
+        if peak_memory > 0.0:
+            self._memory_model.add(self._explored_values(run_information['idx']),
+                                   peak_memory)
+
     def _estimate_memory_utilization(self, process_dict):
-        """Estimates memory utilization to come if process was started"""
-        n_processes = len(process_dict)
+        """Estimates memory utilization to come if process was started
+
+        Running processes are assumed to grow by their predicted footprint.
+        Like the prediction, their growth is measured relative to their memory at the start.
+        The memory of each process is polled at most every 500ms.
+
+        """
+        now = time.time()
+        if now - self._last_memory_check >= 0.5:
+            self._process_memory = {}
+            for pid in process_dict:
+                try:
+                    self._process_memory[pid] = (psutil.Process(pid).memory_percent() -
+                                                 self._process_baseline.get(pid, 0.0))
+                except (psutil.NoSuchProcess, ZeroDivisionError):
+                    pass
+            self._last_memory_check = now
         total_utilization = psutil.virtual_memory().percent
-        sum = 0.0
-        for proc in process_dict.values():
-            try:
-                sum += psutil.Process(proc.pid).memory_percent()
-            except (psutil.NoSuchProcess, ZeroDivisionError):
-                pass
-        curr_all_processes = sum
-        missing_utilization = max(0.0, n_processes * self._est_per_process - curr_all_processes)
+        missing_utilization = 0.0
+        for pid in process_dict:
+            missing_utilization += max(0.0, self._predicted_memory.get(pid, 0.0) -
+                                       self._process_memory.get(pid, 0.0))
+        # `_current_idx` is the next run to be started
+        next_idx = min(self._current_idx, len(self._traj) - 1)
         estimated_utilization = total_utilization
         estimated_utilization += missing_utilization
-        estimated_utilization += self._est_per_process
+        estimated_utilization += self._predict_memory(next_idx)
         return estimated_utilization
 
     def _execute_runs(self, pipeline):
@@ -2313,6 +3059,10 @@ class Environment(HasLogger):
             raise ValueError('You cannot use `run_map` or `pipeline_map` in combination '
                              'with continuing option.')
 
+        if self._map_arguments and self._deduplicate_runs:
+            raise ValueError('You cannot use `run_map` or `pipeline_map` in combination '
+                             'with deduplication of runs.')
+
         if self._sumatra_project is not None:
             self._prepare_sumatra()
 
@@ -2329,6 +3079,8 @@ class Environment(HasLogger):
             try:
                 self._inner_run_loop(results)
             finally:
+                self._close_resume_journal()
+                self._stop_cancel_signal()
                 self._traj._run_by_environment = False
                 self._stop_iteration = False
                 if self._graceful_exit:
@@ -2387,6 +3139,8 @@ class Environment(HasLogger):
         if self._automatic_storing:
             self._traj.f_store_items(conf_list, store_data=pypetconstants.OVERWRITE_DATA)
 
+        self._collect_storage_metrics()
+
         if hasattr(self._traj.v_storage_service, 'finalize'):
             # Finalize the storage service if this is supported
             self._traj.v_storage_service.finalize()
@@ -2408,6 +3162,24 @@ class Environment(HasLogger):
 
         return results
 
+    def _collect_storage_metrics(self):
+        """Merges the remaining metrics of the storage service and adds all metrics
+        to the trajectory if desired"""
+        if hasattr(self._traj.v_storage_service, 'pop_metrics'):
+            self._storage_metrics.merge(self._traj.v_storage_service.pop_metrics())
+
+        if self._store_metrics and self._automatic_storing:
+            result_name = 'environment.%s.storage_metrics' % self.name
+            if self._traj.f_contains('results.' + result_name, shortcuts=False):
+                self._traj.f_remove_item('results.' + result_name)
+            result = self._traj.f_add_result(result_name,
+                                             latencies=self._storage_metrics.latency_frame(),
+                                             counters=self._storage_metrics.counters.copy(),
+                                             comment='Metrics of the storage service')
+            if len(self._storage_metrics.locks) > 0:
+                result.f_set(locks=self._storage_metrics.locks.summary())
+            self._traj.f_store_item(result, overwrite=True)
+
     def _add_wildcard_config(self):
         """Adds config data about the wildcard functions"""
         for idx, pair in enumerate(self._traj._wildcard_functions.items()):
@@ -2447,9 +3219,17 @@ class Environment(HasLogger):
 
         self._storage_service = self._traj.v_storage_service
         self._multiproc_wrapper = None
+        self._duplicates = {}
+        self._duplicate_runs = set()
 
         if self._resumable:
             self._trigger_resume_snapshot()
+            self._resume_journal = ResumeJournal(os.path.join(self._resume_path,
+                                                              'results.jnl'))
+            self._resume_journal.open()
+            self._resume_deltas = ResumeJournal(os.path.join(self._resume_path,
+                                                             'deltas.jnl'))
+        self._start_cancel_signal()
 
         self._logger.info(
             '\n************************************************************\n'
@@ -2459,8 +3239,13 @@ class Environment(HasLogger):
 
         while True:
 
+            start_result_length = len(results)
             if self._multiproc:
                 expanded_by_postproc = self._execute_multiprocessing(start_run_idx, results)
+            elif self._use_asyncio:
+                self._execute_asyncio(start_run_idx, results)
+            elif self._use_threads:
+                self._execute_threads(start_run_idx, results)
             else:
                 # Create a generator to generate the tasks
                 iterator = self._make_iterator(start_run_idx)
@@ -2474,6 +3259,9 @@ class Environment(HasLogger):
                     n = self._check_result_and_store_references(result, results,
                                                                         n, total_runs)
 
+            if self._deduplicate_runs:
+                self._sort_duplicate_results(results, start_result_length)
+
             repeat = False
             if self._postproc is not None:
                 self._logger.info('Performing POSTPROCESSING')
@@ -2496,9 +3284,11 @@ class Environment(HasLogger):
                     '\n************************************************************\n' %
                     self._traj.v_name)
 
-        if self._resumable and self._delete_resume:
-            # We remove all resume files if the simulation was successfully completed
-            shutil.rmtree(self._resume_path)
+        if self._resumable:
+            self._close_resume_journal()
+            if self._delete_resume:
+                # We remove all resume files if the simulation was successfully completed
+                shutil.rmtree(self._resume_path)
 
         if expanded_by_postproc:
             config_name = 'environment.%s.postproc_expand' % self.name
@@ -2521,39 +3311,265 @@ class Environment(HasLogger):
             self._stop_iteration = True
             result = result[1]  # If SIGINT result is a nested tuple
         if result is not None:
-            if self._wrap_mode == pypetconstants.WRAP_MODE_LOCAL:
+            if self._multiproc and self._wrap_mode == pypetconstants.WRAP_MODE_LOCAL:
                 self._multiproc_wrapper.store_references(result[2])
+            if 'profile' in result[1]:
+                self._profile_stats = merge_stats(self._profile_stats,
+                                                  result[1].pop('profile'))
+            storage_metrics = result[1].pop('storage_metrics', None)
+            if self._multiproc_wrapper is not None:
+                self._multiproc_wrapper.add_storage_metrics(storage_metrics)
+            else:
+                self._storage_metrics.merge(storage_metrics)
             self._traj._update_run_information(result[1])
+            if self._check_usage:
+                self._learn_memory(result[1])
+            start_result_length = len(results)
             results.append(result[0])
             if self._resumable:
                 # [0:2] to not store references
                 self._trigger_result_snapshot(result[0:2])
-        self._show_progress(n, total_runs)
+            if self._duplicates:
+                n += self._fan_out_duplicates(result[0], result[1], results)
+            if self._result_hook is not None:
+                for new_result in results[start_result_length:]:
+                    self._execute_result_hook(new_result)
+        self._show_progress(n, max(total_runs, len(self._traj)))
         n += 1
         return n
 
+    def _execute_result_hook(self, result):
+        """Passes a single result to the result hook and handles its return value"""
+        hook_res = self._result_hook(self._traj, result, *self._result_hook_args,
+                                     **self._result_hook_kwargs)
+        expand_dict = None
+        cancel = ()
+        if hook_res is None:
+            pass
+        elif isinstance(hook_res, dict):
+            expand_dict = hook_res
+        elif isinstance(hook_res, tuple):
+            expand_dict = hook_res[0]
+            if len(hook_res) > 1:
+                cancel = hook_res[1]
+        else:
+            self._logger.error('Your result hook result `%s` was not understood.' %
+                               str(hook_res))
+
+        if cancel:
+            self.cancel_runs(cancel)
+        if expand_dict:
+            self._expand_during_runs(expand_dict)
+
+    def _expand_during_runs(self, expand_dict):
+        """Expands the trajectory while single runs are still executed"""
+        if self._use_pool or self._use_scoop:
+            raise RuntimeError('You cannot expand the trajectory during the single runs '
+                               'if you use a pool or SCOOP. Please use post-processing.')
+        old_traj_length = len(self._traj)
+        self._traj.f_expand(expand_dict)
+
+        storage_service = self._traj.v_storage_service
+        full_copy = self._traj.v_full_copy
+        if self._wrap_mode == pypetconstants.WRAP_MODE_LOCAL:
+            self._traj.v_storage_service = self._storage_service
+        # The trajectory may be pickled and sent to a storage process or thread
+        self._traj.v_full_copy = True
+        try:
+            self._traj.f_store(only_init=True)
+        finally:
+            self._traj.v_full_copy = full_copy
+            self._traj.v_storage_service = storage_service
+
+        if self._resumable:
+            self._trigger_expansion_snapshot(expand_dict)
+        self._logger.info('Result hook expanded the trajectory and added %d new runs.' %
+                          (len(self._traj) - old_traj_length))
+
+    def _has_new_runs(self):
+        """Whether a result hook expanded the trajectory after all runs were started"""
+        return (self._result_hook is not None and not self._stop_iteration and
+                self._current_idx < len(self._traj))
+
+    def _close_resume_journal(self):
+        """Syncs and closes the resume journals if there are any"""
+        if self._resume_journal is not None:
+            self._resume_journal.close()
+            self._resume_journal = None
+        if self._resume_deltas is not None:
+            self._resume_deltas.close()
+            self._resume_deltas = None
+
     def _trigger_result_snapshot(self, result):
-        """ Triggers a snapshot of the results for continuing
+        """ Appends the result to the resume journal
 
         :param result: Currently computed result
 
         """
-        timestamp = result[1]['finish_timestamp']
-        timestamp_str = repr(timestamp).replace('.', '_')
-        filename = 'result_%s' % timestamp_str
-        extension = '.ncnt'
-        dump_filename = os.path.join(self._resume_path, filename + extension)
+        self._resume_journal.append(result)
+
+    def _start_storage_thread(self):
+        """Starts a thread that stores all data sent by single runs via a local queue"""
+        storage_queue = PicklingQueue()
+        writer = QueueStorageServiceWriter(self._storage_service, storage_queue,
+                                           gc_interval=self._gc_interval)
+        self._storage_writer = writer
+        self._storage_thread = threading.Thread(target=writer.run,
+                                                name='pypet-storage-writer')
+        self._storage_thread.daemon = True
+        self._storage_thread.start()
+        self._traj.v_storage_service = QueueStorageServiceSender(storage_queue)
+        self._logger.info('Started storage thread.')
+
+    def _stop_storage_thread(self):
+        """Waits until the storage thread has stored all data and restores the service.
+
+        Raises the exception that stopped the storage thread, if any.
 
-        dump_file = open(dump_filename, 'wb')
-        dill.dump(result, dump_file, protocol=2)
-        dump_file.flush()
-        dump_file.close()
+        """
+        writer = self._storage_writer
+        self._traj.v_storage_service.send_done()
+        self._storage_thread.join()
+        self._storage_thread = None
+        self._storage_metrics.merge(writer.metrics)
+        self._storage_writer = None
+        self._traj.v_storage_service = self._storage_service
+        self._logger.info('Storage thread has finished.')
+        if writer.error is not None:
+            raise writer.error
+
+    def _check_storage_thread(self):
+        """Raises the exception that stopped the storage thread in the main thread.
+
+        Otherwise single runs would keep sending data nobody stores.
 
-        # We rename the file to be certain that the trajectory did not crash during taking
-        # the snapshot!
-        extension = '.rcnt'
-        rename_filename = os.path.join(self._resume_path, filename + extension)
-        shutil.move(dump_filename, rename_filename)
+        """
+        if self._storage_writer is not None and self._storage_writer.error is not None:
+            self._logger.error('The storage thread failed, I will stop the single runs.')
+            raise self._storage_writer.error
+
+    def _execute_asyncio(self, start_run_idx, results):
+        """Executes runs concurrently as coroutines on an asyncio event loop"""
+        n = start_run_idx
+        total_runs = len(self._traj)
+        start_result_length = len(results)
+
+        pending = {}  # Maps futures to the keyword arguments of their runs
+        loop = asyncio.new_event_loop()
+        self._start_storage_thread()
+        try:
+            iterator = self._make_iterator(start_run_idx, copy_data=True)
+            keep_running = True
+
+            self._logger.info('Starting asyncio event loop with at most %d concurrent '
+                              'runs.' % self._concurrency_limit)
+            # Signal start of progress calculation
+            self._show_progress(n - 1, total_runs)
+            while pending or keep_running:
+                while keep_running and len(pending) < self._concurrency_limit:
+                    self._check_storage_thread()
+                    if self._graceful_exit and sigint_handling.hit:
+                        self._stop_iteration = True
+                    try:
+                        task = next(iterator)
+                    except StopIteration:
+                        keep_running = False
+                        break
+                    cache_key, cached_entry = _start_single_run(task)
+                    if cached_entry is None:
+                        result = task['runfunc'](task['traj'], *task['runargs'],
+                                                 **task['runkwargs'])
+                        if asyncio.iscoroutine(result):
+                            pending[loop.create_task(result)] = (task, cache_key)
+                            continue
+                    else:
+                        result = task['run_cache'].restore_run(task['traj'], cached_entry)
+                    result = _finish_single_run(task, result, cache_key, cached_entry)
+                    n = self._check_result_and_store_references(result, results,
+                                                                n, total_runs)
+
+                if pending:
+                    done, _ = loop.run_until_complete(
+                        asyncio.wait(list(pending.keys()),
+                                     return_when=asyncio.FIRST_COMPLETED))
+                    for future in done:
+                        task, cache_key = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception:
+                            self._logger.exception('ERROR occurred during a single run!')
+                            raise
+                        result = _finish_single_run(task, result, cache_key)
+                        n = self._check_result_and_store_references(result, results,
+                                                                    n, total_runs)
+
+                if not keep_running and self._has_new_runs():
+                    keep_running = True
+                    iterator = self._make_iterator(self._current_idx, copy_data=True)
+        finally:
+            if pending:
+                # Cancel all remaining runs in case of an error
+                for future in pending:
+                    future.cancel()
+                loop.run_until_complete(asyncio.wait(list(pending.keys())))
+            loop.close()
+            self._stop_storage_thread()
+
+        result_sort(results, start_result_length)
+
+    def _execute_threads(self, start_run_idx, results):
+        """Executes runs concurrently by a pool of threads"""
+        n = start_run_idx
+        total_runs = len(self._traj)
+        start_result_length = len(results)
+
+        pending = set()
+        executor = ThreadPoolExecutor(max_workers=self._ncores)
+        self._start_storage_thread()
+        try:
+            iterator = self._make_iterator(start_run_idx, copy_data=True)
+            keep_running = True
+
+            self._logger.info('Starting pool with %d threads' % self._ncores)
+            # Signal start of progress calculation
+            self._show_progress(n - 1, total_runs)
+            while pending or keep_running:
+                while keep_running and len(pending) < self._ncores:
+                    self._check_storage_thread()
+                    if self._graceful_exit and sigint_handling.hit:
+                        self._stop_iteration = True
+                    try:
+                        task = next(iterator)
+                    except StopIteration:
+                        keep_running = False
+                        break
+                    # The set is modified by other threads while a run is pickled for storage,
+                    # the main trajectory is updated via the returned run information anyway
+                    task['traj']._updated_run_information = set()
+                    pending.add(executor.submit(_single_run, task))
+
+                if pending:
+                    done, pending = futures_wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            result = future.result()
+                        except Exception:
+                            self._logger.exception('ERROR occurred during a single run!')
+                            raise
+                        n = self._check_result_and_store_references(result, results,
+                                                                    n, total_runs)
+
+                if not keep_running and self._has_new_runs():
+                    keep_running = True
+                    iterator = self._make_iterator(self._current_idx, copy_data=True)
+        finally:
+            for future in pending:
+                # Cancel all remaining runs in case of an error
+                future.cancel()
+            executor.shutdown(wait=True)
+            self._stop_storage_thread()
+
+        result_sort(results, start_result_length)
 
     def _execute_multiprocessing(self, start_run_idx, results):
         """Performs multiprocessing and signals expansion by postproc"""
@@ -2576,6 +3592,7 @@ class Environment(HasLogger):
                                lock=None,
                                queue=None,
                                queue_maxsize=self._queue_maxsize,
+                               stream_batch_size=self._stream_batch_size,
                                port=self._url,
                                timeout=self._timeout,
                                gc_interval=self._gc_interval,
@@ -2621,9 +3638,15 @@ class Environment(HasLogger):
 
                     # Signal start of progress calculation
                     self._show_progress(n - 1, total_runs)
-                    for result in pool_results:
-                        n = self._check_result_and_store_references(result, results,
-                                                                    n, total_runs)
+                    try:
+                        for result in pool_results:
+                            n = self._check_result_and_store_references(result, results,
+                                                                        n, total_runs)
+                    except Exception:
+                        # Otherwise the workers keep on storing data in case of an error
+                        mpool.terminate()
+                        mpool.join()
+                        raise
 
                     # Everything is done
                     mpool.close()
@@ -2729,6 +3752,8 @@ class Environment(HasLogger):
                         if not proc.is_alive():
                             proc.join()
                             del process_dict[pid]
+                            self._predicted_memory.pop(pid, None)
+                            self._process_baseline.pop(pid, None)
                             del proc
 
                     # Check if caps are reached.
@@ -2776,6 +3801,14 @@ class Environment(HasLogger):
                                                   args=(task,))
                             proc.start()
                             process_dict[proc.pid] = proc
+                            if self._check_usage:
+                                self._predicted_memory[proc.pid] = \
+                                    self._predict_memory(task['traj'].v_idx)
+                                try:
+                                    self._process_baseline[proc.pid] = \
+                                        psutil.Process(proc.pid).memory_percent()
+                                except (psutil.NoSuchProcess, ZeroDivisionError):
+                                    pass
 
                             signal_cap = max_signals > 0  # Only signal max_signals times
                         except StopIteration:
@@ -2815,6 +3848,11 @@ class Environment(HasLogger):
                     # Get all results from the result queue
                     n = self._get_results_from_queue(result_queue, results, n, total_runs)
 
+                    if not keep_running and self._has_new_runs():
+                        keep_running = True
+                        iterator = self._make_iterator(self._current_idx,
+                                                       result_queue=result_queue)
+
                 # Finally get all results from the result queue once more and finalize the queue
                 self._get_results_from_queue(result_queue, results, n, total_runs)
                 result_queue.close()
@@ -2826,6 +3864,7 @@ class Environment(HasLogger):
             # Finalize the wrapper
             if self._multiproc_wrapper is not None:
                 self._multiproc_wrapper.finalize()
+                self._storage_metrics.merge(self._multiproc_wrapper.storage_metrics)
                 self._multiproc_wrapper = None
 
         return expanded_by_postproc
@@ -2928,6 +3967,11 @@ class MultiprocContext(HasLogger):
     :param queue_maxsize:
 
         Maximum size of queue if created new. 0 means infinite.
+        In case of ``'NETSTREAM'`` wrapping the credits granted to every process.
+
+    :param stream_batch_size:
+
+        Number of storage requests sent together in case of ``'NETSTREAM'`` wrapping.
 
     :param port:
 
@@ -2983,6 +4027,7 @@ class MultiprocContext(HasLogger):
                  lock=None,
                  queue=None,
                  queue_maxsize=0,
+                 stream_batch_size=1,
                  port=None,
                  timeout=None,
                  gc_interval=None,
@@ -3003,10 +4048,14 @@ class MultiprocContext(HasLogger):
         self._wrap_mode = wrap_mode
         self._queue = queue
         self._queue_maxsize = queue_maxsize
+        self._stream_batch_size = stream_batch_size
         self._pipe = queue
         self._max_buffer_size = queue_maxsize
         self._lock = lock
         self._lock_process = None
+        self._pipe_wrapper = None
+        self._metrics_queue = None
+        self._storage_metrics = StorageMetrics()
         self._port = port
         self._timeout = timeout
         self._use_manager = use_manager
@@ -3017,7 +4066,8 @@ class MultiprocContext(HasLogger):
         if (self._wrap_mode == pypetconstants.WRAP_MODE_QUEUE or
                         self._wrap_mode == pypetconstants.WRAP_MODE_PIPE or
                             self._wrap_mode == pypetconstants.WRAP_MODE_NETLOCK or
-                                self._wrap_mode == pypetconstants.WRAP_MODE_NETQUEUE):
+                                self._wrap_mode == pypetconstants.WRAP_MODE_NETQUEUE or
+                                    self._wrap_mode == pypetconstants.WRAP_MODE_NETSTREAM):
             self._logging_manager = LoggingManager(log_config=log_config,
                                                    log_stdout=log_stdout)
             self._logging_manager.extract_replacements(self._traj)
@@ -3054,6 +4104,18 @@ class MultiprocContext(HasLogger):
     def pipe_wrapper(self):
         return self._pipe_wrapper
 
+    @property
+    def storage_metrics(self):
+        """:class:`~pypet.utils.storagemetrics.StorageMetrics` of the storage processes
+        and the wrappers including the lock statistics, complete after finalizing."""
+        return self._storage_metrics
+
+    def add_storage_metrics(self, metrics):
+        """Adds metrics collected in other processes, e.g. by the
+        ``pop_metrics()`` function of the storage service of a trajectory copy,
+        to the metrics reported when finalizing."""
+        self._storage_metrics.merge(metrics)
+
     def __enter__(self):
         self.start()
         return self
@@ -3100,14 +4162,19 @@ class MultiprocContext(HasLogger):
             self._prepare_netlock()
         elif self._wrap_mode == pypetconstants.WRAP_MODE_NETQUEUE:
             self._prepare_netqueue()
+        elif self._wrap_mode == pypetconstants.WRAP_MODE_NETSTREAM:
+            self._prepare_netstream()
         else:
             raise RuntimeError('The mutliprocessing mode %s, your choice is '
-                                           'not supported, use %s`, `%s`, %s, `%s`, or `%s`.'
+                                           'not supported, use %s`, `%s`, %s, `%s`, `%s`, '
+                                           '`%s`, or `%s`.'
                                            % (self._wrap_mode, pypetconstants.WRAP_MODE_QUEUE,
                                               pypetconstants.WRAP_MODE_LOCK,
                                               pypetconstants.WRAP_MODE_PIPE,
                                               pypetconstants.WRAP_MODE_LOCAL,
-                                              pypetconstants.WRAP_MODE_NETLOCK))
+                                              pypetconstants.WRAP_MODE_NETLOCK,
+                                              pypetconstants.WRAP_MODE_NETQUEUE,
+                                              pypetconstants.WRAP_MODE_NETSTREAM))
 
     def _prepare_local(self):
         reference_wrapper = ReferenceWrapper()
@@ -3135,8 +4202,10 @@ class MultiprocContext(HasLogger):
             lock_server = TimeOutLockerServer(url, self._timeout)
             self._logger.info('Using timeout aware lock server.')
 
+        self._metrics_queue = multip.Queue()
         self._lock_process = multip.Process(name='LockServer', target=_wrap_handling,
                                             args=(dict(handler=lock_server,
+                                                       metrics_queue=self._metrics_queue,
                                                        logging_manager=self._logging_manager,
                                                        graceful_exit=self._graceful_exit),))
         # self._lock_process = threading.Thread(name='LockServer', target=_wrap_handling,
@@ -3183,8 +4252,10 @@ class MultiprocContext(HasLogger):
                                                 max_buffer_size=self._max_buffer_size)
 
         # Start the queue process
+        self._metrics_queue = multip.Queue()
         self._pipe_process = multip.Process(name='PipeProcess', target=_wrap_handling,
                                              args=(dict(handler=pipe_handler,
+                                                        metrics_queue=self._metrics_queue,
                                                         logging_manager=self._logging_manager,
                                                         graceful_exit=self._graceful_exit),))
         self._pipe_process.start()
@@ -3215,8 +4286,10 @@ class MultiprocContext(HasLogger):
                                                   self._gc_interval)
 
         # Start the queue process
+        self._metrics_queue = multip.Queue()
         self._queue_process = multip.Process(name='QueueProcess', target=_wrap_handling,
                                              args=(dict(handler=queue_handler,
+                                                        metrics_queue=self._metrics_queue,
                                                         logging_manager=self._logging_manager,
                                                         graceful_exit=self._graceful_exit),))
         self._queue_process.start()
@@ -3254,8 +4327,10 @@ class MultiprocContext(HasLogger):
                                                self._gc_interval)
 
         # Start the queue process
+        self._metrics_queue = multip.Queue()
         self._queue_process = multip.Process(name='QueuingServerProcess', target=_wrap_handling,
                                              args=(dict(handler=queuing_server_handler,
+                                                        metrics_queue=self._metrics_queue,
                                                         logging_manager=self._logging_manager,
                                                         graceful_exit=self._graceful_exit),))
         self._queue_process.start()
@@ -3269,6 +4344,43 @@ class MultiprocContext(HasLogger):
         self._queue_wrapper = QueueStorageServiceSender(self._queue)
         self._traj.v_storage_service = self._queue_wrapper
 
+    def _prepare_netstream(self):
+        """ Replaces the trajectory's service with a queue sender that streams data to
+        a queuing server and starts the server process.
+
+        """
+        self._logger.info('Starting Streaming Network Queue!')
+
+        if not isinstance(self._port, str):
+            url = port_to_tcp(self._port)
+            self._logger.info('Determined Server URL: `%s`' % url)
+        else:
+            url = self._port
+
+        if self._queue is None:
+            if hasattr(os, 'fork'):
+                self._queue = ForkAwareStreamingQueuingClient(url, self._stream_batch_size)
+            else:
+                self._queue = StreamingQueuingClient(url, self._stream_batch_size)
+
+        queuing_server_handler = StreamingQueuingServer(url,
+                                                        self._storage_service,
+                                                        self._queue_maxsize,
+                                                        self._gc_interval)
+
+        self._metrics_queue = multip.Queue()
+        self._queue_process = multip.Process(name='StreamingServerProcess',
+                                             target=_wrap_handling,
+                                             args=(dict(handler=queuing_server_handler,
+                                                        metrics_queue=self._metrics_queue,
+                                                        logging_manager=self._logging_manager,
+                                                        graceful_exit=self._graceful_exit),))
+        self._queue_process.start()
+        self._queue.start()
+
+        self._queue_wrapper = QueueStorageServiceSender(self._queue)
+        self._traj.v_storage_service = self._queue_wrapper
+
     def finalize(self):
         """ Restores the original storage service.
 
@@ -3276,7 +4388,15 @@ class MultiprocContext(HasLogger):
 
         Automatically called when used as context manager.
 
+        Reports the lock contention if a lock was used.
+
         """
+        active = (self._lock_wrapper is not None or self._pipe_wrapper is not None or
+                  self._queue_process is not None)
+        for wrapper in (self._lock_wrapper, self._pipe_wrapper):
+            if wrapper is not None:
+                self._storage_metrics.merge(wrapper.pop_metrics())
+
         if (self._wrap_mode == pypetconstants.WRAP_MODE_QUEUE and
                     self._queue_process is not None):
             self._logger.info('The Storage Queue will no longer accept new data. '
@@ -3312,12 +4432,17 @@ class MultiprocContext(HasLogger):
             self._lock.send_done()
             self._lock.finalize()
             self._lock_process.join()
-        elif (self._wrap_mode == pypetconstants.WRAP_MODE_NETQUEUE and
+        elif (self._wrap_mode in (pypetconstants.WRAP_MODE_NETQUEUE,
+                                  pypetconstants.WRAP_MODE_NETSTREAM) and
                 self._queue_process is not None):
             self._queue.send_done()
             self._queue.finalize()
             self._queue_process.join()
 
+        self._receive_storage_metrics()
+        if active and len(self._storage_metrics.locks) > 0:
+            self._logger.info('Lock contention: %s' % self._storage_metrics.locks.report())
+
         if self._manager is not None:
             self._manager.shutdown()
 
@@ -3336,5 +4461,16 @@ class MultiprocContext(HasLogger):
 
         self._traj._storage_service = self._storage_service
 
+    def _receive_storage_metrics(self):
+        """Receives the storage metrics sent by a finished storage or lock server process"""
+        if self._metrics_queue is None:
+            return
+        try:
+            self._storage_metrics.merge(self._metrics_queue.get(timeout=1.0))
+        except queue.Empty:
+            self._logger.warning('Did not receive storage metrics from the storage process.')
+        self._metrics_queue.close()
+        self._metrics_queue = None
+
     def __del__(self):
         self.finalize()
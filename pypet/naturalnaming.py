@@ -47,11 +47,13 @@ Contains the following classes:
 
 __author__ = 'Robert Meyer'
 
+import sys
 import inspect
 import warnings
 import keyword
 import itertools as itools
 import re
+import weakref
 from collections import deque
 
 from pypet.utils.decorators import deprecated, kwargs_api_change
@@ -92,11 +94,13 @@ SUBTREE_MAPPING = {'config': (CONFIG_GROUP, CONFIG),
                    'results': (RESULT_GROUP, RESULT)}
 
 # For fast searching of nodes in the tree:
-# If there are more candidate solutions found by the fast search
-# (that need to be checked sequentially) than this number
-# a slow search with a full tree traversal is initiated.
+# If there are more candidate solutions than this number,
+# `_get_candidate_dict` raises a TooManyGroupsError if asked to respect this bound.
 FAST_UPPER_BOUND = 3
 
+# Maximum number of resolved names that are cached before the cache is emptied
+LOOKUP_CACHE_SIZE = 10000
+
 SHORTCUT_SET = set(['dpar', 'par', 'conf', 'res'])
 
 CHECK_REGEXP = re.compile(r'^[A-Za-z0-9_-]+$')
@@ -226,7 +230,8 @@ class NNTreeNode(WithAnnotations):
     @v_comment.setter
     def v_comment(self, comment):
         """Changes the comment"""
-        comment = str(comment)
+        # Comments are often the same for many nodes, e.g. for results of all runs
+        comment = sys.intern(str(comment))
         self._comment = comment
 
     @property
@@ -295,7 +300,8 @@ class NNTreeNode(WithAnnotations):
         """Renames the tree node"""
         self._full_name = full_name
         if full_name:
-            self._name = full_name.rsplit('.', 1)[-1]
+            # Short names repeat in every run, so all nodes share a single string
+            self._name = sys.intern(full_name.rsplit('.', 1)[-1])
 
     def _set_details(self, depth, branch, run_branch):
         """Sets some details for internal handling."""
@@ -490,11 +496,22 @@ class NaturalNamingInterface(HasLogger):
         # (e.g. trajectory or run_00000000) as keys.
         # Values are dictionaries containing names (not full names) as keys and dictionaries
         # of parameter and result instances as values and their full names as keys (as above).
+        # If a name occurs only once within a run, the instance is stored directly
+        # instead of a dictionary with a single item.
         # This dictionary is used for fast search in case a trajectory is told to behave like
         # a particular run (by setting the v_crun property).
         self._nodes_and_leaves_runs_sorted = {}
         self._links_count =  {} # Dictionary of how often a link exists
 
+        # Cache of resolved names, keys are tuples of the full name of the start node,
+        # the name to resolve, the current run index, and the search settings.
+        # Values are weak references to the found nodes, so the cache never keeps
+        # nodes alive. The cache is emptied if the tree generation changes,
+        # i.e. if nodes or links are added, and right away if they are removed.
+        self._lookup_cache = {}
+        self._tree_generation = 0
+        self._lookup_cache_generation = 0
+
         # Context Manager to disable logging for auto-loading
         self._disable_logging = DisableAllLogging()
 
@@ -503,6 +520,12 @@ class NaturalNamingInterface(HasLogger):
         self._not_admissible_names = set(dir(self)) | set(dir(self._root_instance))
         self._python_keywords = set(keyword.kwlist)
 
+    def __getstate__(self):
+        result = super(NaturalNamingInterface, self).__getstate__()
+        # Cached names might not be valid for a copy with less run information
+        result['_lookup_cache'] = {}
+        return result
+
 
     def _map_type_to_dict(self, type_name):
         """ Maps a an instance type representation string (e.g. 'RESULT')
@@ -839,6 +862,8 @@ class NaturalNamingInterface(HasLogger):
 
     def _remove_from_nodes_and_leaves(self, node):
 
+        self._tree_generation += 1
+        self._lookup_cache.clear()
         run_name = node.v_run_branch
         full_name = node.v_full_name
         name = node.v_name
@@ -847,11 +872,18 @@ class NaturalNamingInterface(HasLogger):
         if len(self._nodes_and_leaves[name]) == 0:
             del self._nodes_and_leaves[name]
 
-        del self._nodes_and_leaves_runs_sorted[name][run_name][full_name]
-        if len(self._nodes_and_leaves_runs_sorted[name][run_name]) == 0:
-            del self._nodes_and_leaves_runs_sorted[name][run_name]
-            if len(self._nodes_and_leaves_runs_sorted[name]) == 0:
-                del self._nodes_and_leaves_runs_sorted[name]
+        run_dict = self._nodes_and_leaves_runs_sorted[name]
+        nodes = run_dict[run_name]
+        if isinstance(nodes, dict):
+            del nodes[full_name]
+            if len(nodes) == 0:
+                del run_dict[run_name]
+        elif nodes.v_full_name == full_name:
+            del run_dict[run_name]
+        else:
+            raise KeyError(full_name)
+        if len(run_dict) == 0:
+            del self._nodes_and_leaves_runs_sorted[name]
 
     def _remove_node_or_leaf(self, instance, recursive=False):
         """Removes a single node from the tree.
@@ -1238,6 +1270,7 @@ class NaturalNamingInterface(HasLogger):
 
     def _add_to_nodes_and_leaves(self, new_node):
 
+        self._tree_generation += 1
         full_name = new_node.v_full_name
         name = new_node.v_name
         run_name = new_node._run_branch
@@ -1246,17 +1279,22 @@ class NaturalNamingInterface(HasLogger):
         else:
             self._nodes_and_leaves[name][full_name] = new_node
 
+        # Names are usually unique within a run, so instead of a dictionary
+        # with a single item only the node itself is kept
         if not name in self._nodes_and_leaves_runs_sorted:
-            self._nodes_and_leaves_runs_sorted[name] = {run_name:
-                                                            {full_name:
-                                                                 new_node}}
+            self._nodes_and_leaves_runs_sorted[name] = {run_name: new_node}
         else:
-            if not run_name in self._nodes_and_leaves_runs_sorted[name]:
-                self._nodes_and_leaves_runs_sorted[name][run_name] = \
-                    {full_name: new_node}
+            run_dict = self._nodes_and_leaves_runs_sorted[name]
+            if not run_name in run_dict:
+                run_dict[run_name] = new_node
             else:
-                self._nodes_and_leaves_runs_sorted[name][run_name]\
-                    [full_name] = new_node
+                nodes = run_dict[run_name]
+                if isinstance(nodes, dict):
+                    nodes[full_name] = new_node
+                elif nodes.v_full_name == full_name:
+                    run_dict[run_name] = new_node
+                else:
+                    run_dict[run_name] = {nodes.v_full_name: nodes, full_name: new_node}
 
     def _add_to_tree(self, start_node, split_names, type_name, group_type_name,
                      instance, constructor, args, kwargs):
@@ -1377,6 +1415,8 @@ class NaturalNamingInterface(HasLogger):
             raise
 
     def _remove_link(self, act_node, name):
+        self._tree_generation += 1
+        self._lookup_cache.clear()
         linked_node = act_node._links[name]
         full_name = linked_node.v_full_name
         linking = self._root_instance._linked_by[full_name]
@@ -1399,6 +1439,7 @@ class NaturalNamingInterface(HasLogger):
         """Creates a link and checks if names are appropriate
         """
 
+        self._tree_generation += 1
         act_node._links[name] = instance
         act_node._children[name] = instance
 
@@ -1894,15 +1935,16 @@ class NaturalNamingInterface(HasLogger):
                 return self._nodes_and_leaves[key]
             # This can be false in case of links which are not added to the run sorted nodes and leaves
             else:
+                run_dict = self._nodes_and_leaves_runs_sorted[key]
                 temp_dict = {}
-                if crun in self._nodes_and_leaves_runs_sorted[key]:
-                    temp_dict = self._nodes_and_leaves_runs_sorted[key][crun]
+                if crun in run_dict:
+                    temp_dict = self._as_node_dict(run_dict[crun])
                     if use_upper_bound and len(temp_dict) > FAST_UPPER_BOUND:
                         raise pex.TooManyGroupsError('Too many nodes')
 
                 temp_dict2 = {}
-                if 'trajectory' in self._nodes_and_leaves_runs_sorted[key]:
-                    temp_dict2 = self._nodes_and_leaves_runs_sorted[key]['trajectory']
+                if 'trajectory' in run_dict:
+                    temp_dict2 = self._as_node_dict(run_dict['trajectory'])
                     if use_upper_bound and len(temp_dict) + len(temp_dict2) > FAST_UPPER_BOUND:
                         raise pex.TooManyGroupsError('Too many nodes')
 
@@ -1911,10 +1953,21 @@ class NaturalNamingInterface(HasLogger):
             # We end up here if `key` is actually a link
             return {}
 
+    @staticmethod
+    def _as_node_dict(nodes):
+        """Turns an entry of the run sorted nodes into a dictionary of full names and nodes"""
+        if isinstance(nodes, dict):
+            return nodes
+        return {nodes.v_full_name: nodes}
+
     def _very_fast_search(self, node, key, max_depth, with_links, crun):
         """Fast search for a node in the tree.
 
         The tree is not traversed but the reference dictionaries are searched.
+        All nodes named `key` are candidates. A candidate is below `node` if its full name
+        starts with the full name of `node` and its relative depth follows from the
+        stored depths. The candidate with the smallest relative depth is returned,
+        as a breadth first search would do.
 
         :param node:
 
@@ -1930,8 +1983,9 @@ class NaturalNamingInterface(HasLogger):
 
         :param with_links:
 
-            If we work with links than we can only be sure to found the node in case we
-            have a single match. Otherwise the other match might have been linked as well.
+            If we work with links than we can only be sure to find the node in case
+            none of the matches is reachable via a link.
+            Otherwise a link might lead to a match at a smaller depth.
 
         :param crun:
 
@@ -1957,34 +2011,60 @@ class NaturalNamingInterface(HasLogger):
 
         parent_full_name = node.v_full_name
         starting_depth = node.v_depth
-        candidate_dict = self._get_candidate_dict(key, crun)
-
-        # If there are to many potential candidates sequential search might be too slow
-        if with_links:
-            upper_bound = 1
+        if node.v_run_branch != 'trajectory':
+            # All nodes below a run group belong to the very same run
+            crun = node.v_run_branch
+        candidate_dict = self._get_candidate_dict(key, crun, use_upper_bound=False)
+
+        linked_by = self._root_instance._linked_by
+        if with_links and len(linked_by) > 0:
+            # Links may provide other paths to some of the candidates
+            for goal_name in candidate_dict:
+                if self._is_linked(goal_name, linked_by):
+                    raise pex.TooManyGroupsError('Too many nodes')
+
+        if parent_full_name == '':
+            prefix = ''
         else:
-            upper_bound = FAST_UPPER_BOUND
-        if len(candidate_dict) > upper_bound:
-            raise pex.TooManyGroupsError('Too many nodes')
+            prefix = parent_full_name + '.'
 
         # Next check if the found candidates could be reached from the parent node
         result_node = None
+        result_depth = float('inf')
+        second_name = None
         for goal_name in candidate_dict:
 
             # Check if we have found a matching node
-            if goal_name.startswith(parent_full_name):
+            if goal_name.startswith(prefix):
                 candidate = candidate_dict[goal_name]
-                if candidate.v_depth - starting_depth <= max_depth:
-                    # In case of several solutions raise an error:
-                    if result_node is not None:
-                        raise pex.NotUniqueNodeError('Node `%s` has been found more than once, '
-                                                     'full name of first occurrence is `%s` and of'
-                                                     'second `%s`'
-                                                     % (key, goal_name, result_node.v_full_name))
-                    result_node = candidate
+                depth = candidate.v_depth - starting_depth
+                if depth <= max_depth:
+                    if depth < result_depth:
+                        result_node = candidate
+                        result_depth = depth
+                        second_name = None
+                    elif depth == result_depth:
+                        second_name = goal_name
+
+        if second_name is not None:
+            raise pex.NotUniqueNodeError('Node `%s` has been found more than once within '
+                                         'the same depth %d. '
+                                         'Full name of first occurrence is `%s` and of '
+                                         'second `%s`'
+                                         % (key, result_node.v_depth, result_node.v_full_name,
+                                            second_name))
 
         if result_node is not None:
-            return result_node, result_node.v_depth
+            return result_node, result_depth
+
+    @staticmethod
+    def _is_linked(full_name, linked_by):
+        """Checks if a node or one of its ancestors is the target of a link"""
+        while full_name:
+            if full_name in linked_by:
+                return True
+            full_name = full_name.rpartition('.')[0]
+        return False
 
     def _search(self, node, key, max_depth=float('inf'), with_links=True, crun=None):
         """ Searches for an item in the tree below `node`
@@ -2020,12 +2100,16 @@ class NaturalNamingInterface(HasLogger):
         # First the very fast search is tried that does not need tree traversal.
         try:
             result = self._very_fast_search(node, key, max_depth, with_links, crun)
+            if not result and crun is not None:
+                # The node might still be found in another run
+                result = self._very_fast_search(node, key, max_depth, with_links, None)
             if result:
                 return result
+            elif key not in self._links_count:
+                # The dictionaries know all nodes, so there is no matching node below `node`
+                return None, float('inf')
         except pex.TooManyGroupsError:
             pass
-        except pex.NotUniqueNodeError:
-            pass
 
         # Slowly traverse the entire tree
         nodes_iterator = self._iter_nodes(node, recursive=True,
@@ -2206,6 +2290,10 @@ class NaturalNamingInterface(HasLogger):
              shortcuts, max_depth, auto_load, with_links):
         """Searches for an item (parameter/result/group node) with the given `name`.
 
+        Resolved names are cached until nodes or links are added or removed.
+        The cache distinguishes the current run index, so it is safe to switch
+        runs with :func:`~pypet.trajectory.Trajectory.f_set_crun`.
+
         :param node: The node below which the search is performed
 
         :param name: Name of the item (full name or parts of the full name)
@@ -2239,6 +2327,42 @@ class NaturalNamingInterface(HasLogger):
         if auto_load and not with_links:
             raise ValueError('If you allow auto-loading you mus allow links.')
 
+        if not isinstance(name, str):
+            result = self._resolve(node, name, shortcuts, max_depth, auto_load, with_links)
+        else:
+            cache_key = (node._full_name, name, self._root_instance.v_idx,
+                         shortcuts, max_depth, with_links)
+            self._check_lookup_cache()
+            try:
+                result = self._lookup_cache[cache_key]()
+            except KeyError:
+                result = None
+            if result is None:
+                result = self._resolve(node, name, shortcuts, max_depth, auto_load, with_links)
+                # Resolving might have added new nodes due to auto-loading
+                self._check_lookup_cache()
+                self._lookup_cache[cache_key] = weakref.ref(result)
+            elif auto_load and result.v_is_leaf and result.f_is_empty():
+                self._load_empty_leaf(node, name, result)
+
+        if result.v_is_leaf:
+            return self._apply_fast_access(result, fast_access)
+        else:
+            return result
+
+    def _check_lookup_cache(self):
+        """Empties the lookup cache if the tree was modified or the cache is full"""
+        if (self._lookup_cache_generation != self._tree_generation or
+                len(self._lookup_cache) >= LOOKUP_CACHE_SIZE):
+            self._lookup_cache.clear()
+            self._lookup_cache_generation = self._tree_generation
+
+    def _resolve(self, node, name, shortcuts, max_depth, auto_load, with_links):
+        """Resolves a `name` below `node`, see :func:`~pypet.naturalnaming.NaturalNamingInterface._get`.
+
+        :return: The found instance (result/parameter/group node)
+
+        """
         if isinstance(name, list):
             split_name = name
         elif isinstance(name, tuple):
@@ -2290,9 +2414,13 @@ class NaturalNamingInterface(HasLogger):
 
             if is_wildcard:
                 wildcard_positions.append((idx, key))
-                if root.f_wildcard(key) not in self._nodes_and_leaves:
+                translation1 = root.f_wildcard(key)
+                if (translation1 not in self._nodes_and_leaves and
+                        translation1 not in self._links_count):
                     try_auto_load_directly1 = True
-                if root.f_wildcard(key, -1) not in self._nodes_and_leaves:
+                translation2 = root.f_wildcard(key, -1)
+                if (translation2 not in self._nodes_and_leaves and
+                        translation2 not in self._links_count):
                     try_auto_load_directly2 = True
 
         run_idx = root.v_idx
@@ -2313,7 +2441,7 @@ class NaturalNamingInterface(HasLogger):
                     for wildcard_pos, wildcard in wildcard_positions:
                         split_name[wildcard_pos] = root.f_wildcard(wildcard, run_idx)
 
-                    result = self._perform_get(node, split_name, fast_access,
+                    result = self._perform_get(node, split_name, False,
                                                shortcuts, max_depth, auto_load, with_links,
                                                try_auto_load_directly1)
                     return result
@@ -2324,7 +2452,7 @@ class NaturalNamingInterface(HasLogger):
             for wildcard_pos, wildcard in wildcard_positions:
                 split_name[wildcard_pos] = root.f_wildcard(wildcard, -1)
         try:
-            return self._perform_get(node, split_name, fast_access,
+            return self._perform_get(node, split_name, False,
                                      shortcuts, max_depth, auto_load, with_links,
                                      try_auto_load_directly2)
         except (pex.DataNotInStorageError, AttributeError):
@@ -2435,23 +2563,26 @@ class NaturalNamingInterface(HasLogger):
                                  (name, node.v_full_name))
         if result.v_is_leaf:
             if auto_load and result.f_is_empty():
-
-                try:
-                    self._root_instance.f_load_item(result)
-                    if (self._root_instance.v_idx != -1 and
-                            result.v_is_parameter and
-                            result.v_explored):
-                        result._set_parameter_access(self._root_instance.v_idx)
-                except:
-                    self._logger.error('Error while auto-loading `%s` under `%s`. I found the '
-                                       'item but I could not load the data.' %
-                                       (name, node.v_full_name))
-                    raise
+                self._load_empty_leaf(node, name, result)
 
             return self._apply_fast_access(result, fast_access)
         else:
             return result
 
+    def _load_empty_leaf(self, node, name, result):
+        """Auto-loads the data of a found but empty leaf"""
+        try:
+            self._root_instance.f_load_item(result)
+            if (self._root_instance.v_idx != -1 and
+                    result.v_is_parameter and
+                    result.v_explored):
+                result._set_parameter_access(self._root_instance.v_idx)
+        except:
+            self._logger.error('Error while auto-loading `%s` under `%s`. I found the '
+                               'item but I could not load the data.' %
+                               (name, node.v_full_name))
+            raise
+
 
 class NNGroupNode(NNTreeNode, KnowsTrajectory):
     """A group node hanging somewhere under the trajectory or single run root node.
@@ -2543,6 +2674,30 @@ class NNGroupNode(NNTreeNode, KnowsTrajectory):
         return '%s %s%s: %s' % (self.f_get_class_name(), self.v_full_name, commentstring,
                                 children_string)
 
+    def _clone_group(self, nn_interface):
+        """Returns an empty copy of the group belonging to the tree of `nn_interface`.
+
+        The constructor is bypassed and the annotations are shared with this group.
+        Children are not copied.
+
+        """
+        cls = self.__class__
+        clone = cls.__new__(cls)
+        NNGroupNode.__init__(clone, comment=self._comment)
+        clone._full_name = self._full_name
+        clone._name = self._name
+        clone._set_details(self._depth, self._branch, self._run_branch)
+        clone._annotations_ = self._annotations_
+        clone._nn_interface = nn_interface
+        if cls.__all_slots__ != NNGroupNode.__all_slots__:
+            # Additional data of user defined groups
+            for slot in cls.__all_slots__ - NNGroupNode.__all_slots__:
+                if slot != '__dict__' and hasattr(self, slot):
+                    setattr(clone, slot, getattr(self, slot))
+        if hasattr(self, '__dict__'):
+            clone.__dict__.update(self.__dict__)
+        return clone
+
     def _add_group_from_storage(self, args, kwargs):
         """Can be called from storage service to create a new group to bypass name checking"""
         return self._nn_interface._add_generic(self,
@@ -2625,7 +2780,7 @@ class NNGroupNode(NNTreeNode, KnowsTrajectory):
 
         debug_tree = Bunch()
 
-        if not self.v_annotations.f_is_empty():
+        if self._has_annotations():
             debug_tree.v_annotations = self.v_annotations
         if not self.v_comment == '':
             debug_tree.v_comment = self.v_comment
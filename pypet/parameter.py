@@ -846,7 +846,12 @@ class Parameter(BaseParameter):
             raise ValueError('You try to access data item No. %d in the parameter range, '
                              'yet there are only %d potential items.' % (idx, len(self)))
         elif self.f_has_range():
-            self._data = self._explored_range[idx]
+            data = self._explored_range[idx]
+            if (isinstance(self._explored_range, np.ndarray) and
+                    not isinstance(self._default, np.generic)):
+                # Array ranges of python defaults hand out python values
+                data = data.item()
+            self._data = data
         else:
             self._logger.warning('You try to change the access to a parameter range of parameter'
                                  ' `%s`. The parameter has no range, your setting has no'
@@ -963,6 +968,9 @@ class Parameter(BaseParameter):
     def f_get_range(self, copy=True):
         """Returns a python iterable containing the exploration range.
 
+        This is a list or, if the parameter was explored with a one-dimensional
+        numpy array, a numpy array.
+
         :param copy:
 
             If the range should be copied before handed over to avoid tempering with data
@@ -981,6 +989,8 @@ class Parameter(BaseParameter):
             raise TypeError('Your parameter `%s` is not array, so cannot return array.' %
                             self.v_full_name)
         elif copy:
+            if isinstance(self._explored_range, np.ndarray):
+                return self._explored_range.copy()
             return self._explored_range[:]
         else:
             return self._explored_range
@@ -996,7 +1006,8 @@ class Parameter(BaseParameter):
 
         Note that the parameter will iterate over the whole iterable once and store
         the individual data values into a tuple. Thus, the whole exploration range is
-        explicitly stored in memory.
+        explicitly stored in memory. Only one-dimensional numpy arrays with
+        a dtype of the same kind as the default value are kept as arrays.
 
         :param explore_iterable: An iterable specifying the exploration range
 
@@ -1060,7 +1071,13 @@ class Parameter(BaseParameter):
 
         data_list = self._data_sanity_checks(explore_iterable)
 
-        self._explored_range.extend(data_list)
+        if isinstance(self._explored_range, np.ndarray):
+            if isinstance(data_list, np.ndarray):
+                self._explored_range = np.concatenate((self._explored_range, data_list))
+            else:
+                self._explored_range = self._explored_list() + data_list
+        else:
+            self._explored_range.extend(data_list)
         self.f_lock()
 
     def _data_sanity_checks(self, explore_iterable):
@@ -1069,7 +1086,16 @@ class Parameter(BaseParameter):
         Checks if the data values are supported by the parameter and if the values are of the same
         type as the default value.
 
+        A one-dimensional numpy array is homogeneous, thus, only its dtype needs to be
+        checked and a copy of the array is returned instead of a list.
+
         """
+        if type(explore_iterable) is np.ndarray and explore_iterable.ndim == 1:
+            if len(explore_iterable) == 0:
+                raise ValueError('Cannot explore an empty list!')
+            if self._supports_array_range(explore_iterable):
+                return explore_iterable.copy()
+
         data_list = []
 
         for val in explore_iterable:
@@ -1090,6 +1116,29 @@ class Parameter(BaseParameter):
 
         return data_list
 
+    def _supports_array_range(self, array):
+        """Checks once if all items of a one-dimensional `array` fit the default value.
+
+        Numpy defaults need items of exactly their type, python defaults need
+        a dtype of the same kind, e.g. floats for a python float.
+
+        """
+        dtype = array.dtype
+        if dtype.hasobject or not self.f_supports(array[0]):
+            return False
+        if isinstance(self._default, np.generic):
+            return dtype.type is type(self._default)
+        if type(self._default) not in (bool, int, float, complex, str):
+            return False
+        return np.dtype(type(self._default)).kind == dtype.kind
+
+    def _explored_list(self):
+        """The exploration range as a list with items of the type of the default value"""
+        if (isinstance(self._explored_range, np.ndarray) and
+                not isinstance(self._default, np.generic)):
+            return self._explored_range.tolist()
+        return list(self._explored_range)
+
     def _store(self):
         """Returns a dictionary of formatted data understood by the storage service.
 
@@ -1104,7 +1153,8 @@ class Parameter(BaseParameter):
             store_dict = {'data': ObjectTable(data={'data': [self._data]})}
 
         if self.f_has_range():
-            store_dict['explored_data'] = ObjectTable(data={'data': self._explored_range})
+            # Arrays would be converted to python types by the object table
+            store_dict['explored_data'] = ObjectTable(data={'data': self._explored_list()})
 
         self._locked = True
 
@@ -1759,7 +1809,9 @@ class PickleParameter(Parameter):
             smart_dict = {}
             count = 0
 
-            for idx, val in enumerate(self._explored_range):
+            # Items of arrays are created on access, a list keeps them alive
+            # so that their ids are unique
+            for idx, val in enumerate(self._explored_list()):
 
                 obj_id = id(val)
 
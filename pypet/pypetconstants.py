@@ -163,6 +163,19 @@ WRAP_MODE_NETLOCK = 'NETLOCK'
 """ Lock multiprocessing mode over a network """
 WRAP_MODE_NETQUEUE = 'NETQUEUE'
 """ Queue multiprocessing mode over a network """
+WRAP_MODE_NETSTREAM = 'NETSTREAM'
+""" Queue multiprocessing mode over a network with streaming of data """
+
+
+############ Run States ###########################
+
+RUN_COMPLETED = 1
+"""Value of `completed` in the run information of a finished run"""
+RUN_CANCELLED = -1
+"""Value of `completed` of a cancelled run, cancelled runs count as finished"""
+
+RUN_TIMINGS = ('dispatch_time', 'function_time', 'store_time', 'lock_time', 'ipc_time')
+"""Phases of a single run whose durations in seconds are kept in the run information"""
 
 
 ############ Loading Constants ###########################
@@ -213,6 +226,8 @@ PREPARE_MERGE = 'PREPARE_MERGE'
 """ Updates a trajectory before it is going to be merged"""
 BACKUP = 'BACKUP'
 """ Backs up a trajectory"""
+RESTORE = 'RESTORE'
+""" Restores a trajectory from its backup"""
 DELETE = 'DELETE'
 """ Removes an item from hdf5 file"""
 DELETE_LINK = 'DELETE_LINK'
@@ -8,6 +8,7 @@ __author__ = 'Robert Meyer'
 
 import os
 import warnings
+import multiprocessing.util as mputil
 import time
 import hashlib
 import itertools as itools
@@ -30,6 +31,7 @@ from pypet.pypetlogging import HasLogger, DisableAllLogging
 from pypet.utils.decorators import deprecated
 import pypet.shareddata as shared
 from pypet.utils.helpful_functions import racedirs
+from pypet.utils.storagemetrics import StorageMetrics
 
 
 class StorageService(object):
@@ -91,8 +93,9 @@ class LazyStorageService(StorageService):
 class NodeProcessingTimer(HasLogger):
     """Simple Class to display the processing of nodes"""
 
-    def __init__(self, display_time=15, logger_name=None):
+    def __init__(self, display_time=15, logger_name=None, metrics=None):
         self._start_time = time.time()
+        self._metrics = metrics
         self._last_time = self._start_time
         self._display_time = display_time
         self._set_logger(logger_name)
@@ -106,6 +109,8 @@ class NodeProcessingTimer(HasLogger):
         If more time than the display time has passed a message is emitted.
 
         """
+        if self._metrics is not None:
+            self._metrics.increment('nodes')
         if not self.active:
             return
 
@@ -289,6 +294,12 @@ class HDF5StorageService(StorageService, HasLogger):
 
         Analogous to the above.
 
+    :param run_timings:
+
+        Whether the `runs` overview table is extended by the durations of the phases of
+        every single run, i.e. dispatching, the job function, storing, waiting for locks,
+        and inter-process communication, as well as the process and thread IDs.
+
     :param display_time:
 
         How often status messages about loading and storing time should be displayed.
@@ -353,7 +364,8 @@ class HDF5StorageService(StorageService, HasLogger):
     PR_ATTR_NAME_MAPPING = {
         '_derived_parameters_per_run': 'derived_parameters_per_run',
         '_results_per_run': 'results_per_run',
-        '_purge_duplicate_comments': 'purge_duplicate_comments'
+        '_purge_duplicate_comments': 'purge_duplicate_comments',
+        '_run_timings': 'run_timings'
     }
     '''Mapping of Attribute names for hdf5_settings table'''
 
@@ -491,6 +503,26 @@ class HDF5StorageService(StorageService, HasLogger):
     LEAF = 'SRVC_LEAF'
     ''' Whether an hdf5 node is a leaf node'''
 
+    # Differential backups
+    BACKUP_GENERATION = 'SRVC_BACKUP_GENERATION'
+    ''' Current backup generation of a trajectory or of its backup'''
+    BACKUP_JOURNAL = 'backup_journal'
+    ''' Overview table listing the hdf5 nodes modified since the latest backup'''
+    BACKUP_JOURNAL_PATH_LENGTH = (pypetconstants.HDF5_STRCOL_MAX_LOCATION_LENGTH +
+                                  2 * pypetconstants.HDF5_STRCOL_MAX_NAME_LENGTH + 3)
+    ''' Maximum length of journaled paths, i.e. trajectory name, location, and name'''
+
+    _READ_ONLY_REQUESTS = frozenset(['__getitem__', '__iter__', 'atom', 'col', 'coldescrs',
+                                     'coldtypes', 'colindexed', 'colindexes', 'colnames',
+                                     'colpathnames', 'cols', 'coltypes', 'description', 'extdim',
+                                     'get_enum', 'get_where_list', 'indexed',
+                                     'indexedcolpathnames', 'iterrows', 'itersequence',
+                                     'itersorted', 'next', 'nrows', 'pandas_get',
+                                     'pandas_select', 'read', 'read_coordinates', 'read_sorted',
+                                     'read_where', 'rowsize', 'where',
+                                     'will_query_use_indexing'])
+    ''' Shared data requests that do not modify the hdf5 data'''
+
     def __init__(self, filename=None,
                  file_title=None,
                  overwrite_file=False,
@@ -506,6 +538,7 @@ class HDF5StorageService(StorageService, HasLogger):
                  large_overview_tables=False,
                  results_per_run=0,
                  derived_parameters_per_run=0,
+                 run_timings=False,
                  display_time=20,
                  trajectory=None):
 
@@ -571,6 +604,7 @@ class HDF5StorageService(StorageService, HasLogger):
         self._purge_duplicate_comments = purge_duplicate_comments
         self._results_per_run = results_per_run
         self._derived_parameters_per_run = derived_parameters_per_run
+        self._run_timings = run_timings
 
         self._overview_parameters = small_overview_tables
         self._overview_config = small_overview_tables
@@ -581,6 +615,8 @@ class HDF5StorageService(StorageService, HasLogger):
         self._overview_results_summary = summary_tables
 
         self._overview_group_ = None  # to cache link to overview
+        self._backup_generation_ = None  # to cache the backup generation of the trajectory
+        self._modified_paths = {}  # hdf5 paths modified since opening the file, see backups
 
         self._disable_logger = DisableAllLogging()
 
@@ -588,6 +624,11 @@ class HDF5StorageService(StorageService, HasLogger):
         self._mode = None
         self._keep_open = False
 
+        self._metrics = StorageMetrics()
+        self._file_size_at_opening = 0
+        # Forked processes should only count their own operations
+        mputil.register_after_fork(self, HDF5StorageService._reset_metrics)
+
         if trajectory is not None and not trajectory.v_stored:
             self._srvc_set_config(trajectory=trajectory)
 
@@ -607,6 +648,36 @@ class HDF5StorageService(StorageService, HasLogger):
     def __repr__(self):
         return '<%s (filename:`%s`)>' % (self.__class__.__name__, str(self._filename))
 
+    def __getstate__(self):
+        result = super(HDF5StorageService, self).__getstate__()
+        # Copies only count their own operations
+        result['_metrics'] = StorageMetrics()
+        return result
+
+    def __setstate__(self, statedict):
+        super(HDF5StorageService, self).__setstate__(statedict)
+        mputil.register_after_fork(self, HDF5StorageService._reset_metrics)
+
+    def _reset_metrics(self):
+        self._metrics.reset()
+
+    @property
+    def metrics(self):
+        """:class:`~pypet.utils.storagemetrics.StorageMetrics` of all operations so far.
+
+        Counts processed `nodes`, `flushes`, appended `table_rows`, `files_opened`,
+        and `bytes_written` (estimated from the growth of the file between opening and
+        closing). Latencies are recorded per message, like ``'store.LEAF'``.
+
+        """
+        return self._metrics
+
+    def pop_metrics(self):
+        """Returns a copy of the current metrics and resets them"""
+        metrics = StorageMetrics().merge(self._metrics)
+        self._metrics.reset()
+        return metrics
+
     @property
     def is_open(self):
         """ Normally the file is opened and closed after each insertion.
@@ -704,6 +775,82 @@ class HDF5StorageService(StorageService, HasLogger):
             self._overview_group_ = self._all_create_or_get_groups('overview')[0]
         return self._overview_group_
 
+    @property
+    def _backup_generation(self):
+        """Current backup generation of the trajectory, modified nodes are stamped with it"""
+        if self._backup_generation_ is None:
+            generation = self._all_get_from_attrs(self._trajectory_group,
+                                                  HDF5StorageService.BACKUP_GENERATION)
+            self._backup_generation_ = 0 if generation is None else int(generation)
+        return self._backup_generation_
+
+    def _all_mark_modified(self, hdf5_node, deleted=False):
+        """Remembers that an hdf5 node was modified or is about to be deleted.
+
+        Only the path is kept in memory, the paths are appended to the backup journal
+        when the file is closed. Differential backups only visit the journaled nodes.
+
+        """
+        path = hdf5_node._v_pathname
+        self._modified_paths[path] = deleted or self._modified_paths.get(path, False)
+
+    def _srvc_store_backup_journal(self):
+        """Appends the paths modified since opening the file to the backup journal.
+
+        Nothing is journaled as long as the trajectory has never been backed up.
+        Paths too long for the journal are replaced by their longest fitting parent,
+        which is copied as a whole.
+
+        """
+        if not self._modified_paths:
+            return
+        if (self._trajectory_group is None or not self._hdf5file.isopen or
+                self._backup_generation == 0):
+            self._modified_paths = {}
+            return
+
+        tablename = HDF5StorageService.BACKUP_JOURNAL
+        if tablename in self._overview_group:
+            journal = self._overview_group._f_get_child(tablename)
+        else:
+            description = {'path': pt.StringCol(
+                               HDF5StorageService.BACKUP_JOURNAL_PATH_LENGTH, pos=0),
+                           'generation': pt.IntCol(pos=1),
+                           'deleted': pt.BoolCol(pos=2)}
+            journal = self._hdf5file.create_table(where=self._overview_group,
+                                                  name=tablename,
+                                                  description=description,
+                                                  title=tablename,
+                                                  filters=self._all_get_filters())
+        max_length = journal.coldtypes['path'].itemsize
+
+        generation = self._backup_generation
+        rows = []
+        for path, deleted in self._modified_paths.items():
+            encoded_path = path.encode('utf-8')
+            while len(encoded_path) > max_length:
+                encoded_path = encoded_path.rsplit(b'/', 1)[0]
+                deleted = True
+            rows.append((encoded_path, generation, deleted))
+        self._modified_paths = {}
+
+        journal.append(rows)
+        journal.flush()
+
+    def _srvc_prune_backup_journal(self, generation):
+        """Removes all journal entries older than `generation`"""
+        tablename = HDF5StorageService.BACKUP_JOURNAL
+        if tablename not in self._overview_group:
+            return
+        journal = self._overview_group._f_get_child(tablename)
+        # The generation never decreases, so old entries are at the beginning
+        old_rows = len(journal.get_where_list('generation < backup_generation',
+                                              condvars={'backup_generation': generation}))
+        if old_rows == journal.nrows:
+            journal._f_remove()
+        elif old_rows > 0:
+            journal.remove_rows(0, old_rows)
+
     def _all_get_filters(self, kwargs=None):
         """Makes filters
 
@@ -778,6 +925,10 @@ class HDF5StorageService(StorageService, HasLogger):
                     comment='Expected number of derived parameters per run,'
                             ' a good guess can increase storage performance')
 
+        _set_config('hdf5.run_timings', self._run_timings,
+                    comment='Whether the phase timings of single runs are'
+                            ' added to the `runs` overview table')
+
         _set_config('hdf5.complevel', self._complevel,
                     comment='Compression Level (0 no compression '
                             'to 9 highest compression)')
@@ -936,6 +1087,7 @@ class HDF5StorageService(StorageService, HasLogger):
 
         """
         opened = True
+        start = time.time()
         try:
 
             opened = self._srvc_opening_routine('r', kwargs=kwargs)
@@ -966,6 +1118,7 @@ class HDF5StorageService(StorageService, HasLogger):
             raise
         finally:
             self._srvc_closing_routine(opened)
+            self._metrics.record('load.%s' % msg, time.time() - start)
 
     def store(self, msg, stuff_to_store, *args, **kwargs):
         """ Stores a particular item to disk.
@@ -1037,6 +1190,21 @@ class HDF5StorageService(StorageService, HasLogger):
                     the same folder as your hdf5 file and named 'backup_XXXXX.hdf5'
                     where 'XXXXX' is the name of your current trajectory.
 
+                :param differential:
+
+                    If an existing backup in the file should be updated with the nodes
+                    modified since the last backup. Otherwise an existing backup raises
+                    a ValueError.
+
+            * :const:`pypet.pypetconstants.RESTORE` ('RESTORE')
+
+                :param stuff_to_store: Trajectory to be restored from its backup
+
+                :param backup_filename:
+
+                    Name of file containing the backup. If None the default backup file
+                    name of :const:`pypet.pypetconstants.BACKUP` is used.
+
             * :const:`pypet.pypetconstants.TRAJECTORY` ('TRAJECTORY')
 
                 Stores the whole trajectory
@@ -1279,6 +1447,7 @@ class HDF5StorageService(StorageService, HasLogger):
 
         """
         opened = True
+        start = time.time()
         try:
 
             opened = self._srvc_opening_routine('a', msg, kwargs)
@@ -1289,6 +1458,9 @@ class HDF5StorageService(StorageService, HasLogger):
             elif msg == pypetconstants.BACKUP:
                 self._trj_backup_trajectory(stuff_to_store, *args, **kwargs)
 
+            elif msg == pypetconstants.RESTORE:
+                self._trj_restore_trajectory(stuff_to_store, *args, **kwargs)
+
             elif msg == pypetconstants.PREPARE_MERGE:
                 self._trj_prepare_merge(stuff_to_store, *args, **kwargs)
 
@@ -1330,7 +1502,7 @@ class HDF5StorageService(StorageService, HasLogger):
                 self._keep_open = False
 
             elif msg == pypetconstants.FLUSH:
-                self._hdf5file.flush()
+                self._srvc_flush_file()
 
             else:
                 raise pex.NoSuchServiceError('I do not know how to handle `%s`' % msg)
@@ -1340,6 +1512,7 @@ class HDF5StorageService(StorageService, HasLogger):
             raise
         finally:
             self._srvc_closing_routine(opened)
+            self._metrics.record('store.%s' % msg, time.time() - start)
 
     def _srvc_load_several_items(self, iterable, *args, **kwargs):
         """Loads several items from an iterable
@@ -1464,6 +1637,11 @@ class HDF5StorageService(StorageService, HasLogger):
 
         if not self.is_open:
 
+            if os.path.isfile(self._filename):
+                self._file_size_at_opening = os.path.getsize(self._filename)
+            else:
+                self._file_size_at_opening = 0
+
             if 'a' in mode:
                 (path, filename) = os.path.split(self._filename)
                 racedirs(os.path.abspath(path))
@@ -1536,8 +1714,11 @@ class HDF5StorageService(StorageService, HasLogger):
                 raise RuntimeError('You shall not pass!')
 
             self._node_processing_timer = NodeProcessingTimer(display_time=self._display_time,
-                                                              logger_name=self._logger.name)
+                                                              logger_name=self._logger.name,
+                                                              metrics=self._metrics)
             self._overview_group_ = None
+            self._backup_generation_ = None
+            self._metrics.increment('files_opened')
 
             return True
         else:
@@ -1555,8 +1736,9 @@ class HDF5StorageService(StorageService, HasLogger):
                 closing and
                     self.is_open):
 
+            self._srvc_store_backup_journal()
             f_fd = self._hdf5file.fileno()
-            self._hdf5file.flush()
+            self._srvc_flush_file()
             try:
                 os.fsync(f_fd)
                 try:
@@ -1576,17 +1758,27 @@ class HDF5StorageService(StorageService, HasLogger):
             self._hdf5store.close()
             if self._hdf5file.isopen:
                 self._logger.error('Could not close HDF5 file!')
+            if os.path.isfile(self._filename):
+                growth = os.path.getsize(self._filename) - self._file_size_at_opening
+                if growth > 0:
+                    self._metrics.increment('bytes_written', growth)
             self._hdf5file = None
             self._hdf5store = None
             self._trajectory_group = None
             self._trajectory_name = None
             self._trajectory_index = None
             self._overview_group_ = None
+            self._backup_generation_ = None
             self._logger.debug('Closing HDF5 file')
             return True
         else:
             return False
 
+    def _srvc_flush_file(self):
+        """Flushes the HDF5 file and counts the flush"""
+        self._hdf5file.flush()
+        self._metrics.increment('flushes')
+
     def _srvc_extract_file_information(self, kwargs):
         """Extracts file information from kwargs.
 
@@ -1609,9 +1801,16 @@ class HDF5StorageService(StorageService, HasLogger):
 
     ########################### Merging ###########################################################
 
-    def _trj_backup_trajectory(self, traj, backup_filename=None):
+    def _trj_backup_trajectory(self, traj, backup_filename=None, differential=True):
         """Backs up a trajectory.
 
+        If the backup file already contains a backup of the trajectory and `differential`
+        is `True`, only nodes that were modified since the last backup are copied and
+        nodes deleted in the meantime are removed from the backup.
+        Modified nodes are looked up in the backup journal
+        (see :const:`~pypet.storageservice.HDF5StorageService.BACKUP_JOURNAL`),
+        the rest of the file is not visited.
+
         :param traj: Trajectory that should be backed up
 
         :param backup_filename:
@@ -1619,29 +1818,235 @@ class HDF5StorageService(StorageService, HasLogger):
             Path and filename of backup file. If None is specified the storage service
             defaults to `path_to_trajectory_hdf5_file/backup_trajectory_name.hdf`.
 
+        :param differential:
+
+            Whether an existing backup should be updated. If `False` a ValueError is raised
+            if the backup file already contains the trajectory.
+
         """
         self._logger.info('Storing backup of %s.' % traj.v_name)
 
-        mypath, _ = os.path.split(self._filename)
+        backup_filename = self._trj_get_backup_filename(traj, backup_filename)
+        generation = self._backup_generation + 1
+
+        backup_hdf5file = pt.open_file(filename=backup_filename,
+                                             mode='a', title=backup_filename)
+        try:
+            if '/' + self._trajectory_name in backup_hdf5file:
+                if not differential:
+                    raise ValueError('I cannot backup  `%s` into file `%s`, there is already a '
+                                     'trajectory with that name.' % (traj.v_name,
+                                                                     backup_filename))
+                backup_group = backup_hdf5file.get_node('/' + self._trajectory_name)
+                backup_generation = self._all_get_from_attrs(
+                    backup_group, HDF5StorageService.BACKUP_GENERATION)
+            else:
+                backup_group = None
+                backup_generation = None
+
+            if backup_generation is not None and backup_generation == self._backup_generation:
+                modified_paths = self._trj_read_backup_journal(backup_generation)
+                self._trj_copy_attributes(self._trajectory_group, backup_group)
+                copied = self._trj_sync_backup_paths(self._hdf5file, backup_hdf5file,
+                                                     modified_paths)
+                self._metrics.increment('nodes_copied', copied)
+                self._logger.info('Updated %d nodes in the backup of %s.' %
+                                  (copied, traj.v_name))
+            else:
+                # New backups and backups older than the journal are copied as a whole
+                if backup_group is not None:
+                    backup_group._f_remove(recursive=True)
+                self._srvc_store_backup_journal()
+                backup_root = backup_hdf5file.root
+                self._trajectory_group._f_copy(newparent=backup_root, recursive=True)
+                backup_group = backup_hdf5file.get_node('/' + self._trajectory_name)
+
+            # All later modifications are journaled with the new generation
+            self._all_set_attr(backup_group, HDF5StorageService.BACKUP_GENERATION, generation)
+            self._all_set_attr(self._trajectory_group, HDF5StorageService.BACKUP_GENERATION,
+                               generation)
+            self._backup_generation_ = generation
+            self._srvc_prune_backup_journal(generation)
+
+            backup_hdf5file.flush()
+        finally:
+            backup_hdf5file.close()
+
+        self._logger.info('Finished backup of %s.' % traj.v_name)
 
+    def _trj_restore_trajectory(self, traj, backup_filename=None):
+        """Restores a trajectory from its backup.
+
+        Only nodes that were modified since the backup are copied back,
+        nodes added after the backup are removed.
+
+        :param traj: Trajectory that should be restored
+
+        :param backup_filename:
+
+            Path and filename of backup file. If None is specified the storage service
+            defaults to `path_to_trajectory_hdf5_file/backup_trajectory_name.hdf`.
+
+        """
+        self._logger.info('Restoring %s from backup.' % traj.v_name)
+
+        backup_filename = self._trj_get_backup_filename(traj, backup_filename)
+        generation = self._backup_generation
+
+        backup_hdf5file = pt.open_file(filename=backup_filename, mode='r')
+        try:
+            if not '/' + self._trajectory_name in backup_hdf5file:
+                raise ValueError('I cannot restore `%s`, file `%s` does not contain a backup '
+                                 'of it.' % (traj.v_name, backup_filename))
+            backup_group = backup_hdf5file.get_node('/' + self._trajectory_name)
+            backup_generation = self._all_get_from_attrs(backup_group,
+                                                         HDF5StorageService.BACKUP_GENERATION)
+            if backup_generation is None:
+                raise ValueError('I cannot restore `%s`, the trajectory in file `%s` was not '
+                                 'created by `f_backup`.' % (traj.v_name, backup_filename))
+
+            if backup_generation == generation:
+                modified_paths = self._trj_read_backup_journal(backup_generation)
+            else:
+                # The journal only covers the latest backup, older ones are restored as a whole
+                self._srvc_store_backup_journal()
+                modified_paths = dict.fromkeys(
+                    ['/%s/%s' % (self._trajectory_name, name)
+                     for name in set(self._trajectory_group._v_children) |
+                     set(backup_group._v_children)], True)
+            self._trj_copy_attributes(backup_group, self._trajectory_group)
+            copied = self._trj_sync_backup_paths(backup_hdf5file, self._hdf5file,
+                                                 modified_paths, mark_modified=True)
+            self._metrics.increment('nodes_copied', copied)
+        finally:
+            backup_hdf5file.close()
+
+        # Copying the attributes of the trajectory group resets the generation,
+        # but the generation must never decrease
+        self._all_set_attr(self._trajectory_group, HDF5StorageService.BACKUP_GENERATION,
+                           generation)
+        self._srvc_flush_file()
+
+        self._logger.info('Finished restoring %s, %d nodes were copied back.' %
+                          (traj.v_name, copied))
+
+    def _trj_get_backup_filename(self, traj, backup_filename):
+        """Returns the default backup filename if `backup_filename` is None"""
         if backup_filename is None:
+            mypath, _ = os.path.split(self._filename)
             backup_filename = os.path.join('%s' % mypath, 'backup_%s.hdf5' % traj.v_name)
+        return backup_filename
 
-        backup_hdf5file = pt.open_file(filename=backup_filename,
-                                             mode='a', title=backup_filename)
+    def _trj_read_backup_journal(self, backup_generation):
+        """Returns the hdf5 paths modified since the backup of `backup_generation`.
 
-        if '/' + self._trajectory_name in backup_hdf5file:
-            raise ValueError('I cannot backup  `%s` into file `%s`, there is already a '
-                             'trajectory with that name.' % (traj.v_name, backup_filename))
+        :return:
 
-        backup_root = backup_hdf5file.root
+            Dictionary mapping the paths to whether the nodes were deleted
+            in the meantime
 
-        self._trajectory_group._f_copy(newparent=backup_root, recursive=True)
+        """
+        self._srvc_store_backup_journal()
+        modified_paths = {}
+        tablename = HDF5StorageService.BACKUP_JOURNAL
+        if tablename in self._overview_group:
+            journal = self._overview_group._f_get_child(tablename)
+            rows = journal.read_where('generation >= backup_generation',
+                                      condvars={'backup_generation': backup_generation})
+            for path, deleted in zip(rows['path'], rows['deleted']):
+                path = path.decode('utf-8')
+                modified_paths[path] = bool(deleted) or modified_paths.get(path, False)
+        return modified_paths
 
-        backup_hdf5file.flush()
-        backup_hdf5file.close()
+    def _trj_sync_backup_paths(self, src_file, dst_file, modified_paths, mark_modified=False):
+        """Updates the nodes at `modified_paths` in `dst_file` to mirror `src_file`.
 
-        self._logger.info('Finished backup of %s.' % traj.v_name)
+        Nodes missing in `src_file` are removed. Groups of the trajectory that were not
+        deleted in the meantime only get their attributes updated, all other nodes
+        are copied as a whole, including their children.
+
+        :param src_file: HDF5 file to copy from
+
+        :param dst_file: HDF5 file to update
+
+        :param modified_paths: Dictionary of paths as returned by the backup journal
+
+        :param mark_modified: If the updated nodes should be journaled as modified
+
+        :return: The number of copied or removed nodes
+
+        """
+        copied = 0
+        replaced_path = None
+        # Parents are sorted right before their children
+        for path in sorted(modified_paths, key=lambda path: path.split('/')):
+            if replaced_path is not None and path.startswith(replaced_path + '/'):
+                continue  # Already copied or removed together with a parent
+
+            src_node = self._trj_get_node_or_none(src_file, path)
+            dst_node = self._trj_get_node_or_none(dst_file, path)
+
+            if src_node is None:
+                replaced_path = path
+                if dst_node is None:
+                    continue
+                if mark_modified:
+                    self._all_mark_modified(dst_node, deleted=True)
+                dst_node._f_remove(recursive=True)
+            elif (not modified_paths[path] and self._trj_is_plain_group(src_node) and
+                    self._trj_is_plain_group(dst_node)):
+                self._trj_copy_attributes(src_node, dst_node)
+                if mark_modified:
+                    self._all_mark_modified(dst_node)
+            else:
+                replaced_path = path
+                if dst_node is not None:
+                    dst_node._f_remove(recursive=True)
+                dst_parent = self._trj_get_or_create_backup_group(src_node._v_parent, dst_file)
+                new_node = src_node._f_copy(newparent=dst_parent, newname=src_node._v_name,
+                                            recursive=True)
+                if mark_modified:
+                    self._all_mark_modified(new_node, deleted=True)
+            copied += 1
+
+        return copied
+
+    def _trj_get_or_create_backup_group(self, src_group, dst_file):
+        """Returns the group of `dst_file` at the path of `src_group`.
+
+        Missing groups are created along the way and get the attributes of their
+        counterparts in the source file.
+
+        """
+        dst_group = self._trj_get_node_or_none(dst_file, src_group._v_pathname)
+        if dst_group is None:
+            dst_parent = self._trj_get_or_create_backup_group(src_group._v_parent, dst_file)
+            dst_group = dst_file.create_group(dst_parent, src_group._v_name,
+                                              title=src_group._v_title,
+                                              filters=src_group._v_filters)
+            self._trj_copy_attributes(src_group, dst_group)
+        return dst_group
+
+    @staticmethod
+    def _trj_get_node_or_none(hdf5file, path):
+        """Returns the hdf5 node at `path` or `None` if it does not exist"""
+        try:
+            return hdf5file.get_node(path)
+        except pt.NoSuchNodeError:
+            return None
+
+    def _trj_is_plain_group(self, hdf5_node):
+        """Checks if an hdf5 node is a group but not a leaf of the trajectory"""
+        return (isinstance(hdf5_node, pt.Group) and
+                not self._all_get_from_attrs(hdf5_node, HDF5StorageService.LEAF))
+
+    @staticmethod
+    def _trj_copy_attributes(src_node, dst_node):
+        """Replaces all user attributes of `dst_node` with the ones of `src_node`"""
+        for attr_name in list(dst_node._v_attrs._v_attrnamesuser):
+            if attr_name not in src_node._v_attrs:
+                delattr(dst_node._v_attrs, attr_name)
+        src_node._v_attrs._f_copy(dst_node)
 
     @staticmethod
     def _trj_read_out_row(colnames, row):
@@ -1663,10 +2068,16 @@ class HDF5StorageService(StorageService, HasLogger):
                                 delete_trajectory=False, other_filename=None):
         """Merges another trajectory into the current trajectory (as in self._trajectory_name).
 
+        The HDF5 subtrees of all items are copied in bulk via `copy_node`, the data is
+        never decoded. This works within one file as well as across files.
+        Afterwards the rows of the overview tables of the other trajectory are renamed
+        and appended to the overview tables of the current trajectory.
+
         :param other_trajectory_name: Name of other trajectory
         :param rename_dict: Dictionary with old names (keys) and new names (values).
         :param move_nodes: Whether to move hdf5 nodes or copy them
         :param delete_trajectory: Whether to delete the other trajectory
+        :param other_filename: File containing the other trajectory, `None` for same file
 
         """
         if other_filename is None or other_filename == self.filename:
@@ -1674,7 +2085,11 @@ class HDF5StorageService(StorageService, HasLogger):
             other_file = self._hdf5file
             other_is_different = False
         else:
-            other_file = pt.open_file(filename=other_filename, mode='r+')
+            if move_nodes or delete_trajectory:
+                mode = 'r+'
+            else:
+                mode = 'r'
+            other_file = pt.open_file(filename=other_filename, mode=mode)
             other_is_different = True
 
         try:
@@ -1683,6 +2098,8 @@ class HDF5StorageService(StorageService, HasLogger):
                                  'be found in file: %s.' % (self._trajectory_name,
                                                             other_trajectory_name,
                                                             other_filename))
+            # Parent groups are shared by many items, so we only create or look them up once
+            parent_groups = {}
             for old_name in rename_dict:
                 new_name = rename_dict[old_name]
 
@@ -1690,31 +2107,30 @@ class HDF5StorageService(StorageService, HasLogger):
                 split_name = old_name.split('.')
                 old_location = '/' + other_trajectory_name + '/' + '/'.join(split_name)
 
-                split_name = new_name.split('.')
-                new_parent_location = '/' + self._trajectory_name + '/' + '/'.join(split_name[:-1])
-
-                new_short_name = split_name[-1]
+                new_parent_dot_location, _, new_short_name = new_name.rpartition('.')
+                try:
+                    new_parent = parent_groups[new_parent_dot_location]
+                except KeyError:
+                    new_parent, _ = self._all_create_or_get_groups(new_parent_dot_location)
+                    parent_groups[new_parent_dot_location] = new_parent
 
                 # Get the data from the other trajectory
                 old_node = other_file.get_node(old_location)
 
                 # Now move or copy the data
-                if move_nodes:
-                    self._hdf5file.move_node( where=old_node, newparent=new_parent_location,
-                                       newname=new_short_name, createparents=True)
+                if move_nodes and not other_is_different:
+                    self._hdf5file.move_node(where=old_node, newparent=new_parent,
+                                             newname=new_short_name)
                 else:
-                    if other_is_different:
-                        new_parent_dot_location = '.'.join(split_name[:-1])
-                        new_parent_or_loc, _ = self._all_create_or_get_groups(
-                            new_parent_dot_location)
-                        create_parents = False
-                    else:
-                        new_parent_or_loc = new_parent_location
-                        create_parents = True
-                    self._hdf5file.copy_node(where=old_node, newparent=new_parent_or_loc,
-                                       newname=new_short_name, createparents=create_parents,
-                                       recursive=True)
+                    # Nodes cannot be moved across files, so we copy and remove them
+                    self._hdf5file.copy_node(where=old_node, newparent=new_parent,
+                                             newname=new_short_name, recursive=True)
+                    if move_nodes:
+                        old_node._f_remove(recursive=True)
+                self._all_mark_modified(new_parent._f_get_child(new_short_name))
+                self._metrics.increment('nodes_copied')
 
+            self._trj_merge_overview_tables(other_file, other_trajectory_name, rename_dict)
 
             if delete_trajectory:
                 other_file.remove_node(where='/', name=other_trajectory_name, recursive=True)
@@ -1723,6 +2139,58 @@ class HDF5StorageService(StorageService, HasLogger):
                 other_file.flush()
                 other_file.close()
 
+    def _trj_merge_overview_tables(self, other_file, other_trajectory_name, rename_dict):
+        """Appends the overview table rows of merged items in bulk.
+
+        The rows are read from the overview tables of the other trajectory, only their
+        `location` and `name` columns are renamed according to the `rename_dict`,
+        and all rows are appended to the current overview tables at once.
+
+        """
+        other_overview_location = '/' + other_trajectory_name + '/overview/'
+        for table_name in ('results_overview', 'derived_parameters_overview'):
+            try:
+                table = getattr(self._overview_group, table_name)
+                other_table = other_file.get_node(other_overview_location + table_name)
+            except pt.NoSuchNodeError:
+                continue  # One of the trajectories does not keep this overview table
+
+            capacity = pypetconstants.HDF5_MAX_OVERVIEW_TABLE_LENGTH - table.nrows
+            if capacity <= 0 or other_table.nrows == 0:
+                continue
+
+            other_rows = other_table.read()
+            indices = []
+            locations = []
+            names = []
+            for idx, (location, name) in enumerate(zip(other_rows['location'],
+                                                       other_rows['name'])):
+                old_name = location.decode('utf-8') + '.' + name.decode('utf-8')
+                try:
+                    new_name = rename_dict[old_name]
+                except KeyError:
+                    continue  # The item was not merged
+                new_location, _, new_short_name = new_name.rpartition('.')
+                indices.append(idx)
+                locations.append(new_location.encode('utf-8'))
+                names.append(new_short_name.encode('utf-8'))
+                if len(indices) == capacity:
+                    break
+
+            if not indices:
+                continue
+
+            rows = np.zeros(len(indices), dtype=table.dtype)
+            for colname in table.colnames:
+                if colname in other_table.colnames:
+                    rows[colname] = other_rows[colname][indices]
+            rows['location'] = locations
+            rows['name'] = names
+            table.append(rows)
+            table.flush()
+            self._all_mark_modified(table)
+            self._metrics.increment('table_rows', len(rows))
+
     def _trj_prepare_merge(self, traj, changed_parameters, old_length):
         """Prepares a trajectory for merging.
 
@@ -1760,7 +2228,10 @@ class HDF5StorageService(StorageService, HasLogger):
         # in the result groups
         for idx in range(old_length, len(traj)):
             run_name = traj.f_idx_to_run(idx)
-            run_info = traj.f_get_run_information(run_name)
+            # Run timings are only written if the table has the corresponding columns
+            run_info = dict((key, value) for key, value in
+                            traj.f_get_run_information(run_name).items()
+                            if key in run_table.colnames)
             run_info['name'] = run_name
 
             traj._set_explored_parameters_to_idx(idx)
@@ -1978,6 +2449,7 @@ class HDF5StorageService(StorageService, HasLogger):
             traj._python = python
 
             single_run_table = self._overview_group.runs
+            with_run_timings = 'process_id' in single_run_table.colnames
 
             if with_run_information:
                 for row in single_run_table.iterrows():
@@ -1998,6 +2470,10 @@ class HDF5StorageService(StorageService, HasLogger):
                         runtime = ''
                         finish_timestamp = 0.0
                         self._logger.debug('Could not load runtime, ' + repr(ke))
+                    try:
+                        peak_memory = float(row['peak_memory'])
+                    except (IndexError, ValueError, KeyError):
+                        peak_memory = 0.0
 
                     info_dict = {'idx': idx,
                                  'timestamp': timestamp,
@@ -2007,7 +2483,13 @@ class HDF5StorageService(StorageService, HasLogger):
                                  'completed': completed,
                                  'name': name,
                                  'parameter_summary': summary,
-                                 'short_environment_hexsha': hexsha}
+                                 'short_environment_hexsha': hexsha,
+                                 'peak_memory': peak_memory}
+                    if with_run_timings:
+                        for key in pypetconstants.RUN_TIMINGS:
+                            info_dict[key] = float(row[key])
+                        info_dict['process_id'] = int(row['process_id'])
+                        info_dict['thread_id'] = int(row['thread_id'])
 
                     traj._add_run_info(**info_dict)
             else:
@@ -2046,6 +2528,8 @@ class HDF5StorageService(StorageService, HasLogger):
                                'derived_parameters_per_run', int)
             _extract_meta_data('_purge_duplicate_comments', hdf5_row,
                                'purge_duplicate_comments', bool)
+            if 'run_timings' in hdf5_table.colnames:
+                _extract_meta_data('_run_timings', hdf5_row, 'run_timings', bool)
 
             for attr_name, table_name in self.NAME_TABLE_MAPPING.items():
                 _extract_meta_data(attr_name, hdf5_row, table_name, bool)
@@ -2196,9 +2680,17 @@ class HDF5StorageService(StorageService, HasLogger):
                    info_dict['parameter_summary'],
                    info_dict['short_environment_hexsha'],
                    info_dict['completed'])
+            if with_peak_memory:
+                row += (info_dict.get('peak_memory', 0.0),)
+            if with_run_timings:
+                row += tuple(info_dict.get(key, 0.0) for key in pypetconstants.RUN_TIMINGS)
+                row += (info_dict.get('process_id', 0), info_dict.get('thread_id', 0))
             return row
 
         runtable = getattr(self._overview_group, 'runs')
+        # Tables of older versions lack the memory column
+        with_peak_memory = 'peak_memory' in runtable.colnames
+        with_run_timings = 'process_id' in runtable.colnames
 
         rows = []
         updated_run_information = traj._updated_run_information
@@ -2210,6 +2702,7 @@ class HDF5StorageService(StorageService, HasLogger):
         if rows:
             runtable.append(rows)
             runtable.flush()
+            self._metrics.increment('table_rows', len(rows))
 
         # Store all runs that are updated and that have not been stored yet
         rows = []
@@ -2222,6 +2715,9 @@ class HDF5StorageService(StorageService, HasLogger):
         if rows:
             runtable.modify_coordinates(indices, rows)
 
+        if indices or start < stop:
+            self._all_mark_modified(runtable)
+
         traj._updated_run_information = set()
 
     def _trj_store_meta_data(self, traj):
@@ -2271,7 +2767,15 @@ class HDF5StorageService(StorageService, HasLogger):
                                'finish_timestamp': pt.FloatCol(pos=4),
                                'runtime': pt.StringCol(
                                    pypetconstants.HDF5_STRCOL_MAX_RUNTIME_LENGTH,
-                                   pos=5)}
+                                   pos=5),
+                               'peak_memory': pt.FloatCol(pos=9)}
+        if self._run_timings:
+            pos = 10
+            for key in pypetconstants.RUN_TIMINGS:
+                rundescription_dict[key] = pt.FloatCol(pos=pos)
+                pos += 1
+            rundescription_dict['process_id'] = pt.IntCol(pos=pos)
+            rundescription_dict['thread_id'] = pt.Int64Col(pos=pos + 1)
 
         runtable = self._all_get_or_create_table(where=self._overview_group,
                                                  tablename='runs',
@@ -2292,7 +2796,8 @@ class HDF5StorageService(StorageService, HasLogger):
         # Store the hdf5 properties in an overview table
         hdf5_description_dict.update({'purge_duplicate_comments': pt.BoolCol(pos=pos + 2),
                                       'results_per_run': pt.IntCol(pos=pos + 3),
-                                      'derived_parameters_per_run': pt.IntCol(pos=pos + 4)})
+                                      'derived_parameters_per_run': pt.IntCol(pos=pos + 4),
+                                      'run_timings': pt.BoolCol(pos=pos + 5)})
 
         hdf5table = self._all_get_or_create_table(where=self._overview_group,
                                                   tablename='hdf5_settings',
@@ -2386,6 +2891,8 @@ class HDF5StorageService(StorageService, HasLogger):
             if rows:
                 explorations_table.append(rows)
                 explorations_table.flush()
+                self._metrics.increment('table_rows', len(rows))
+            self._all_mark_modified(explorations_table)
 
     def _srvc_make_overview_tables(self, tables_to_make, traj=None):
         """Creates the overview tables in overview group"""
@@ -2863,9 +3370,10 @@ class HDF5StorageService(StorageService, HasLogger):
                                         with_links=False, recursive=False,
                                         hdf5_group=self._trajectory_group)
             to_link_hdf5_group = self._hdf5file.get_node(where=linking_name)
-        self._hdf5file.create_soft_link(where=hdf5_group,
-                                  name=link,
-                                  target=to_link_hdf5_group)
+        hdf5_link = self._hdf5file.create_soft_link(where=hdf5_group,
+                                                    name=link,
+                                                    target=to_link_hdf5_group)
+        self._all_mark_modified(hdf5_link)
 
     ######################## Storing a Single Run ##########################################
 
@@ -3014,6 +3522,7 @@ class HDF5StorageService(StorageService, HasLogger):
                 table = self._hdf5file.create_table(where=where_node, name=tablename,
                                               description=description, title=tablename,
                                               filters=self._all_get_filters())
+            self._all_mark_modified(table)
         else:
             table = where_node._f_get_child(tablename)
 
@@ -3289,6 +3798,7 @@ class HDF5StorageService(StorageService, HasLogger):
             self._all_insert_into_row(row, insert_dict)
 
             row.append()
+            self._metrics.increment('table_rows')
 
         elif row is not None and HDF5StorageService.MODIFY_ROW in flags:
             # Here we modify an existing row
@@ -3315,6 +3825,7 @@ class HDF5StorageService(StorageService, HasLogger):
 
         self._all_kill_iterator(row_iterator)
         table.flush()
+        self._all_mark_modified(table)
 
         if HDF5StorageService.REMOVE_ROW not in flags and row is None:
             raise RuntimeError('Could not add or modify entries of `%s` in '
@@ -3494,10 +4005,10 @@ class HDF5StorageService(StorageService, HasLogger):
                     if attr_name.startswith(HDF5StorageService.ANNOTATION_PREFIX):
                         delattr(current_attrs, attr_name)
                 delattr(current_attrs, HDF5StorageService.ANNOTATED)
-                self._hdf5file.flush()
+                self._srvc_flush_file()
 
         # Only store annotations if the item has some
-        if not item_with_annotations.v_annotations.f_is_empty():
+        if item_with_annotations._has_annotations():
 
             anno_dict = item_with_annotations.v_annotations._dict
 
@@ -3516,7 +4027,7 @@ class HDF5StorageService(StorageService, HasLogger):
 
             if changed:
                 setattr(current_attrs, HDF5StorageService.ANNOTATED, True)
-                self._hdf5file.flush()
+                self._srvc_flush_file()
 
     def _ann_load_annotations(self, item_with_annotations, node):
         """Loads annotations from disk."""
@@ -3577,7 +4088,8 @@ class HDF5StorageService(StorageService, HasLogger):
                         traj_group.f_get_class_name())
 
             self._ann_store_annotations(traj_group, _hdf5_group, overwrite=overwrite)
-            self._hdf5file.flush()
+            self._all_mark_modified(_hdf5_group)
+            self._srvc_flush_file()
             traj_group._stored = True
 
             # Signal completed node loading
@@ -3623,7 +4135,7 @@ class HDF5StorageService(StorageService, HasLogger):
 
     def _all_load_skeleton(self, traj_node, hdf5_group):
         """Reloads skeleton data of a tree node"""
-        if traj_node.v_annotations.f_is_empty():
+        if not traj_node._has_annotations():
             self._ann_load_annotations(traj_node, hdf5_group)
         if traj_node.v_comment == '':
             comment = self._all_get_from_attrs(hdf5_group, HDF5StorageService.COMMENT)
@@ -3979,6 +4491,7 @@ class HDF5StorageService(StorageService, HasLogger):
                 self._prm_add_meta_info(instance, _hdf5_group,
                                         overwrite=not _newly_created)
 
+            self._all_mark_modified(_hdf5_group)
             instance._stored = True
 
             #self._logger.debug('Finished Storing `%s`.' % fullname)
@@ -4073,7 +4586,7 @@ class HDF5StorageService(StorageService, HasLogger):
             raise RuntimeError('Flag `%s` of hdf5 data `%s` of `%s` not understood' %
                                (flag, key, full_name))
 
-        self._hdf5file.flush()
+        self._srvc_flush_file()
 
     def _prm_write_shared_table(self, key, hdf5_group, fullname, **kwargs):
         """Creates a new empty table"""
@@ -4108,6 +4621,7 @@ class HDF5StorageService(StorageService, HasLogger):
                 row[key] = first_row[key]
 
             row.append()
+            self._metrics.increment('table_rows')
             table.flush()
 
     def _prm_write_dict_as_table(self, key, data_to_store, group, fullname, **kwargs):
@@ -4157,7 +4671,7 @@ class HDF5StorageService(StorageService, HasLogger):
         setattr(new_table._v_attrs, HDF5StorageService.STORAGE_TYPE,
                 HDF5StorageService.DICT)
 
-        self._hdf5file.flush()
+        self._srvc_flush_file()
 
     def _prm_write_pandas_data(self, key, data, group, fullname, flag, **kwargs):
         """Stores a pandas DataFrame into hdf5.
@@ -4207,11 +4721,11 @@ class HDF5StorageService(StorageService, HasLogger):
             name = group._v_pathname + '/' + key
             self._hdf5store.put(name, data, **kwargs)
             self._hdf5store.flush()
-            self._hdf5file.flush()
+            self._srvc_flush_file()
 
             frame_group = group._f_get_child(key)
             setattr(frame_group._v_attrs, HDF5StorageService.STORAGE_TYPE, flag)
-            self._hdf5file.flush()
+            self._srvc_flush_file()
 
         except:
             self._logger.error('Failed storing pandas data `%s` of `%s`.' % (key, fullname))
@@ -4286,7 +4800,7 @@ class HDF5StorageService(StorageService, HasLogger):
                 self._all_set_attributes_to_recall_natives(data, other_array,
                                                        HDF5StorageService.DATA_PREFIX)
             setattr(other_array._v_attrs, HDF5StorageService.STORAGE_TYPE, flag)
-            self._hdf5file.flush()
+            self._srvc_flush_file()
         except:
             self._logger.error('Failed storing %s `%s` of `%s`.' % (flag, key, fullname))
             raise
@@ -4351,7 +4865,7 @@ class HDF5StorageService(StorageService, HasLogger):
                                                            HDF5StorageService.DATA_PREFIX)
             setattr(array._v_attrs, HDF5StorageService.STORAGE_TYPE,
                     HDF5StorageService.ARRAY)
-            self._hdf5file.flush()
+            self._srvc_flush_file()
         except:
             self._logger.error('Failed storing array `%s` of `%s`.' % (key, fullname))
             raise
@@ -4360,6 +4874,7 @@ class HDF5StorageService(StorageService, HasLogger):
         """Removes a link from disk"""
         translated_name = '/' + self._trajectory_name + '/' + link_name.replace('.','/')
         link = self._hdf5file.get_node(where=translated_name)
+        self._all_mark_modified(link, deleted=True)
         link._f_remove()
 
     def _all_delete_parameter_or_result_or_group(self, instance,
@@ -4400,6 +4915,7 @@ class HDF5StorageService(StorageService, HasLogger):
                     raise TypeError('You cannot remove the group `%s`, it has children, please '
                                     'use `recursive=True` to enforce removal.' %
                                     instance.v_full_name)
+            self._all_mark_modified(_hdf5_group, deleted=True)
             _hdf5_group._f_remove(recursive=True)
         else:
             if not instance.v_is_leaf:
@@ -4421,6 +4937,7 @@ class HDF5StorageService(StorageService, HasLogger):
                 except pt.NoSuchNodeError:
                     self._logger.warning('Could not delete `%s` from `%s`. HDF5 node not found!' %
                                          (delete_item, instance.v_full_name))
+            self._all_mark_modified(_hdf5_group)
 
     def _prm_write_into_pytable(self, tablename, data, hdf5_group, fullname, **kwargs):
         """Stores data as pytable.
@@ -4496,6 +5013,7 @@ class HDF5StorageService(StorageService, HasLogger):
                         row[key] = data[key][n]
 
                     row.append()
+                    self._metrics.increment('table_rows')
 
                 # Remember the original types of the data for perfect recall
                 if idx == 0 and len(description_dict) <= ptpa.MAX_COLUMNS:
@@ -4509,7 +5027,7 @@ class HDF5StorageService(StorageService, HasLogger):
                             HDF5StorageService.TABLE)
 
                 table.flush()
-                self._hdf5file.flush()
+                self._srvc_flush_file()
 
             if len(description_dict) > ptpa.MAX_COLUMNS:
                 # We have potentially many split tables and the data types are
@@ -4534,11 +5052,12 @@ class HDF5StorageService(StorageService, HasLogger):
                         row[key] = data_type_table_dict[key][n]
 
                     row.append()
+                    self._metrics.increment('table_rows')
 
                 setattr(table._v_attrs, HDF5StorageService.DATATYPE_TABLE, 1)
 
                 table.flush()
-                self._hdf5file.flush()
+                self._srvc_flush_file()
 
         except:
             self._logger.error('Failed storing table `%s` of `%s`.' % (tablename, fullname))
@@ -5073,6 +5592,8 @@ class HDF5StorageService(StorageService, HasLogger):
     def _hdf5_interact_with_data(self, path_to_data, item_name, request, args, kwargs):
 
         hdf5_group = self._all_get_node_by_name(path_to_data)
+        if request not in HDF5StorageService._READ_ONLY_REQUESTS:
+            self._all_mark_modified(hdf5_group)
 
         if request == 'create_shared_data' or request == 'pandas_put':
             return self._shared_write_shared_data(key=item_name, hdf5_group=hdf5_group,
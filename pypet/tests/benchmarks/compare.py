@@ -0,0 +1,110 @@
+"""Compares two benchmark result files and flags regressions.
+
+Usage::
+
+    python -m pypet.tests.benchmarks.compare old.json new.json
+
+Options:
+
+    ``--threshold``    Relative slow down of the median time that counts as regression
+                       (default 0.2, i.e. 20%)
+    ``--min-seconds``  Absolute slow down below which differences are considered noise
+                       (default 0.01)
+
+The exit code is 1 if any benchmark regressed, so the comparison can be used in scripts.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import sys
+import json
+import getopt
+
+
+def load_results(filename):
+    """Loads a result file written by :mod:`pypet.tests.benchmarks.run_benchmarks`"""
+    with open(filename) as fh:
+        return json.load(fh)
+
+
+def compare(old, new, threshold=0.2, min_seconds=0.01):
+    """Compares the median times of all benchmarks contained in both `old` and `new`.
+
+    :return:
+
+        List of dictionaries with the `key` of the benchmark, the `old` and `new` median,
+        their `ratio`, and the `status` which is either ``'regression'``,
+        ``'improvement'``, or ``'unchanged'``. Benchmarks present in only one of
+        the results have the status ``'new'`` or ``'removed'``.
+
+    """
+    old_results = dict((result['key'], result) for result in old['results'])
+    new_results = dict((result['key'], result) for result in new['results'])
+    comparisons = []
+    for key in sorted(set(old_results.keys()) | set(new_results.keys())):
+        if key not in old_results:
+            comparisons.append(dict(key=key, old=None, new=new_results[key]['median'],
+                                    ratio=None, status='new'))
+            continue
+        if key not in new_results:
+            comparisons.append(dict(key=key, old=old_results[key]['median'], new=None,
+                                    ratio=None, status='removed'))
+            continue
+        old_time = old_results[key]['median']
+        new_time = new_results[key]['median']
+        ratio = new_time / old_time if old_time > 0 else float('inf')
+        if abs(new_time - old_time) < min_seconds:
+            status = 'unchanged'
+        elif ratio > 1.0 + threshold:
+            status = 'regression'
+        elif ratio < 1.0 / (1.0 + threshold):
+            status = 'improvement'
+        else:
+            status = 'unchanged'
+        comparisons.append(dict(key=key, old=old_time, new=new_time, ratio=ratio,
+                                status=status))
+    return comparisons
+
+
+def format_comparison(comparisons, old_meta=None, new_meta=None):
+    """Formats the comparisons as a table"""
+    lines = []
+    if old_meta is not None and new_meta is not None:
+        lines.append('Comparing `%s` (old) with `%s` (new)' % (old_meta.get('git_commit'),
+                                                             new_meta.get('git_commit')))
+    for comparison in comparisons:
+        if comparison['ratio'] is None:
+            lines.append('%-60s %s' % (comparison['key'], comparison['status'].upper()))
+        else:
+            lines.append('%-60s %10.4fs -> %10.4fs  x%6.2f  %s' %
+                         (comparison['key'], comparison['old'], comparison['new'],
+                          comparison['ratio'], comparison['status'].upper()))
+    regressions = [x for x in comparisons if x['status'] == 'regression']
+    lines.append('%d regressions in %d benchmarks' % (len(regressions), len(comparisons)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    opts, args = getopt.getopt(argv, '', ['threshold=', 'min-seconds='])
+    if len(args) != 2:
+        sys.stderr.write('Usage: compare.py [--threshold=0.2] [--min-seconds=0.01] '
+                         'old.json new.json\n')
+        return 2
+    kwargs = {}
+    for opt, arg in opts:
+        if opt == '--threshold':
+            kwargs['threshold'] = float(arg)
+        elif opt == '--min-seconds':
+            kwargs['min_seconds'] = float(arg)
+    old = load_results(args[0])
+    new = load_results(args[1])
+    comparisons = compare(old, new, **kwargs)
+    sys.stdout.write(format_comparison(comparisons, old['meta'], new['meta']) + '\n')
+    return int(any(x['status'] == 'regression' for x in comparisons))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Runs the benchmark scenarios and writes the timings to a JSON file.
+
+Usage::
+
+    python -m pypet.tests.benchmarks.run_benchmarks --output=results.json
+
+Options:
+
+    ``--output``   JSON file the results are written to (default ``benchmarks.json``)
+    ``--repeat``   How often every benchmark is repeated (default 3)
+    ``--select``   Comma separated names of scenarios to run, e.g. ``store,load``
+    ``--quick``    Runs the small scenarios only to check that the suite works
+    ``--folder``   Folder for temporary files, by default a new temporary directory
+    ``--keep``     Does not remove the temporary files
+
+Compare two result files with :mod:`pypet.tests.benchmarks.compare`.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import platform
+import tempfile
+import subprocess
+
+import pypet
+from pypet.tests.benchmarks.scenarios import SCENARIOS, QUICK_SCENARIOS
+
+
+def benchmark_key(name, params):
+    """Unique name of a benchmark, e.g. ``'run[mode=queue,n_runs=100]'``"""
+    return '%s[%s]' % (name, ','.join('%s=%s' % (key, str(params[key]))
+                                      for key in sorted(params.keys())))
+
+
+def get_git_commit():
+    """Returns the SHA1 of the currently checked out commit of pypet or `None`"""
+    folder = os.path.dirname(os.path.abspath(pypet.__file__))
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=folder,
+                                             stderr=devnull)
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_meta_data(repeat):
+    """Information about the machine and the code that is benchmarked"""
+    return dict(pypet_version=pypet.__version__,
+                git_commit=get_git_commit(),
+                python_version=platform.python_version(),
+                platform=platform.platform(),
+                cpu_count=os.cpu_count(),
+                timestamp=time.time(),
+                repeat=repeat)
+
+
+def run_benchmark(function, params, repeat, folder):
+    """Runs `function` `repeat` times, each time in a fresh sub-folder of `folder`.
+
+    :return: List of measured times in seconds
+
+    """
+    times = []
+    for irun in range(repeat):
+        run_folder = tempfile.mkdtemp(dir=folder)
+        try:
+            times.append(function(run_folder, **params))
+        finally:
+            shutil.rmtree(run_folder, ignore_errors=True)
+    return times
+
+
+def summarize(times):
+    """Minimum, median, and mean of a list of times"""
+    ordered = sorted(times)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        median = ordered[middle]
+    else:
+        median = (ordered[middle - 1] + ordered[middle]) / 2.0
+    return dict(min=ordered[0], median=median, mean=sum(ordered) / len(ordered))
+
+
+def run_benchmarks(scenarios=None, repeat=3, select=None, folder=None, keep=False,
+                   report=None):
+    """Runs all benchmarks of the `scenarios`.
+
+    :param scenarios: Ordered dictionary of scenarios, by default all scenarios
+
+    :param repeat: How often a single benchmark is repeated
+
+    :param select: Names of the scenarios to run, `None` for all
+
+    :param folder: Folder for temporary files, `None` creates a temporary directory
+
+    :param keep: If temporary files should be kept
+
+    :param report: Function called with every finished result, e.g. to print progress
+
+    :return: Dictionary with the meta data and a list of results
+
+    """
+    if scenarios is None:
+        scenarios = SCENARIOS
+    if select is not None:
+        unknown = set(select) - set(scenarios.keys())
+        if unknown:
+            raise ValueError('Unknown scenarios: `%s`' % ', '.join(sorted(unknown)))
+    created = folder is None
+    if created:
+        folder = tempfile.mkdtemp(prefix='pypet_benchmarks_')
+    elif not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    results = []
+    try:
+        for name, (function, param_grid) in scenarios.items():
+            if select is not None and name not in select:
+                continue
+            for params in param_grid:
+                times = run_benchmark(function, params, repeat, folder)
+                result = dict(key=benchmark_key(name, params), scenario=name,
+                              params=dict(params), times=times)
+                result.update(summarize(times))
+                results.append(result)
+                if report is not None:
+                    report(result)
+    finally:
+        if created and not keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return dict(meta=get_meta_data(repeat), results=results)
+
+
+def write_results(benchmarks, filename):
+    """Writes the results of `run_benchmarks` as JSON"""
+    with open(filename, 'w') as fh:
+        json.dump(benchmarks, fh, indent=2, sort_keys=True)
+
+
+def _print_result(result):
+    sys.stdout.write('%-60s median %10.4fs  min %10.4fs\n' % (result['key'], result['median'],
+                                                              result['min']))
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    opts, args = getopt.getopt(argv, '', ['output=', 'repeat=', 'select=', 'quick',
+                                          'folder=', 'keep'])
+    output = 'benchmarks.json'
+    kwargs = dict(scenarios=SCENARIOS, report=_print_result)
+    for opt, arg in opts:
+        if opt == '--output':
+            output = arg
+        elif opt == '--repeat':
+            kwargs['repeat'] = int(arg)
+        elif opt == '--select':
+            kwargs['select'] = arg.split(',')
+        elif opt == '--quick':
+            kwargs['scenarios'] = QUICK_SCENARIOS
+        elif opt == '--folder':
+            kwargs['folder'] = arg
+        elif opt == '--keep':
+            kwargs['keep'] = True
+
+    benchmarks = run_benchmarks(**kwargs)
+    write_results(benchmarks, output)
+    sys.stdout.write('Wrote %d results to `%s`.\n' % (len(benchmarks['results']), output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Benchmark scenarios of the storage, loading, exploration, merging and multiprocessing paths.
+
+Every scenario is a function that takes a temporary folder and its parameters,
+prepares everything it needs in that folder, and returns the seconds spent in the
+measured part only. Memory scenarios return the megabytes allocated in the
+measured part instead. In both cases smaller numbers are better. The parameter grids of the scenarios are defined in
+:const:`~pypet.tests.benchmarks.scenarios.SCENARIOS` and smaller grids for a
+quick check in :const:`~pypet.tests.benchmarks.scenarios.QUICK_SCENARIOS`.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import os
+import time
+import tracemalloc
+import itertools as itools
+from collections import OrderedDict
+
+import numpy as np
+try:
+    import zmq
+except ImportError:
+    zmq = None
+try:
+    import scoop
+except ImportError:
+    scoop = None
+
+import pypet.pypetconstants as pypetconstants
+from pypet import Environment, Trajectory, load_trajectory, cartesian_product
+from pypet.utils.helpful_functions import port_to_tcp
+
+
+def _add_results(traj, n_results, result_size, tree_width, prefix='results'):
+    """Adds `n_results` arrays of `result_size` spread over `tree_width` groups"""
+    for idx in range(n_results):
+        traj.f_add_leaf('%s.group_%d.result_%d' % (prefix, idx % tree_width, idx),
+                        np.random.rand(result_size))
+
+
+def _make_env(folder, name, **kwargs):
+    """Creates an environment that stores into a new file in `folder` and does not log"""
+    filename = os.path.join(folder, '%s.hdf5' % name)
+    return Environment(trajectory=name, filename=filename, add_time=False,
+                       overwrite_file=True, log_config=None, log_stdout=False,
+                       report_progress=False, **kwargs)
+
+
+def _job(traj, result_size):
+    """Job of single runs adding a single result array"""
+    traj.f_add_result('$.z', np.ones(result_size) * traj.x)
+    return traj.x
+
+
+def _run_trajectory(folder, name, n_runs, result_size, start=0, **kwargs):
+    """Runs a trajectory with `n_runs` runs and returns its filename"""
+    env = _make_env(folder, name, **kwargs)
+    traj = env.traj
+    traj.f_add_parameter('x', 0)
+    traj.f_explore({'x': list(range(start, start + n_runs))})
+    env.run(_job, result_size)
+    env.disable_logging()
+    return env.traj.v_storage_service.filename
+
+
+def bench_store(folder, n_results, result_size, tree_width):
+    """Stores a trajectory with `n_results` results"""
+    traj = Trajectory(name='store', filename=os.path.join(folder, 'store.hdf5'),
+                      add_time=False)
+    _add_results(traj, n_results, result_size, tree_width)
+    start = time.time()
+    traj.f_store()
+    return time.time() - start
+
+
+def bench_load(folder, n_runs, result_size, with_run_information):
+    """Loads all data of a trajectory with or without the run information"""
+    filename = _run_trajectory(folder, 'load', n_runs, result_size)
+    start = time.time()
+    load_trajectory(name='load', filename=filename, load_all=pypetconstants.LOAD_DATA,
+                    with_run_information=with_run_information)
+    return time.time() - start
+
+
+def bench_skeleton_memory(folder, n_results, tree_width):
+    """Megabytes needed to hold the skeleton of a trajectory with `n_results` results"""
+    traj = Trajectory(name='memory', filename=os.path.join(folder, 'memory.hdf5'),
+                      add_time=False)
+    _add_results(traj, n_results, 1, tree_width)
+    traj.f_store()
+    del traj
+    tracemalloc.start()
+    try:
+        traj = load_trajectory(name='memory', filename=os.path.join(folder, 'memory.hdf5'),
+                               load_all=pypetconstants.LOAD_SKELETON)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current / 1024.0 ** 2
+
+
+def bench_explore(folder, n_runs, n_parameters):
+    """Explores the cartesian product of `n_parameters` with about `n_runs` runs in total"""
+    traj = Trajectory(name='explore', filename=os.path.join(folder, 'explore.hdf5'),
+                      add_time=False)
+    length = max(int(round(n_runs ** (1.0 / n_parameters))), 1)
+    explore_dict = OrderedDict()
+    for idx in range(n_parameters):
+        traj.f_add_parameter('p%d' % idx, 0)
+        explore_dict['p%d' % idx] = list(range(length))
+    start = time.time()
+    traj.f_explore(cartesian_product(explore_dict))
+    return time.time() - start
+
+
+def bench_merge(folder, n_trajectories, n_runs, result_size):
+    """Merges `n_trajectories` trajectories of `n_runs` runs each"""
+    filenames = [_run_trajectory(folder, 'merge_%d' % idx, n_runs, result_size,
+                                 start=idx * n_runs)
+                 for idx in range(n_trajectories)]
+    trajs = [load_trajectory(name='merge_%d' % idx, filename=filename)
+             for idx, filename in enumerate(filenames)]
+    start = time.time()
+    trajs[0].f_merge_many(trajs[1:], backup=False)
+    return time.time() - start
+
+
+def _run_modes():
+    """The multiprocessing modes available in the current environment"""
+    modes = OrderedDict()
+    modes['serial'] = {}
+    modes['threads'] = dict(use_threads=True, ncores=2)
+    for wrap_mode in (pypetconstants.WRAP_MODE_LOCK, pypetconstants.WRAP_MODE_QUEUE,
+                      pypetconstants.WRAP_MODE_PIPE):
+        name = wrap_mode.lower()
+        modes[name] = dict(multiproc=True, ncores=2, wrap_mode=wrap_mode)
+        modes[name + '_pool'] = dict(multiproc=True, ncores=2, wrap_mode=wrap_mode,
+                                     use_pool=True)
+        modes[name + '_frozen_pool'] = dict(multiproc=True, ncores=2, wrap_mode=wrap_mode,
+                                            use_pool=True, freeze_input=True)
+    modes['local_pool'] = dict(multiproc=True, ncores=2, use_pool=True,
+                               wrap_mode=pypetconstants.WRAP_MODE_LOCAL)
+    if zmq is not None:
+        modes['netlock'] = dict(multiproc=True, ncores=2,
+                                wrap_mode=pypetconstants.WRAP_MODE_NETLOCK)
+        modes['netqueue'] = dict(multiproc=True, ncores=2,
+                                 wrap_mode=pypetconstants.WRAP_MODE_NETQUEUE)
+    if scoop is not None and scoop.IS_RUNNING:
+        modes['scoop'] = dict(multiproc=True, use_scoop=True,
+                              wrap_mode=pypetconstants.WRAP_MODE_LOCAL)
+    return modes
+
+
+RUN_MODES = _run_modes()
+"""Keyword arguments of the environment for every available multiprocessing mode"""
+
+
+def bench_run(folder, mode, n_runs, result_size):
+    """Runs `n_runs` single runs in the multiprocessing `mode`"""
+    kwargs = RUN_MODES[mode].copy()
+    if kwargs.get('wrap_mode') in (pypetconstants.WRAP_MODE_NETLOCK,
+                                   pypetconstants.WRAP_MODE_NETQUEUE):
+        kwargs['port'] = port_to_tcp()
+    env = _make_env(folder, 'run_%s' % mode, **kwargs)
+    traj = env.traj
+    traj.f_add_parameter('x', 0)
+    traj.f_explore({'x': list(range(n_runs))})
+    start = time.time()
+    env.run(_job, result_size)
+    elapsed = time.time() - start
+    env.disable_logging()
+    return elapsed
+
+
+def grid(**kwargs):
+    """Returns the list of all combinations of the given parameter values"""
+    names = sorted(kwargs.keys())
+    return [OrderedDict(zip(names, values))
+            for values in itools.product(*[kwargs[name] for name in names])]
+
+
+SCENARIOS = OrderedDict([
+    ('store', (bench_store, grid(n_results=[100, 1000], result_size=[10, 10000],
+                                 tree_width=[1, 100]))),
+    ('load', (bench_load, grid(n_runs=[100, 1000], result_size=[10],
+                               with_run_information=[True, False]))),
+    ('skeleton_memory', (bench_skeleton_memory, grid(n_results=[10000, 100000],
+                                                     tree_width=[100]))),
+    ('explore', (bench_explore, grid(n_runs=[1000, 100000], n_parameters=[1, 3]))),
+    ('merge', (bench_merge, grid(n_trajectories=[2, 8], n_runs=[50], result_size=[10]))),
+    ('run', (bench_run, grid(mode=list(RUN_MODES.keys()), n_runs=[100],
+                             result_size=[10, 10000]))),
+])
+"""Scenarios with their benchmark function and parameter grid"""
+
+
+QUICK_SCENARIOS = OrderedDict([
+    ('store', (bench_store, grid(n_results=[20], result_size=[10], tree_width=[1, 10]))),
+    ('load', (bench_load, grid(n_runs=[5], result_size=[10],
+                               with_run_information=[True, False]))),
+    ('skeleton_memory', (bench_skeleton_memory, grid(n_results=[100], tree_width=[10]))),
+    ('explore', (bench_explore, grid(n_runs=[100], n_parameters=[1, 2]))),
+    ('merge', (bench_merge, grid(n_trajectories=[2], n_runs=[3], result_size=[10]))),
+    ('run', (bench_run, grid(mode=['serial', 'lock', 'queue'], n_runs=[4],
+                             result_size=[10]))),
+])
+"""Small versions of the scenarios to quickly check that the suite works"""
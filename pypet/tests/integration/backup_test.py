@@ -0,0 +1,163 @@
+__author__ = 'Robert Meyer'
+
+import os
+
+import numpy as np
+import tables as pt
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Trajectory, load_trajectory
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+class DifferentialBackupTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'backup'
+
+    def setUp(self):
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'differential_backup.hdf5'))
+        self.backup_filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                          'differential_backup_bkp.hdf5'))
+        if os.path.isfile(self.backup_filename):
+            os.remove(self.backup_filename)
+        self.traj = Trajectory(name=make_trajectory_name(self), filename=self.filename,
+                               overwrite_file=True)
+        self.traj.f_add_parameter('x', 1)
+        for irun in range(20):
+            self.traj.f_add_result('data.r%d' % irun, np.arange(100) * irun)
+        self.traj.f_store()
+
+    def load(self, filename):
+        return load_trajectory(name=self.traj.v_name, filename=filename, load_all=2)
+
+    def test_backup_only_copies_modifications(self):
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        self.traj.v_storage_service.pop_metrics()
+
+        self.traj.f_add_result('data.new', 42)
+        self.traj.f_store_item('data.new')
+        self.traj.f_get('data.r3').f_empty()
+        self.traj.f_get('data.r3').f_set(np.ones(5))
+        self.traj.f_store_item('data.r3', overwrite=True)
+        self.traj.f_delete_item('data.r5', remove_from_trajectory=True)
+        self.traj.f_backup(backup_filename=self.backup_filename)
+
+        metrics = self.traj.v_storage_service.pop_metrics()
+        # Only the three modified leaves and the modified overview tables are visited
+        self.assertLess(metrics.counters['nodes_copied'], 10)
+
+        backup = self.load(self.backup_filename)
+        self.compare_trajectories(backup, self.load(self.filename))
+        self.assertEqual(backup.f_get('data.new', fast_access=True), 42)
+        self.assertTrue(np.all(backup.f_get('data.r3', fast_access=True) == np.ones(5)))
+        self.assertNotIn('data.r5', backup)
+
+    def test_unmodified_trajectory_copies_nothing(self):
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        self.traj.v_storage_service.pop_metrics()
+
+        self.traj.f_backup(backup_filename=self.backup_filename)
+
+        metrics = self.traj.v_storage_service.pop_metrics()
+        self.assertEqual(metrics.counters['nodes_copied'], 0)
+        self.compare_trajectories(self.load(self.backup_filename), self.load(self.filename))
+
+    def test_full_backup_refused_if_not_differential(self):
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        with self.assertRaises(ValueError):
+            self.traj.f_backup(backup_filename=self.backup_filename, differential=False)
+
+    def test_restore(self):
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        original = self.load(self.filename)
+
+        self.traj.f_add_result('data.new', 42)
+        self.traj.f_store_item('data.new')
+        self.traj.f_get('data.r3').f_empty()
+        self.traj.f_get('data.r3').f_set(np.ones(5))
+        self.traj.f_store_item('data.r3', overwrite=True)
+        self.traj.f_delete_item('data.r5', remove_from_trajectory=True)
+
+        self.traj.f_restore_backup(backup_filename=self.backup_filename)
+
+        restored = self.load(self.filename)
+        self.compare_trajectories(restored, original)
+        self.assertNotIn('data.new', restored)
+
+        # Restoring counts as a modification for the next backup
+        with pt.open_file(self.filename, mode='r') as hdf5file:
+            traj_group = hdf5file.get_node('/' + self.traj.v_name)
+            generation = traj_group._v_attrs.SRVC_BACKUP_GENERATION
+            journal = hdf5file.get_node('/%s/overview/backup_journal' % self.traj.v_name)
+            paths = [row['path'].decode('utf-8') for row in journal.iterrows()
+                     if row['generation'] == generation]
+            self.assertIn('/%s/results/data/r3' % self.traj.v_name, paths)
+
+    def journal_rows(self):
+        with pt.open_file(self.filename, mode='r') as hdf5file:
+            path = '/%s/overview/backup_journal' % self.traj.v_name
+            if path not in hdf5file:
+                return []
+            return [(row['path'].decode('utf-8'), row['generation'])
+                    for row in hdf5file.get_node(path).iterrows()]
+
+    def test_journal_only_after_backup(self):
+        self.traj.f_add_result('data.new', 42)
+        self.traj.f_store_item('data.new')
+        self.assertEqual(self.journal_rows(), [])
+
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        self.traj.f_add_result('data.newer', 43)
+        self.traj.f_store_item('data.newer')
+        rows = self.journal_rows()
+        self.assertIn('/%s/results/data/newer' % self.traj.v_name, [row[0] for row in rows])
+
+        # Entries are dropped once they are part of a backup
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        self.assertEqual(self.journal_rows(), [])
+        self.traj.f_add_result('data.newest', 44)
+        self.traj.f_store_item('data.newest')
+        generations = set(row[1] for row in self.journal_rows())
+        self.assertEqual(generations, set([2]))
+
+    def test_older_backups_are_copied_as_a_whole(self):
+        other_backup_filename = self.backup_filename.replace('.hdf5', '_other.hdf5')
+        if os.path.isfile(other_backup_filename):
+            os.remove(other_backup_filename)
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        self.traj.f_add_result('data.new', 42)
+        self.traj.f_store_item('data.new')
+        self.traj.f_backup(backup_filename=other_backup_filename)
+        self.traj.f_delete_item('data.r5', remove_from_trajectory=True)
+
+        # The journal no longer lists `data.new` that is missing in the older backup
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        self.compare_trajectories(self.load(self.backup_filename), self.load(self.filename))
+
+        self.traj.f_restore_backup(backup_filename=other_backup_filename)
+        restored = self.load(self.filename)
+        self.compare_trajectories(restored, self.load(other_backup_filename))
+        self.assertIn('data.r5', restored)
+
+    def test_long_paths(self):
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        location = '.'.join('g%d%s' % (irun, 'x' * 100) for irun in range(8))
+        self.traj.f_add_result('data.%s.deep' % location, 42)
+        self.traj.f_store()
+        self.traj.f_backup(backup_filename=self.backup_filename)
+
+        # Only the leaf with a path longer than the journal allows is modified
+        self.traj.f_get('data.%s.deep' % location).f_empty()
+        self.traj.f_get('data.%s.deep' % location).f_set(43)
+        self.traj.f_store_item('data.%s.deep' % location, overwrite=True)
+        self.traj.f_backup(backup_filename=self.backup_filename)
+        backup = self.load(self.backup_filename)
+        self.assertEqual(backup.f_get('data.%s.deep' % location, fast_access=True), 43)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
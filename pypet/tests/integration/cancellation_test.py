@@ -0,0 +1,143 @@
+__author__ = 'Robert Meyer'
+
+import os
+import time
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def patient_multiply(traj):
+    if traj.v_idx == 0:
+        # Run 0 waits until it is cancelled
+        deadline = time.time() + 30.0
+        while not traj.f_is_cancelled() and time.time() < deadline:
+            time.sleep(0.01)
+        traj.f_add_result('cancelled', traj.f_is_cancelled())
+        return None
+    elif traj.v_idx == 2:
+        time.sleep(0.5)
+    z = traj.x * 10
+    traj.f_add_result('z', z)
+    return z
+
+
+def multiply(traj):
+    z = traj.x * 10
+    traj.f_add_result('z', z)
+    traj.f_add_result('cancelled', traj.f_is_cancelled())
+    return z
+
+
+def cancel_after_run_1(traj, result, env):
+    if result[0] == 1:
+        env.cancel_runs([0, 3])
+
+
+class CancellationTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'cancellation'
+
+    def set_mode(self):
+        self.kwargs = {}
+
+    def setUp(self):
+        self.set_mode()
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'cancellation.hdf5'))
+
+    def make_env(self, **kwargs):
+        kwargs.update(self.kwargs)
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': [0, 1, 2, 3, 4]})
+        return env, traj
+
+    def check_completed(self, traj, cancelled):
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        for idx in range(len(traj)):
+            completed = traj.f_get_run_information(idx)['completed']
+            if idx in cancelled:
+                self.assertEqual(completed, pypetconstants.RUN_CANCELLED)
+            else:
+                self.assertEqual(completed, pypetconstants.RUN_COMPLETED)
+                traj.v_idx = idx
+                self.assertEqual(traj.crun.z, traj.x * 10)
+        return traj
+
+    def test_cancel_pending_runs(self):
+        env, traj = self.make_env()
+        env.cancel_runs([1, 3])
+        results = env.run(multiply)
+        env.disable_logging()
+        self.assertEqual([x[0] for x in results], [0, 2, 4])
+        traj = self.check_completed(traj, (1, 3))
+        for idx in (0, 2, 4):
+            traj.v_idx = idx
+            self.assertFalse(traj.crun.cancelled)
+
+    def test_cancel_running_run(self):
+        if not self.kwargs:
+            return  # A single process cannot cancel its current run
+        env, traj = self.make_env()
+        env.add_result_hook(cancel_after_run_1, env)
+        results = env.run(patient_multiply)
+        env.disable_logging()
+        self.assertEqual(sorted(x[0] for x in results), [0, 1, 2, 4])
+        self.assertEqual(dict(results)[0], None)
+        traj = self.check_completed(traj, (0, 3))
+        traj.v_idx = 0
+        self.assertTrue(traj.crun.cancelled)
+
+    def test_resume_keeps_cancellations(self):
+        if self.kwargs.get('wrap_mode') == pypetconstants.WRAP_MODE_QUEUE:
+            return  # Resuming is not supported by the queue wrap mode
+        resume_folder = make_temp_dir(os.path.join('experiments', 'tests', 'resume_cancel'))
+        env, traj = self.make_env(resumable=True, resume_folder=resume_folder,
+                                  delete_resume=False)
+        env.add_result_hook(lambda traj, result: ((), [3]) if result[0] == 0 else None)
+        results = env.run(multiply)
+        self.assertEqual(sorted(x[0] for x in results), [0, 1, 2, 4])
+
+        results = env.resume(trajectory_name=traj.v_name, resume_folder=resume_folder)
+        env.disable_logging()
+        self.assertEqual(sorted(x[0] for x in results), [0, 1, 2, 4])
+        self.check_completed(traj, (3,))
+
+
+class CancellationMultiprocTest(CancellationTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'cancellation', 'multiproc', 'nopool'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2)
+
+
+class CancellationMultiprocQueueTest(CancellationTest):
+
+    tags = ('integration', 'hdf5', 'environment', 'cancellation', 'multiproc', 'nopool',
+            'queue')
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, wrap_mode=pypetconstants.WRAP_MODE_QUEUE)
+
+
+class CancellationThreadsTest(CancellationTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'cancellation', 'threads'
+
+    def set_mode(self):
+        self.kwargs = dict(use_threads=True, ncores=2)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
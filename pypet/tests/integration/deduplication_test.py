@@ -0,0 +1,163 @@
+__author__ = 'Robert Meyer'
+
+import os
+import time
+
+import numpy as np
+try:
+    import dill
+except ImportError:
+    dill = None
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, cartesian_product, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def multiply(traj):
+    z = traj.x * traj.y
+    traj.f_add_result('z', z)
+    traj.f_add_result('deep.group.arr', np.ones(3) * z)
+    traj.f_add_derived_parameter('dz', z + 1)
+    return z
+
+
+EXECUTED = []
+
+
+def counting_multiply(traj):
+    EXECUTED.append(traj.v_idx)
+    return multiply(traj)
+
+
+class DeduplicationTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'deduplication'
+
+    def setUp(self):
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'dedup.hdf5'))
+        self.executed = EXECUTED
+        del self.executed[:]
+
+    def make_env(self, **kwargs):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          deduplicate_runs=True,
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_add_parameter('y', 1)
+        traj.f_add_parameter('seed', 42)
+        traj.f_explore({'x': [1, 2, 1, 2, 3, 1],
+                        'y': [3, 4, 3, 4, 5, 3],
+                        'seed': [1, 2, 3, 4, 5, 6]})
+        return env, traj
+
+    def check_data(self, traj, results):
+        self.assertEqual([x[0] for x in results], list(range(len(traj))))
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        for idx, run_name in enumerate(traj.f_get_run_names()):
+            traj.v_crun = run_name
+            z = traj.x * traj.y
+            self.assertEqual(results[idx][1], z)
+            self.assertEqual(traj.results.runs.crun.z, z)
+            self.assertTrue(np.all(traj.results.runs.crun.deep.group.arr == np.ones(3) * z))
+            self.assertEqual(traj.derived_parameters.runs.crun.dz, z + 1)
+            run_information = traj.f_get_run_information(run_name)
+            self.assertTrue(run_information['completed'])
+            self.assertIn('seed: %d' % traj.seed, run_information['parameter_summary'])
+        return traj
+
+    def test_link_mode(self):
+        env, traj = self.make_env(deduplicate_exclude=['seed'])
+        results = env.run(counting_multiply)
+        env.disable_logging()
+        self.assertEqual(self.executed, [0, 1, 4])
+        traj = self.check_data(traj, results)
+        self.assertIn('run_00000002', traj.results.runs._links)
+
+    def test_copy_mode(self):
+        env, traj = self.make_env(deduplicate_exclude=['seed'], deduplicate_mode='copy')
+        results = env.run(counting_multiply)
+        env.disable_logging()
+        self.assertEqual(self.executed, [0, 1, 4])
+        traj = self.check_data(traj, results)
+        self.assertNotIn('run_00000002', traj.results.runs._links)
+
+    def test_seed_not_excluded(self):
+        env, traj = self.make_env()
+        env.run(counting_multiply)
+        env.disable_logging()
+        self.assertEqual(self.executed, list(range(6)))
+
+    def test_multiproc(self):
+        env, traj = self.make_env(deduplicate_exclude=['seed'], multiproc=True, ncores=2,
+                                  use_pool=True)
+        results = env.run(multiply)
+        env.disable_logging()
+        self.check_data(traj, results)
+
+    def test_expanding_result_hook_with_pending_runs(self):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          deduplicate_runs=True,
+                          use_threads=True, ncores=2)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': [1, 2, 1, 2]})
+
+        def slow_representative(traj):
+            # Run 1 is still running when the trajectory is expanded
+            time.sleep(1.0 if traj.v_idx == 1 else 0.01)
+            self.executed.append(traj.v_idx)
+            z = traj.x * 10
+            traj.f_add_result('z', z)
+            return z
+
+        def expand(traj, result):
+            if result[0] == 0 and len(traj) == 4:
+                return {'x': [5, 5, 6]}
+
+        env.add_result_hook(expand)
+        results = env.run(slow_representative)
+        env.disable_logging()
+
+        self.assertEqual(sorted(self.executed), [0, 1, 4, 6])
+        self.assertEqual(sorted(x[0] for x in results), list(range(7)))
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        for idx in range(7):
+            self.assertTrue(traj.f_get_run_information(idx)['completed'])
+            traj.v_idx = idx
+            self.assertEqual(traj.crun.z, traj.x * 10)
+
+    @unittest.skipIf(dill is None, 'Only makes sense if dill is installed')
+    def test_resume_does_not_repeat_duplicates(self):
+        resume_folder = make_temp_dir(os.path.join('experiments', 'tests', 'resume_dedup'))
+        env, traj = self.make_env(deduplicate_exclude=['seed'], resumable=True,
+                                  resume_folder=resume_folder, delete_resume=False)
+        env.run(counting_multiply)
+        self.assertEqual(self.executed, [0, 1, 4])
+
+        # All duplicates are journaled and considered finished when resuming
+        results = env.resume(trajectory_name=traj.v_name, resume_folder=resume_folder)
+        env.disable_logging()
+        self.assertEqual(self.executed, [0, 1, 4])
+        self.check_data(traj, results)
+
+    def test_wrong_settings(self):
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, deduplicate_runs=True, automatic_storing=False)
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, deduplicate_mode='hardlink')
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
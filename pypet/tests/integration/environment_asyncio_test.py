@@ -0,0 +1,147 @@
+__author__ = 'Robert Meyer'
+
+import os
+import asyncio
+
+import numpy as np
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, cartesian_product, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+from pypet.utils.mpwrappers import QueueStorageServiceWriter
+
+
+async def multiply(traj, factor=1):
+    # Wait like for a simulator in an external process
+    await asyncio.sleep(0.01 * (len(traj) - traj.v_idx))
+    z = traj.x * traj.y * factor
+    traj.f_add_result('z', z)
+    traj.f_add_result('arr', np.ones(3) * z)
+    traj.f_add_derived_parameter('dz', z + 1)
+    return z
+
+
+def sync_multiply(traj, factor=1):
+    z = traj.x * traj.y * factor
+    traj.f_add_result('z', z)
+    traj.f_add_result('arr', np.ones(3) * z)
+    traj.f_add_derived_parameter('dz', z + 1)
+    return z
+
+
+class Concurrency(object):
+    """Measures the maximum number of concurrently running coroutines"""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, traj):
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return await multiply(traj)
+
+
+def postproc(traj, results):
+    if len(traj) == 4:
+        return {'x': [5, 6], 'y': [7, 8]}
+
+
+class AsyncioTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'asyncio'
+
+    def setUp(self):
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'asyncio.hdf5'))
+
+    def make_env(self, **kwargs):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          use_asyncio=True,
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_add_parameter('y', 1)
+        traj.f_explore(cartesian_product({'x': [1, 2], 'y': [3, 4]}))
+        return env, traj
+
+    def check_data(self, traj, results, factor=1):
+        self.assertEqual([x[0] for x in results], list(range(len(traj))))
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        self.assertEqual(len(traj), len(results))
+        for idx, run_name in enumerate(traj.f_get_run_names()):
+            traj.v_crun = run_name
+            z = traj.x * traj.y * factor
+            self.assertEqual(results[idx][1], z)
+            self.assertEqual(traj.results.runs.crun.z, z)
+            self.assertTrue(np.all(traj.results.runs.crun.arr == np.ones(3) * z))
+            self.assertEqual(traj.derived_parameters.runs.crun.dz, z + 1)
+            self.assertTrue(traj.f_get_run_information(run_name)['completed'])
+
+    def test_run(self):
+        env, traj = self.make_env()
+        results = env.run(multiply, factor=3)
+        env.disable_logging()
+        self.check_data(traj, results, factor=3)
+
+    def test_ordinary_functions(self):
+        env, traj = self.make_env()
+        results = env.run(sync_multiply)
+        env.disable_logging()
+        self.check_data(traj, results)
+
+    def test_concurrency_limit(self):
+        env, traj = self.make_env(concurrency_limit=2)
+        concurrency = Concurrency()
+        results = env.run(concurrency)
+        env.disable_logging()
+        self.assertEqual(concurrency.max_running, 2)
+        self.check_data(traj, results)
+
+    def test_postproc_expansion(self):
+        env, traj = self.make_env()
+        env.add_postprocessing(postproc)
+        results = env.run(multiply)
+        env.disable_logging()
+        self.assertEqual(len(traj), 6)
+        self.check_data(traj, results)
+
+    def test_error_in_run(self):
+        async def failing(traj):
+            await asyncio.sleep(0.001)
+            raise RuntimeError('Simulator crashed')
+        env, traj = self.make_env()
+        with self.assertRaises(RuntimeError):
+            env.run(failing)
+        env.disable_logging()
+
+    def test_error_in_storage_thread(self):
+        def broken_receive(writer):
+            raise IOError('Queue is broken')
+        env, traj = self.make_env()
+        receive_data = QueueStorageServiceWriter._receive_data
+        QueueStorageServiceWriter._receive_data = broken_receive
+        try:
+            with self.assertRaises(IOError):
+                env.run(multiply)
+        finally:
+            QueueStorageServiceWriter._receive_data = receive_data
+        env.disable_logging()
+
+    def test_wrong_settings(self):
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, use_asyncio=True, multiproc=True)
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, use_asyncio=True, concurrency_limit=0)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
@@ -88,6 +88,20 @@ class MultiprocPoolSortQueueTest(ResultSortTest):
         self.use_pool=True
 
 
+@unittest.skipIf(zmq is None, 'Can only be run with zmq')
+class MultiprocPoolSortNetstreamTest(ResultSortTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'multiproc', 'netstream', 'pool',
+
+    def set_mode(self):
+        super(MultiprocPoolSortNetstreamTest, self).set_mode()
+        self.mode = pypetconstants.WRAP_MODE_NETSTREAM
+        self.multiproc = True
+        self.ncores = 3
+        self.use_pool=True
+        self.port = get_random_port_url()
+
+
 # @unittest.skipIf(zmq is None, 'Can only be run with zmq')
 # class MultiprocNoPoolNetlockTest(EnvironmentTest):
 #
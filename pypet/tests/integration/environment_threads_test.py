@@ -0,0 +1,108 @@
+__author__ = 'Robert Meyer'
+
+import os
+import time
+import threading
+
+import numpy as np
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, cartesian_product, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def multiply(traj, factor=1):
+    idx = traj.v_idx
+    # Sleeping releases the GIL like numpy or numba code
+    time.sleep(0.01 * (len(traj) - traj.v_idx))
+    # Other runs must not have changed the run of this thread
+    assert idx == traj.v_idx
+    z = traj.x * traj.y * factor
+    traj.f_add_result('z', z)
+    traj.f_add_result('arr', np.ones(3) * z)
+    traj.f_add_derived_parameter('dz', z + 1)
+    return z, threading.current_thread().name
+
+
+def postproc(traj, results):
+    if len(traj) == 4:
+        return {'x': [5, 6], 'y': [7, 8]}
+
+
+class ThreadPoolTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'threads'
+
+    def setUp(self):
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'threads.hdf5'))
+
+    def make_env(self, **kwargs):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          use_threads=True,
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_add_parameter('y', 1)
+        traj.f_explore(cartesian_product({'x': [1, 2], 'y': [3, 4]}))
+        return env, traj
+
+    def check_data(self, traj, results, factor=1):
+        self.assertEqual([x[0] for x in results], list(range(len(traj))))
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        self.assertEqual(len(traj), len(results))
+        for idx, run_name in enumerate(traj.f_get_run_names()):
+            traj.v_crun = run_name
+            z = traj.x * traj.y * factor
+            self.assertEqual(results[idx][1][0], z)
+            self.assertEqual(traj.results.runs.crun.z, z)
+            self.assertTrue(np.all(traj.results.runs.crun.arr == np.ones(3) * z))
+            self.assertEqual(traj.derived_parameters.runs.crun.dz, z + 1)
+            self.assertTrue(traj.f_get_run_information(run_name)['completed'])
+
+    def test_run(self):
+        env, traj = self.make_env(ncores=4)
+        results = env.run(multiply, factor=3)
+        env.disable_logging()
+        self.check_data(traj, results, factor=3)
+        self.assertGreater(len(set(x[1][1] for x in results)), 1)
+        self.assertEqual(traj.v_idx, -1)
+
+    def test_full_copy(self):
+        env, traj = self.make_env(ncores=3)
+        traj.v_full_copy = True
+        results = env.run(multiply)
+        env.disable_logging()
+        self.check_data(traj, results)
+
+    def test_postproc_expansion(self):
+        env, traj = self.make_env(ncores=2)
+        env.add_postprocessing(postproc)
+        results = env.run(multiply)
+        env.disable_logging()
+        self.assertEqual(len(traj), 6)
+        self.check_data(traj, results)
+
+    def test_error_in_run(self):
+        def failing(traj):
+            raise RuntimeError('Simulator crashed')
+        env, traj = self.make_env(ncores=2)
+        with self.assertRaises(RuntimeError):
+            env.run(failing)
+        env.disable_logging()
+
+    def test_wrong_settings(self):
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, use_threads=True, multiproc=True)
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, use_threads=True, use_asyncio=True)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
@@ -0,0 +1,93 @@
+__author__ = 'Robert Meyer'
+
+import os
+import mmap
+
+import numpy as np
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def allocate(traj):
+    """Allocates `traj.megabytes` of memory"""
+    # An anonymous map is never served from memory the forked process inherited
+    data = np.frombuffer(mmap.mmap(-1, traj.megabytes * 1024 * 1024))
+    data.fill(1.0)
+    traj.f_add_result('sum', np.sum(data))
+
+
+class PeakMemoryTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'memory'
+
+    def setUp(self):
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'memory_model.hdf5'))
+
+    def make_env(self, **kwargs):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('megabytes', 1)
+        traj.f_explore({'megabytes': [10, 100, 200, 20]})
+        return env, traj
+
+    @unittest.skipIf(psutil is None, 'Only makes sense if psutil is installed')
+    def test_peak_memory_is_stored(self):
+        env, traj = self.make_env(memory_cap=(99.9, 50.0))
+        env.run(allocate)
+        env.disable_logging()
+        traj = load_trajectory(name=traj.v_name, filename=self.filename)
+        peaks = [traj.f_get_run_information(idx)['peak_memory'] for idx in range(len(traj))]
+        self.assertTrue(all(peak > 0.0 for peak in peaks))
+        # Only the growth during a run counts, not the peak of earlier runs
+        self.assertGreater(peaks[2], 150.0)
+        self.assertLess(peaks[3], 100.0)
+
+    def test_peak_memory_only_measured_for_memory_model(self):
+        env, traj = self.make_env()
+        env.run(allocate)
+        env.disable_logging()
+        peaks = [traj.f_get_run_information(idx)['peak_memory'] for idx in range(len(traj))]
+        self.assertEqual(peaks, [0.0] * len(traj))
+
+    @unittest.skipIf(psutil is None, 'Only makes sense if psutil is installed')
+    def test_memory_model_learns_from_processes(self):
+        env, traj = self.make_env(multiproc=True, ncores=2, use_pool=False,
+                                  memory_cap=(99.9, 50.0))
+        env.run(allocate)
+        env.disable_logging()
+        self.assertEqual(len(env._memory_model), len(traj))
+        peaks = [traj.f_get_run_information(idx)['peak_memory'] for idx in range(len(traj))]
+        # Every run is executed in its own process
+        self.assertGreater(peaks[2], peaks[0] + 150.0)
+        self.assertLess(peaks[3], peaks[1])
+
+    @unittest.skipIf(psutil is None, 'Only makes sense if psutil is installed')
+    def test_estimate_compares_growth_with_prediction(self):
+        env, traj = self.make_env(memory_cap=(99.9, 0.0))
+        env.disable_logging()
+        pid = os.getpid()
+        memory = psutil.Process(pid).memory_percent()
+        # The process did not grow since its start, so all of the prediction is missing
+        env._predicted_memory[pid] = memory
+        env._process_baseline[pid] = memory
+        env._current_idx = 0
+        estimate = env._estimate_memory_utilization({pid: None})
+        self.assertGreater(estimate - psutil.virtual_memory().percent, memory * 0.5)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
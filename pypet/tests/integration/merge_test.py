@@ -2,12 +2,14 @@ __author__ = 'Robert Meyer'
 
 
 import numpy as np
+import tables as pt
 from pypet.parameter import Parameter
 from pypet.utils.explore import cartesian_product
 from pypet.environment import Environment
 from pypet import pypetconstants
 import logging
 import os
+import shutil
 import time
 from scipy.stats import pearsonr
 
@@ -223,6 +225,21 @@ class MergeTest(TrajectoryComparator):
                                          'merge4trials.hdf5'))]
         self.merge_basic_only_adding_more_trials(True)
 
+    def test_merge_basic_with_separate_files_only_adding_more_trials_move_nodes(self):
+        self.filenames = [make_temp_dir(os.path.join('experiments',
+                                         'tests',
+                                         'HDF5',
+                                         'merge2trials_move.hdf5')),
+                          make_temp_dir(os.path.join('experiments',
+                                         'tests',
+                                         'HDF5',
+                                         'merge3trials_move.hdf5')),
+                          make_temp_dir(os.path.join('experiments',
+                                         'tests',
+                                         'HDF5',
+                                         'merge4trials_move.hdf5'))]
+        self.merge_basic_only_adding_more_trials(False)
+
     def test_merge_basic_with_separate_files_only_adding_more_trials_slow_merge(self):
         self.filenames = [make_temp_dir(os.path.join('experiments',
                                          'tests',
@@ -312,6 +329,17 @@ class MergeTest(TrajectoryComparator):
                            load_other_data=pypetconstants.UPDATE_DATA)
 
         self.compare_trajectories(merged_traj,self.trajs[2])
+        self.compare_overview_tables(merged_traj, self.trajs[2])
+
+    def compare_overview_tables(self, traj1, traj2):
+        for table_name in ('results_overview', 'derived_parameters_overview'):
+            rows = []
+            for traj in (traj1, traj2):
+                with pt.open_file(traj.v_storage_service.filename, mode='r') as hdf5file:
+                    table = hdf5file.get_node('/%s/overview/%s' % (traj.v_name, table_name))
+                    rows.append(sorted((row['location'], row['name'])
+                                       for row in table.read()))
+            self.assertEqual(rows[0], rows[1])
 
 
     def merge_basic_only_adding_more_trials_with_backup(self,copy_nodes):
@@ -735,7 +763,7 @@ class TestConsecutiveMerges(TrajectoryComparator):
         merge_traj.f_load(load_data=2)
         self.check_if_z_is_correct(merge_traj)
 
-    def test_merge_all_in_folder(self):
+    def test_merge_all_in_folder(self, ncores=1):
 
         self.filename = make_temp_dir(os.path.join('experiments','tests','HDF5', 'subfolder',
                                                     'test.hdf5'))
@@ -756,12 +784,48 @@ class TestConsecutiveMerges(TrajectoryComparator):
         for irun in range(ntrajs):
             self.envs[irun].f_run(multiply)
 
-        merge_traj = merge_all_in_folder(path, delete_other_files=True)
+        merge_traj = merge_all_in_folder(path, delete_other_files=True, ncores=ncores)
         merge_traj.f_load(load_data=2)
 
         self.assertEqual(len(merge_traj), total_len)
         self.check_if_z_is_correct(merge_traj)
 
+    def test_merge_all_in_folder_parallel(self):
+        self.test_merge_all_in_folder(ncores=2)
+
+    def test_merge_all_in_folder_parallel_equals_serial(self):
+        folder = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                            'parallel_equals_serial'))
+        paths = [os.path.join(folder, 'serial'), os.path.join(folder, 'parallel')]
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+
+        for irun in range(3):
+            filename = os.path.join(paths[0], 'test%d.hdf5' % irun)
+            self.envs.append(self._make_env(irun, filename=filename))
+            traj = self.envs[-1].v_traj
+            traj.f_add_parameter('x', 0)
+            traj.f_add_parameter('y', 0)
+            traj.f_add_derived_parameter('dz', 42, comment='Trajectory wide')
+            self.explore(traj)
+            self.envs[-1].f_run(multiply)
+            self.envs[-1].f_disable_logging()
+            # Both folders contain the very same files
+            shutil.copy(filename, os.path.join(paths[1], 'test%d.hdf5' % irun))
+
+        serial_traj = merge_all_in_folder(paths[0], backup=False, ncores=1)
+        parallel_traj = merge_all_in_folder(paths[1], backup=False, ncores=2)
+        serial_traj.f_load(load_data=2)
+        parallel_traj.f_load(load_data=2)
+
+        self.compare_trajectories(serial_traj, parallel_traj)
+        self.assertEqual(
+            [serial_traj.f_get_run_information(idx) for idx in range(len(serial_traj))],
+            [parallel_traj.f_get_run_information(idx) for idx in range(len(parallel_traj))])
+        self.check_if_z_is_correct(parallel_traj)
+
     def test_merge_many(self):
 
         ntrajs = 4
@@ -780,7 +844,8 @@ class TestConsecutiveMerges(TrajectoryComparator):
         total_len = 0
         for traj in self.trajs:
             total_len += len(traj)
-        merge_traj.f_merge_many(self.trajs[1:])
+        timings = merge_traj.f_merge_many(self.trajs[1:])
+        self.assertEqual(len(timings), ntrajs - 1)
 
         merge_traj.f_load(load_data=2)
         self.assertEqual(len(merge_traj), total_len)
@@ -16,6 +16,7 @@ from pypet.utils.explore import cartesian_product
 from pypet.environment import Environment
 from pypet import pypetconstants
 from pypet.parameter import Parameter
+from pypet.utils.resumejournal import ResumeJournal
 from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, make_trajectory_name, \
      parse_args, get_log_config
 from pypet.tests.testutils.data import create_param_dict, add_params, multiply, \
@@ -39,6 +40,11 @@ class Multiply(object):
         return z
 
 
+def expand_once(traj, results):
+    if len(traj) == 4:
+        return {'x': [5.0, 6.0, 7.0, 8.0], 'y': [1.0, 2.0, 3.0, 4.0]}
+
+
 @unittest.skipIf(dill is None, 'Only makes sense if dill is installed')
 class ContinueTest(TrajectoryComparator):
 
@@ -104,50 +110,19 @@ class ContinueTest(TrajectoryComparator):
 
     def _remove_nresults(self, traj, nresults, continue_folder):
 
-        result_tuple_list = []
-
-        n = 0
-        for filename in os.listdir(continue_folder):
-            _, ext = os.path.splitext(filename)
-
-            if ext != '.rcnt':
-                continue
-
-            n += 1
+        journal_filename = os.path.join(continue_folder, 'results.jnl')
+        result_tuple_list = list(ResumeJournal(journal_filename).read().values())
 
-            cnt_file = open(os.path.join(continue_folder, filename), 'rb')
-            try:
-                result = dill.load(cnt_file)
-                cnt_file.close()
-                result_tuple_list.append((result))
-            except Exception:
-                # delete broken files
-                logging.getLogger().exception('Could not open continue snapshot '
-                                              'file `%s`.' % filename)
-                cnt_file.close()
-                os.remove(filename)
-
-        self.assertGreaterEqual(n, nresults)
+        self.assertGreaterEqual(len(result_tuple_list), nresults)
 
         result_tuple_list = sorted(result_tuple_list, key=lambda x: x[0])
-        timestamp_list = [x[1]['finish_timestamp'] for x in result_tuple_list]
-        timestamp_list = timestamp_list[-nresults:]
-
-        for timestamp in timestamp_list:
-            filename = os.path.join(continue_folder, 'result_%s.rcnt' % repr(timestamp).replace('.','_'))
-            os.remove(filename)
-
-        result_tuple_list = []
-        for filename in os.listdir(continue_folder):
-            _, ext = os.path.splitext(filename)
+        result_tuple_list = result_tuple_list[:-nresults]
 
-            if ext != '.rcnt':
-                continue
-
-            cnt_file = open(os.path.join(continue_folder, filename), 'rb')
-            result = dill.load(cnt_file)
-            cnt_file.close()
-            result_tuple_list.append((result))
+        # Rewrite the journal without the removed results
+        os.remove(journal_filename)
+        with ResumeJournal(journal_filename) as journal:
+            for result_tuple in result_tuple_list:
+                journal.append(result_tuple)
 
         name_set = set([x[1]['name']  for x in result_tuple_list])
         removed = 0
@@ -210,6 +185,47 @@ class ContinueTest(TrajectoryComparator):
 
         self.assertEqual(len(self.trajs[1]), len(results))
 
+    def test_continueing_expanded(self):
+        self.filenames = [make_temp_dir('test_continueing_expanded.hdf5'), 0]
+
+        self.envs=[]
+        self.trajs = []
+
+        for irun,filename in enumerate(self.filenames):
+            if isinstance(filename,int):
+                filename = self.filenames[filename]
+
+            self.make_environment(irun, filename, continuable=irun==1)
+
+        for irun in range(len(self.filenames)):
+            self.trajs[irun].f_add_parameter('x', 1.0)
+            self.trajs[irun].f_add_parameter('y', 1.0)
+            self.trajs[irun].f_explore(cartesian_product({'x': [1.0, 2.0], 'y': [3.0, 4.0]}))
+            self.envs[irun].f_add_postprocessing(expand_once)
+            self.envs[irun].f_run(multiply)
+
+        traj_name = self.trajs[1].v_name
+        continue_folder = os.path.join(self.cnt_folder, self.trajs[1].v_name)
+        self.assertTrue(os.path.isfile(os.path.join(continue_folder, 'deltas.jnl')))
+
+        # Remove results of the expanded part of the trajectory
+        self.trajs[1]=self.envs[1].v_trajectory
+        self.assertEqual(len(self.trajs[1]), 8)
+        self._remove_nresults(self.trajs[1], 3, continue_folder)
+
+        self.envs[1].v_current_idx = 0
+        results = self.envs[1].resume(trajectory_name = traj_name)
+        self.assertEqual(len(self.envs[1].v_trajectory), 8)
+        self.assertEqual(len(results), 8)
+
+        for irun in range(len(self.filenames)):
+            self.trajs[irun].f_load(load_parameters=pypetconstants.OVERWRITE_DATA,
+                                    load_derived_parameters=pypetconstants.OVERWRITE_DATA,
+                                    load_results=pypetconstants.OVERWRITE_DATA,
+                                    load_other_data=pypetconstants.OVERWRITE_DATA)
+
+        self.compare_trajectories(self.trajs[0],self.trajs[1])
+
     def test_continueing_remove_completed(self):
         self.filenames = [make_temp_dir('test_continueing_remove_completed.hdf5')]
 
@@ -0,0 +1,131 @@
+__author__ = 'Robert Meyer'
+
+import os
+import time
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def multiply(traj):
+    # Run 1 is a straggler
+    time.sleep(1.0 if traj.v_idx == 1 else 0.01)
+    z = traj.x * 10
+    traj.f_add_result('z', z)
+    return z
+
+
+class Generations(object):
+    """Adds a new generation after the first result and cancels run 3"""
+
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, traj, result, offset):
+        self.seen.append(result[0])
+        if result[0] == 0 and len(traj) == 4:
+            return {'x': [offset, offset + 1, offset + 2]}, [3]
+
+
+class ResultHookTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'result_hook'
+
+    def set_mode(self):
+        self.kwargs = {}
+
+    def setUp(self):
+        self.set_mode()
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'result_hook.hdf5'))
+
+    def make_env(self):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          **self.kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': [0, 1, 2, 3]})
+        return env, traj
+
+    def test_expand_and_skip(self):
+        env, traj = self.make_env()
+        hook = Generations()
+        env.add_result_hook(hook, 10)
+        results = env.run(multiply)
+        env.disable_logging()
+
+        self.assertEqual(len(traj), 7)
+        self.assertEqual([x[0] for x in results], [0, 1, 2, 4, 5, 6])
+        self.assertEqual(sorted(hook.seen), [0, 1, 2, 4, 5, 6])
+        if self.kwargs.get('ncores', 1) > 1:
+            # The new generation did not wait for the straggler
+            self.assertEqual(hook.seen[-1], 1)
+
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        self.assertEqual(len(traj), 7)
+        for idx in range(len(traj)):
+            completed = traj.f_get_run_information(idx)['completed']
+            if idx == 3:
+                self.assertEqual(completed, pypetconstants.RUN_CANCELLED)
+            else:
+                self.assertTrue(completed)
+                traj.v_idx = idx
+                self.assertEqual(traj.crun.z, traj.x * 10)
+
+
+class ResultHookMultiprocTest(ResultHookTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'result_hook', 'multiproc', 'nopool'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2)
+
+
+class ResultHookMultiprocQueueTest(ResultHookTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'result_hook', 'multiproc', 'nopool', 'queue'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, wrap_mode=pypetconstants.WRAP_MODE_QUEUE)
+
+
+class ResultHookThreadsTest(ResultHookTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'result_hook', 'threads'
+
+    def set_mode(self):
+        self.kwargs = dict(use_threads=True, ncores=2)
+
+
+class ResultHookPoolTest(ResultHookTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'result_hook', 'multiproc', 'pool'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, use_pool=True)
+
+    def test_expand_and_skip(self):
+        env, traj = self.make_env()
+        env.add_result_hook(Generations(), 10)
+        with self.assertRaises(RuntimeError):
+            env.run(multiply)
+        env.disable_logging()
+
+    def test_monitoring(self):
+        env, traj = self.make_env()
+        seen = []
+        env.add_result_hook(lambda traj, result: seen.append(result))
+        results = env.run(multiply)
+        env.disable_logging()
+        self.assertEqual(sorted(seen), results)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
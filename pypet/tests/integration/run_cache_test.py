@@ -0,0 +1,220 @@
+__author__ = 'Robert Meyer'
+
+import os
+import time
+import threading
+
+import numpy as np
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, RunCache, Trajectory, Parameter, load_trajectory, \
+    cartesian_product
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def multiply(traj):
+    """Adds results and a derived parameter and returns the product"""
+    z = traj.x * traj.y
+    traj.f_add_result('z', z)
+    traj.f_add_result('arr.$set.a', np.ones(3) * z)
+    traj.f_add_derived_parameter('dz', z + 1)
+    return z
+
+
+class RunCacheTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'run_cache'
+
+    def make_env(self, filename, **kwargs):
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=filename,
+                          log_config=get_log_config(),
+                          run_cache=self.cache_folder,
+                          code_version='1.0',
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_add_parameter('y', 1)
+        traj.f_add_parameter('w', 2)
+        return env, traj
+
+    def setUp(self):
+        self.cache_folder = make_temp_dir(os.path.join('experiments', 'tests',
+                                                       'Cache', make_trajectory_name(self)))
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'cache.hdf5'))
+        self.calls = 0
+
+    def counting_multiply(self, traj):
+        self.calls += 1
+        return multiply(traj)
+
+    def test_code_version_required(self):
+        with self.assertRaises(ValueError):
+            Environment(run_cache=self.cache_folder, log_config=None)
+
+    def test_overlapping_grids(self):
+        env, traj = self.make_env(self.filename)
+        traj.f_explore(cartesian_product({'x': [1, 2], 'y': [3, 4]}))
+        results = env.run(self.counting_multiply)
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(len(RunCache(self.cache_folder)), 4)
+        env.disable_logging()
+
+        env2, traj2 = self.make_env(self.filename)
+        traj2.f_explore(cartesian_product({'x': [2, 3], 'y': [3, 4]}))
+        results2 = env2.run(self.counting_multiply)
+        env2.disable_logging()
+
+        # Only the two new combinations have been computed
+        self.assertEqual(self.calls, 6)
+        self.assertEqual(sorted(x[1] for x in results2), [6, 8, 9, 12])
+
+        traj2 = load_trajectory(name=traj2.v_name, filename=self.filename,
+                                load_all=2)
+        for run_name in traj2.f_get_run_names():
+            traj2.v_crun = run_name
+            z = traj2.x * traj2.y
+            self.assertEqual(traj2.results.crun.z, z)
+            self.assertTrue(np.all(traj2.results.crun.arr.a == np.ones(3) * z))
+            self.assertEqual(traj2.derived_parameters.runs.crun.dz, z + 1)
+            self.assertTrue(traj2.f_get_run_information(run_name)['completed'])
+
+    def test_run_information_restored(self):
+        env, traj = self.make_env(self.filename)
+        traj.f_explore({'x': [1, 2]})
+        env.run(self.counting_multiply)
+        env.disable_logging()
+
+        env2, traj2 = self.make_env(self.filename)
+        traj2.f_explore({'x': [2, 1]})
+        env2.run(self.counting_multiply)
+        env2.disable_logging()
+        self.assertEqual(self.calls, 2)
+
+        for idx, other_idx in ((0, 1), (1, 0)):
+            info = traj.f_get_run_information(other_idx)
+            cached_info = traj2.f_get_run_information(idx)
+            self.assertEqual(cached_info['idx'], idx)
+            self.assertEqual(cached_info['name'], traj2.f_idx_to_run(idx))
+            self.assertTrue(cached_info['completed'])
+            for key in ('finish_timestamp', 'runtime', 'function_time', 'peak_memory'):
+                self.assertEqual(cached_info[key], info[key])
+
+    def test_parameter_and_code_changes_invalidate(self):
+        env, traj = self.make_env(self.filename)
+        traj.f_explore({'x': [1, 2]})
+        env.run(self.counting_multiply)
+        env.disable_logging()
+
+        env2, traj2 = self.make_env(self.filename)
+        traj2.f_explore({'x': [1, 2]})
+        traj2.w = 3
+        env2.run(self.counting_multiply)
+        env2.disable_logging()
+        self.assertEqual(self.calls, 4)
+
+        env3 = Environment(trajectory=make_trajectory_name(self),
+                           filename=self.filename,
+                           log_config=get_log_config(),
+                           run_cache=RunCache(self.cache_folder),
+                           code_version='2.0')
+        traj3 = env3.traj
+        traj3.f_add_parameter('x', 1)
+        traj3.f_add_parameter('y', 1)
+        traj3.f_add_parameter('w', 2)
+        traj3.f_explore({'x': [1, 2]})
+        env3.run(self.counting_multiply)
+        env3.disable_logging()
+        self.assertEqual(self.calls, 6)
+
+    def test_multiproc(self):
+        env, traj = self.make_env(self.filename, multiproc=True, ncores=2,
+                                  use_pool=True)
+        traj.f_explore(cartesian_product({'x': [1, 2], 'y': [3, 4]}))
+        env.run(multiply)
+        env.disable_logging()
+
+        env2, traj2 = self.make_env(self.filename, multiproc=True, ncores=2)
+        traj2.f_explore(cartesian_product({'x': [1, 2], 'y': [3, 4]}))
+        results = env2.run(multiply)
+        env2.disable_logging()
+        self.assertEqual(sorted(x[1] for x in results), [3, 4, 6, 8])
+        traj2 = load_trajectory(name=traj2.v_name, filename=self.filename,
+                                load_all=2)
+        for run_name in traj2.f_get_run_names():
+            traj2.v_crun = run_name
+            self.assertEqual(traj2.results.crun.z, traj2.x * traj2.y)
+
+    def test_threads(self):
+        env, traj = self.make_env(self.filename, use_threads=True, ncores=2)
+        traj.f_explore(cartesian_product({'x': [1, 2], 'y': [3, 4]}))
+        env.run(self.counting_multiply)
+        env.disable_logging()
+        self.assertEqual(self.calls, 4)
+
+        env2, traj2 = self.make_env(self.filename, use_threads=True, ncores=2)
+        traj2.f_explore(cartesian_product({'x': [1, 2, 3], 'y': [3, 4]}))
+        results = env2.run(self.counting_multiply)
+        env2.disable_logging()
+        # Cache lookups from the worker threads found the first four runs
+        self.assertEqual(self.calls, 6)
+        self.assertEqual(sorted(x[1] for x in results), [3, 4, 6, 8, 9, 12])
+
+
+class RunCacheEvictionTest(unittest.TestCase):
+
+    tags = 'integration', 'run_cache'
+
+    def setUp(self):
+        self.cache = RunCache(make_temp_dir(os.path.join('experiments', 'tests',
+                                                         'Cache', 'eviction')))
+        self.cache.clear()
+
+    def test_access_from_other_threads(self):
+        self.cache.save('a', {'result': 42})
+        entries = []
+        thread = threading.Thread(target=lambda: entries.append(self.cache.load('a')))
+        thread.start()
+        thread.join()
+        self.assertEqual(entries, [{'result': 42}])
+
+    def test_no_key_for_empty_parameters(self):
+        traj = Trajectory()
+        traj.f_add_parameter('x', 1)
+        self.assertIsNotNone(RunCache.make_key(traj, '1.0'))
+        traj.f_add_parameter(Parameter('y'))
+        self.assertIsNone(RunCache.make_key(traj, '1.0'))
+
+    def test_save_and_load(self):
+        self.cache.save('a', {'result': 42})
+        self.assertIn('a', self.cache)
+        self.assertEqual(self.cache.load('a'), {'result': 42})
+        self.assertIsNone(self.cache.load('b'))
+
+    def test_evict_by_size(self):
+        for key in 'abc':
+            self.cache.save(key, np.zeros(100000))
+            time.sleep(0.01)
+        # Touch `a` to make it the most recently used entry
+        self.cache.load('a')
+        self.cache.max_size = 1.0
+        self.cache.evict()
+        self.assertEqual(len(self.cache), 1)
+        self.assertIn('a', self.cache)
+        self.assertLessEqual(self.cache.size, 1024 * 1024)
+
+    def test_evict_by_age(self):
+        self.cache.save('a', 1)
+        self.cache.max_age = 0.0
+        self.cache.save('b', 2)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual([x for x in os.listdir(self.cache.folder) if x.endswith('.pkl')],
+                         [])
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
@@ -0,0 +1,119 @@
+__author__ = 'Robert Meyer'
+
+import os
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+def compute_fibonacci(traj):
+    z = fibonacci(traj.x)
+    traj.f_add_result('z', z)
+    return z
+
+
+class RunProfilingTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'profiling'
+
+    def set_mode(self):
+        self.kwargs = {}
+
+    def setUp(self):
+        self.set_mode()
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'run_profiling.hdf5'))
+
+    def make_env(self, **kwargs):
+        kwargs.update(self.kwargs)
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': [5, 6, 7, 8, 9]})
+        return env, traj
+
+    def fibonacci_calls(self, stats):
+        return sum(stat[1] for func, stat in stats.items() if func[2] == 'fibonacci')
+
+    def check_profiles(self, env, traj, profiled):
+        # Calls of the naive recursion are 2 * fibonacci(n + 1) - 1
+        expected_calls = sum(2 * fibonacci(traj.f_get('x').f_get_range()[idx] + 1) - 1
+                             for idx in profiled)
+        self.assertEqual(self.fibonacci_calls(env.profile_stats.stats), expected_calls)
+
+        traj = load_trajectory(name=traj.v_name, filename=self.filename,
+                               load_all=pypetconstants.LOAD_DATA)
+        for idx in range(len(traj)):
+            traj.v_idx = idx
+            self.assertEqual(traj.crun.z, fibonacci(traj.x))
+            if idx in profiled:
+                profile = traj.results.runs.crun.profile
+                row = profile[profile.function.str.contains('(fibonacci)', regex=False)].iloc[0]
+                self.assertEqual(row['ncalls'], 2 * fibonacci(traj.x + 1) - 1)
+            else:
+                self.assertNotIn('profile', traj.results.runs.crun)
+            self.assertNotIn('profile', traj.f_get_run_information(idx))
+
+    def test_profile_every_nth_run(self):
+        env, traj = self.make_env(profile_runs=2)
+        env.run(compute_fibonacci)
+        env.disable_logging()
+        self.check_profiles(env, traj, (0, 2, 4))
+
+    def test_profile_selected_runs(self):
+        env, traj = self.make_env(profile_runs=[1, 3])
+        env.run(compute_fibonacci)
+        env.disable_logging()
+        self.check_profiles(env, traj, (1, 3))
+
+    def test_no_profiling(self):
+        env, traj = self.make_env()
+        env.run(compute_fibonacci)
+        env.disable_logging()
+        self.assertIsNone(env.profile_stats)
+
+    def test_wrong_settings(self):
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, profile_runs=0)
+        with self.assertRaises(ValueError):
+            Environment(log_config=None, profile_runs=1, use_asyncio=True)
+
+
+class RunProfilingMultiprocTest(RunProfilingTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'profiling', 'multiproc', 'lock'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2)
+
+
+class RunProfilingFrozenPoolQueueTest(RunProfilingTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'profiling', 'multiproc', 'pool', 'queue'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, use_pool=True, freeze_input=True,
+                           wrap_mode=pypetconstants.WRAP_MODE_QUEUE)
+
+
+class RunProfilingThreadsTest(RunProfilingTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'profiling', 'threads'
+
+    def set_mode(self):
+        self.kwargs = dict(use_threads=True, ncores=2)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
@@ -0,0 +1,125 @@
+__author__ = 'Robert Meyer'
+
+import os
+import time
+import json
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def sleepy_multiply(traj):
+    time.sleep(0.1)
+    z = traj.x * 10
+    traj.f_add_result('z', z)
+    return z
+
+
+class RunTimingsTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'run_timings'
+
+    def set_mode(self):
+        self.kwargs = {}
+
+    def setUp(self):
+        self.set_mode()
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'run_timings.hdf5'))
+
+    def make_env(self, **kwargs):
+        kwargs.update(self.kwargs)
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': [0, 1, 2, 3]})
+        return env, traj
+
+    def check_timings(self, info):
+        self.assertGreaterEqual(info['function_time'], 0.1)
+        self.assertLess(info['function_time'],
+                        info['finish_timestamp'] - info['timestamp'] + 1e-6)
+        for key in pypetconstants.RUN_TIMINGS:
+            self.assertGreaterEqual(info[key], 0.0)
+        self.assertLessEqual(info['lock_time'] + info['ipc_time'],
+                             info['finish_timestamp'] - info['timestamp'] + 1e-6)
+        self.assertNotEqual(info['process_id'], 0)
+        self.assertNotEqual(info['thread_id'], 0)
+
+    def test_timings_in_run_information(self):
+        env, traj = self.make_env()
+        env.run(sleepy_multiply)
+        env.disable_logging()
+        for idx in range(len(traj)):
+            self.check_timings(traj.f_get_run_information(idx))
+
+        # Without `run_timings` the table is not extended
+        loaded = load_trajectory(name=traj.v_name, filename=self.filename)
+        self.assertEqual(loaded.f_get_run_information(0)['function_time'], 0.0)
+
+    def test_timings_in_runs_table(self):
+        env, traj = self.make_env(run_timings=True)
+        env.run(sleepy_multiply)
+        env.disable_logging()
+        loaded = load_trajectory(name=traj.v_name, filename=self.filename)
+        for idx in range(len(traj)):
+            info = loaded.f_get_run_information(idx)
+            self.check_timings(info)
+            for key in pypetconstants.RUN_TIMINGS + ('process_id', 'thread_id'):
+                self.assertEqual(info[key], traj.f_get_run_information(idx)[key])
+
+    def test_export_timeline(self):
+        env, traj = self.make_env()
+        env.run(sleepy_multiply)
+        env.disable_logging()
+        filename = make_temp_dir(os.path.join('experiments', 'tests', 'timeline',
+                                              '%s.json' % self.__class__.__name__))
+        env.export_timeline(filename)
+        with open(filename) as fh:
+            timeline = json.load(fh)
+        events = timeline['traceEvents']
+        run_events = [event for event in events if event['name'].startswith('run_')]
+        self.assertEqual(len(run_events), len(traj))
+        function_events = [event for event in events if event['name'] == 'function']
+        self.assertEqual(len(function_events), len(traj))
+        for event in function_events:
+            self.assertGreaterEqual(event['dur'], 0.1 * 1e6)
+            self.assertGreaterEqual(event['ts'], 0.0)
+        workers = set(event['pid'] for event in events if event['ph'] == 'M')
+        self.assertEqual(workers, set(event['pid'] for event in run_events))
+
+
+class RunTimingsMultiprocTest(RunTimingsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'run_timings', 'multiproc', 'lock'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, use_pool=False)
+
+
+class RunTimingsMultiprocQueueTest(RunTimingsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'run_timings', 'multiproc', 'queue'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, use_pool=True,
+                           wrap_mode=pypetconstants.WRAP_MODE_QUEUE)
+
+
+class RunTimingsThreadsTest(RunTimingsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'run_timings', 'threads'
+
+    def set_mode(self):
+        self.kwargs = dict(use_threads=True, ncores=2)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
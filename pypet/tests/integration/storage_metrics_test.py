@@ -0,0 +1,164 @@
+__author__ = 'Robert Meyer'
+
+import os
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+from pypet.tests.testutils.ioutils import unittest
+from pypet import Environment, load_trajectory, pypetconstants
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, \
+    parse_args, get_log_config, make_trajectory_name, get_random_port_url
+from pypet.tests.testutils.data import TrajectoryComparator
+
+
+def multiply(traj):
+    z = traj.x * 10
+    traj.f_add_result('z', z)
+    return z
+
+
+class StorageMetricsTest(TrajectoryComparator):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics'
+
+    def set_mode(self):
+        self.kwargs = {}
+        self.writer = False
+        self.locked = False
+
+    def setUp(self):
+        self.set_mode()
+        self.filename = make_temp_dir(os.path.join('experiments', 'tests', 'HDF5',
+                                                   'storage_metrics.hdf5'))
+
+    def make_env(self, **kwargs):
+        kwargs.update(self.kwargs)
+        env = Environment(trajectory=make_trajectory_name(self),
+                          filename=self.filename,
+                          log_config=get_log_config(),
+                          **kwargs)
+        traj = env.traj
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': [0, 1, 2, 3, 4]})
+        return env, traj
+
+    def check_metrics(self, metrics, traj):
+        for counter in ('nodes', 'flushes', 'table_rows', 'files_opened', 'bytes_written'):
+            self.assertGreater(metrics.counters[counter], 0)
+        # Every single run is stored exactly once
+        self.assertEqual(metrics.latencies['store.SINGLE_RUN'].count, len(traj))
+        self.assertGreater(metrics.latencies['store.LEAF'].count, 0)
+        if self.writer:
+            self.assertEqual(metrics.counters['messages'],
+                             metrics.latencies['handle.SINGLE_RUN'].count)
+            self.assertEqual(metrics.latencies['handle.SINGLE_RUN'].count, len(traj))
+            self.assertGreater(metrics.latencies['receive'].count, len(traj))
+        else:
+            self.assertNotIn('messages', metrics.counters)
+        if self.locked:
+            summary = metrics.locks.summary()
+            # Every run stores its data at least once while holding the lock
+            self.assertGreaterEqual(summary.acquisitions.sum(), len(traj))
+            self.assertGreater(summary.hold_total.sum(), 0.0)
+            self.assertTrue((summary.wait_max >= 0.0).all())
+        else:
+            self.assertEqual(len(metrics.locks), 0)
+
+    def test_collect_metrics(self):
+        env, traj = self.make_env()
+        env.run(multiply)
+        env.disable_logging()
+        self.check_metrics(env.storage_metrics, traj)
+        for idx in range(len(traj)):
+            self.assertNotIn('storage_metrics', traj.f_get_run_information(idx))
+
+        loaded = load_trajectory(name=traj.v_name, filename=self.filename)
+        self.assertFalse(loaded.f_contains('results.environment', shortcuts=False))
+
+    def test_store_metrics(self):
+        env, traj = self.make_env(store_metrics=True)
+        env.run(multiply)
+        env.disable_logging()
+        metrics = env.storage_metrics
+
+        loaded = load_trajectory(name=traj.v_name, filename=self.filename,
+                                 load_all=pypetconstants.LOAD_DATA)
+        result = loaded.f_get('results.environment.%s.storage_metrics' % env.name)
+        self.assertEqual(result.counters, metrics.counters)
+        frame = result.latencies
+        self.assertEqual(sorted(frame.index), sorted(metrics.latencies.keys()))
+        self.assertEqual(frame.loc['store.SINGLE_RUN', 'count'], len(traj))
+
+
+class StorageMetricsMultiprocTest(StorageMetricsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics', 'multiproc', 'lock'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2)
+        self.writer = False
+        self.locked = True
+
+
+class StorageMetricsMultiprocQueueTest(StorageMetricsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics', 'multiproc', 'queue'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, use_pool=True,
+                           wrap_mode=pypetconstants.WRAP_MODE_QUEUE)
+        self.writer = True
+        self.locked = False
+
+
+class StorageMetricsMultiprocPipeTest(StorageMetricsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics', 'multiproc', 'pipe'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, wrap_mode=pypetconstants.WRAP_MODE_PIPE)
+        self.writer = True
+        self.locked = True
+
+
+class StorageMetricsThreadsTest(StorageMetricsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics', 'threads'
+
+    def set_mode(self):
+        self.kwargs = dict(use_threads=True, ncores=2)
+        self.writer = True
+        self.locked = False
+
+
+@unittest.skipIf(zmq is None, 'Cannot be run without zmq')
+class StorageMetricsMultiprocNetlockTest(StorageMetricsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics', 'multiproc', 'netlock'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2, use_pool=True,
+                           wrap_mode=pypetconstants.WRAP_MODE_NETLOCK,
+                           port=get_random_port_url())
+        self.writer = False
+        self.locked = True
+
+
+@unittest.skipIf(zmq is None, 'Cannot be run without zmq')
+class StorageMetricsMultiprocNetstreamTest(StorageMetricsTest):
+
+    tags = 'integration', 'hdf5', 'environment', 'storage_metrics', 'multiproc', 'netstream'
+
+    def set_mode(self):
+        self.kwargs = dict(multiproc=True, ncores=2,
+                           wrap_mode=pypetconstants.WRAP_MODE_NETSTREAM,
+                           port=get_random_port_url(), stream_batch_size=2)
+        self.writer = True
+        self.locked = False
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
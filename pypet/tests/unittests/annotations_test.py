@@ -213,6 +213,16 @@ class AnnotationsTest(unittest.TestCase):
 
                 self.assertTrue(name in node.v_annotations)
 
+    def test_annotations_created_lazily(self):
+        testparam = self.traj.f_add_parameter('lazy', 42)
+        self.assertIsNone(testparam._annotations_)
+        self.assertFalse(testparam._has_annotations())
+        self.assertTrue(testparam.v_annotations.f_is_empty())
+        self.assertFalse(testparam._has_annotations())
+        testparam.v_annotations.f_set(test=1)
+        self.assertTrue(testparam._has_annotations())
+        self.assertEqual(testparam.f_get_annotations('test'), 1)
+
 
 if __name__ == '__main__':
     opt_args = parse_args()
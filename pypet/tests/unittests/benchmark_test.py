@@ -0,0 +1,81 @@
+__author__ = 'Robert Meyer'
+
+import os
+import json
+from collections import OrderedDict
+
+from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, parse_args, unittest
+from pypet.tests.benchmarks.scenarios import bench_store, bench_explore, grid
+from pypet.tests.benchmarks.run_benchmarks import run_benchmarks, write_results, \
+    benchmark_key, summarize
+from pypet.tests.benchmarks.compare import compare, format_comparison, main as compare_main
+
+
+def make_results(medians):
+    return dict(meta=dict(git_commit='abc'),
+                results=[dict(key=key, median=median) for key, median in medians.items()])
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    tags = 'unittest', 'benchmark'
+
+    def test_grid_and_keys(self):
+        params = grid(b=[1, 2], a=['x'])
+        self.assertEqual([list(x.items()) for x in params],
+                         [[('a', 'x'), ('b', 1)], [('a', 'x'), ('b', 2)]])
+        self.assertEqual(benchmark_key('store', params[1]), 'store[a=x,b=2]')
+
+    def test_summarize(self):
+        self.assertEqual(summarize([3.0, 1.0, 2.0]), dict(min=1.0, median=2.0, mean=2.0))
+        self.assertEqual(summarize([4.0, 1.0])['median'], 2.5)
+
+    def test_run_benchmarks(self):
+        scenarios = OrderedDict([
+            ('store', (bench_store, grid(n_results=[3], result_size=[2], tree_width=[1, 2]))),
+            ('explore', (bench_explore, grid(n_runs=[9], n_parameters=[2]))),
+        ])
+        folder = make_temp_dir('benchmarks')
+        reported = []
+        benchmarks = run_benchmarks(scenarios, repeat=2, folder=folder,
+                                    report=reported.append)
+        self.assertEqual(len(benchmarks['results']), 3)
+        self.assertEqual(reported, benchmarks['results'])
+        for result in benchmarks['results']:
+            self.assertEqual(len(result['times']), 2)
+            self.assertGreater(result['median'], 0.0)
+        self.assertEqual(benchmarks['meta']['repeat'], 2)
+        # The temporary files of the single benchmarks are removed
+        self.assertEqual(os.listdir(folder), [])
+
+        benchmarks = run_benchmarks(scenarios, repeat=1, folder=folder, select=['explore'])
+        self.assertEqual([x['scenario'] for x in benchmarks['results']], ['explore'])
+
+        with self.assertRaises(ValueError):
+            run_benchmarks(scenarios, select=['nope'])
+
+    def test_compare(self):
+        old = make_results({'a': 1.0, 'b': 1.0, 'c': 1.0, 'd': 0.001, 'gone': 1.0})
+        new = make_results({'a': 1.5, 'b': 0.5, 'c': 1.1, 'd': 0.005, 'added': 1.0})
+        comparisons = compare(old, new, threshold=0.2, min_seconds=0.01)
+        status = dict((x['key'], x['status']) for x in comparisons)
+        self.assertEqual(status, {'a': 'regression', 'b': 'improvement', 'c': 'unchanged',
+                                  'd': 'unchanged', 'gone': 'removed', 'added': 'new'})
+        self.assertIn('1 regressions in 6 benchmarks', format_comparison(comparisons))
+
+    def test_compare_files(self):
+        old_file = make_temp_dir(os.path.join('benchmarks_compare', 'old.json'))
+        new_file = make_temp_dir(os.path.join('benchmarks_compare', 'new.json'))
+        if not os.path.isdir(os.path.dirname(old_file)):
+            os.makedirs(os.path.dirname(old_file))
+        write_results(make_results({'a': 1.0}), old_file)
+        write_results(make_results({'a': 1.1}), new_file)
+        with open(new_file) as fh:
+            self.assertEqual(json.load(fh)['results'][0]['median'], 1.1)
+        self.assertEqual(compare_main([old_file, new_file]), 0)
+        self.assertEqual(compare_main(['--threshold=0.05', old_file, new_file]), 1)
+
+
+if __name__ == '__main__':
+    opt_args = parse_args()
+    run_suite(**opt_args)
@@ -5,7 +5,9 @@ import time
 import multiprocessing as mp
 import logging
 import os
+import threading
 
+import numpy as np
 try:
     import scoop
     from scoop import futures
@@ -19,8 +21,10 @@ except ImportError:
 from pypet.tests.testutils.ioutils import run_suite, make_temp_dir, remove_data, \
     get_root_logger, parse_args, unittest, get_random_port_url, errwrite
 from pypet.tests.testutils.data import TrajectoryComparator
-from pypet.utils.mpwrappers import LockerClient, LockerServer, TimeOutLockerServer
+from pypet.utils.mpwrappers import LockerClient, LockerServer, TimeOutLockerServer, \
+    LockWrapper, StreamingQueuingServer, StreamingQueuingClient, dump_frames, load_frames
 from pypet.pypetlogging import DisableAllLogging
+from pypet import pypetconstants
 from pypet.utils.helpful_functions import is_ipv6
 
 
@@ -357,6 +361,141 @@ class TestNetLock(TrajectoryComparator):
         lock.send_done()
         self.lock_process.join()
 
+class DummyStorageService(object):
+    is_open = False
+
+    def store(self, *args, **kwargs):
+        time.sleep(0.01)
+
+
+class TestLockStatistics(unittest.TestCase):
+
+    tags = 'unittest', 'mpwrappers', 'lock_statistics'
+
+    def test_lock_wrapper_records_wait_and_hold(self):
+        lock = mp.Lock()
+        wrapper = LockWrapper(DummyStorageService(), lock)
+        for irun in range(3):
+            wrapper.store('LEAF', None)
+        metrics = wrapper.pop_metrics()
+        self.assertEqual(len(wrapper.lock_statistics), 0)
+        summary = metrics.locks.summary()
+        self.assertEqual(list(summary.index), [LockerClient._get_id()])
+        self.assertEqual(summary.acquisitions.iloc[0], 3)
+        self.assertEqual(summary.retries.iloc[0], 0)
+        self.assertGreaterEqual(summary.hold_total.iloc[0], 0.03)
+        self.assertLess(summary.wait_max.iloc[0], 0.01)
+
+    def test_server_records_retries_and_queue_depth(self):
+        for server in (LockerServer(get_random_port_url()),
+                       TimeOutLockerServer(get_random_port_url(), 100.0)):
+            def lock(client_id):
+                response = server._lock('test', client_id, '1')
+                server._track_waiting('test', client_id, response)
+                return response
+
+            self.assertEqual(lock('a'), LockerServer.GO)
+            self.assertEqual(lock('b'), LockerServer.WAIT)
+            self.assertEqual(lock('c'), LockerServer.WAIT)
+            self.assertEqual(lock('b'), LockerServer.WAIT)
+            self.assertEqual(server._unlock('test', 'a', '1'), LockerServer.RELEASED)
+            self.assertEqual(lock('c'), LockerServer.GO)
+            self.assertEqual(lock('b'), LockerServer.WAIT)
+
+            summary = server.metrics.locks.summary()
+            self.assertEqual(list(summary.index), ['b', 'c'])
+            self.assertEqual(list(summary.retries), [3, 1])
+            self.assertEqual(list(summary.max_queue_depth), [2, 2])
+            self.assertEqual(server._waiting['test'], set(['b']))
+
+
+
+class RecordingStorageService(object):
+    is_open = False
+
+    def __init__(self):
+        self.stored = []
+
+    def store(self, msg, stuff_to_store, *args, **kwargs):
+        if msg == pypetconstants.OPEN_FILE:
+            self.is_open = True
+        elif msg == pypetconstants.CLOSE_FILE:
+            self.is_open = False
+        elif msg != pypetconstants.FLUSH:
+            self.stored.append((msg, stuff_to_store))
+
+
+@unittest.skipIf(zmq is None, 'Cannot be run without zmq')
+class TestNetStream(unittest.TestCase):
+
+    tags = 'unittest', 'mpwrappers', 'netstream'
+
+    def test_dump_and_load_frames(self):
+        data = ('STORE', ('LEAF', np.arange(100000)), dict(trajectory_name='traj'))
+        loaded = load_frames(dump_frames(data))
+        self.assertEqual(loaded[0], 'STORE')
+        self.assertEqual(loaded[2], data[2])
+        self.assertTrue(np.all(loaded[1][1] == data[1][1]))
+
+    def start_server(self, url, service, window):
+        server = StreamingQueuingServer(url, service, window, None)
+        thread = threading.Thread(target=server.run)
+        thread.daemon = True
+        thread.start()
+        return server, thread
+
+    def stop_server(self, client, thread):
+        try:
+            client.send_done()
+        finally:
+            client.finalize()
+        thread.join(10.0)
+        self.assertFalse(thread.is_alive())
+
+    def stream(self, window, batch_size, nmessages):
+        url = get_random_port_url()
+        service = RecordingStorageService()
+        server, thread = self.start_server(url, service, window)
+        client = StreamingQueuingClient(url, batch_size=batch_size)
+        try:
+            client.start()
+            for irun in range(nmessages):
+                client.put(('STORE', ('LEAF', np.ones(10) * irun),
+                            dict(trajectory_name='traj')))
+                self.assertLessEqual(client._credits, client._window)
+                self.assertLess(len(client._batch), min(batch_size, client._window))
+            client.sync()
+            self.assertEqual(len(client._batch), 0)
+        finally:
+            self.stop_server(client, thread)
+        self.assertEqual([x[0] for x in service.stored], ['LEAF'] * nmessages)
+        self.assertEqual([x[1][0] for x in service.stored], list(range(nmessages)))
+        self.assertEqual(server.metrics.counters['messages'], nmessages)
+
+    def test_streaming(self):
+        self.stream(window=4, batch_size=1, nmessages=20)
+
+    def test_streaming_batches(self):
+        self.stream(window=4, batch_size=3, nmessages=20)
+
+    def test_batch_size_capped_by_window(self):
+        self.stream(window=2, batch_size=10, nmessages=11)
+
+    def test_unlimited_window(self):
+        self.stream(window=0, batch_size=5, nmessages=12)
+
+    def test_ping(self):
+        url = get_random_port_url()
+        server, thread = self.start_server(url, RecordingStorageService(), 1)
+        client = StreamingQueuingClient(url)
+        try:
+            client.start(test_connection=True)
+            self.assertEqual(client._window, 1)
+        finally:
+            self.stop_server(client, thread)
+        self.assertEqual(server.metrics.counters, {})
+
+
 if __name__ == '__main__':
     opt_args = parse_args()
     run_suite(**opt_args)
\ No newline at end of file
@@ -82,6 +82,38 @@ class ParameterTest(TrajectoryComparator):
         with self.assertRaises(ValueError):
             param._explore([])
 
+    def test_explore_numpy_array(self):
+        param = Parameter('test.array_range', np.float64(1.0))
+        explore_array = np.arange(5.0)
+        param._explore(explore_array)
+
+        self.assertIsInstance(param.f_get_range(copy=False), np.ndarray)
+        self.assertFalse(param.f_get_range(copy=False) is explore_array)
+        self.assertFalse(param.f_get_range() is param.f_get_range(copy=False))
+        param._set_parameter_access(3)
+        self.assertEqual(param.f_get(), 3.0)
+
+        param.f_unlock()
+        param._expand(np.arange(5.0, 7.0))
+        self.assertEqual(param.f_get_range().tolist(), list(range(7)))
+
+        # Python defaults accept arrays of the same kind and hand out python values
+        param = Parameter('test.float_range', 1.0)
+        param._explore(np.arange(5.0))
+        self.assertIsInstance(param.f_get_range(copy=False), np.ndarray)
+        param._set_parameter_access(2)
+        self.assertIs(type(param.f_get()), float)
+        self.assertEqual(param.f_get(), 2.0)
+
+        param = Parameter('test.int_range', 1)
+        param._explore(np.arange(5))
+        param._set_parameter_access(4)
+        self.assertIs(type(param.f_get()), int)
+
+        # Arrays of another kind need to be converted first
+        with self.assertRaises(TypeError):
+            Parameter('test.mismatch_range', 1.0)._explore(np.arange(5))
+
     def test_cannot_expand_and_not_explore_throwing_type_error(self):
 
         for param in self.param.values():
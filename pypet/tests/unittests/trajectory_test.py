@@ -7,6 +7,7 @@ import numpy as np
 import warnings
 
 import sys
+import weakref
 import unittest
 
 from pypet.parameter import Parameter, PickleParameter, Result
@@ -1192,6 +1193,65 @@ class TrajectoryTest(unittest.TestCase):
         # with self.assertRaises(pex.NotUniqueNodeError):
         #     self.traj.f_get('depth0.findme', backwards_search=True)
 
+    def test_search_many_candidates_without_traversal(self):
+        self.traj = Trajectory()
+        self.traj.f_add_parameter('x', 1)
+        self.traj.f_explore({'x': list(range(20))})
+        for irun in range(20):
+            self.traj.f_add_result('runs.%s.sub.z' % self.traj.f_idx_to_run(irun), irun)
+        self.traj.f_add_result('shallow.z', 42)
+
+        def no_traversal(*args, **kwargs):
+            raise RuntimeError('The tree should not be traversed')
+
+        self.traj._nn_interface._iter_nodes = no_traversal
+
+        self.assertEqual(self.traj.results.f_get('z', fast_access=True), 42)
+        self.assertEqual(self.traj.results.runs.run_00000007.z, 7)
+        self.traj.v_crun = 'run_00000011'
+        self.assertEqual(self.traj.res.crun.z, 11)
+        self.traj.v_crun = None
+        with self.assertRaises(pex.NotUniqueNodeError):
+            self.traj.results.runs.z
+        self.assertFalse(self.traj.results.runs.f_contains('shallow', shortcuts=True))
+
+    def test_lookup_cache(self):
+        self.traj = Trajectory()
+        self.traj.f_add_parameter('x', 1)
+        self.traj.f_explore({'x': [0, 1, 2]})
+        for irun in range(3):
+            self.traj.f_add_result('runs.%s.z' % self.traj.f_idx_to_run(irun), irun)
+        nn_interface = self.traj._nn_interface
+
+        self.assertEqual(self.traj['par.x'], 1)
+        self.assertEqual(self.traj['par.x'], 1)
+        self.assertEqual([key[:3] for key in nn_interface._lookup_cache],
+                         [('', 'par.x', -1)])
+
+        # Switching runs must not return values cached for other runs
+        for irun in range(3):
+            self.traj.f_set_crun(irun)
+            self.assertEqual(self.traj.res.crun.z, irun)
+            self.assertEqual(self.traj.x, irun)
+        self.traj.f_restore_default()
+
+        # Adding and removing nodes invalidates the cache
+        self.traj.f_add_result('test.res', 42)
+        self.assertEqual(self.traj['test.res'], 42)
+        self.traj.f_remove_item('results.test.res')
+        self.traj.f_add_result('test.res', 43)
+        self.assertEqual(self.traj['test.res'], 43)
+
+        # Fast access leaves groups untouched
+        group = self.traj.f_get('results.test', fast_access=True)
+        self.assertIs(self.traj.f_get('results.test', fast_access=True), group)
+
+        # The cache does not keep removed nodes alive
+        group_ref = weakref.ref(group)
+        del group
+        self.traj.results.f_remove_child('test', recursive=True)
+        self.assertIsNone(group_ref())
+
 
     def test_contains_item_identity(self):
 
@@ -1567,6 +1627,41 @@ class TrajectoryCopyTreeTest(TrajectoryComparator):
         self.assertTrue(traj2.f_get('parameter').f_has_range())
 
 
+    def test_copy_shares_leaves_and_isolates_groups(self):
+        traj1 = Trajectory()
+        traj1.f_add_parameter('hi.my.parameter', 42, comment='A parameter')
+        traj1.f_add_parameter('hi.my.other', 43)
+        traj1.f_add_result('ands.moreover', 43)
+        traj1.hi.v_annotations['test'] = 'ddd'
+        traj1.ands.test = traj1.hi.my
+        traj1.f_explore({'parameter': [1, 2, 3]})
+        # Shallow copies drop the exploration ranges
+        traj1.v_full_copy = True
+
+        traj2 = traj1.f_copy(copy_leaves='explored')
+
+        self.assertTrue(traj2.f_get('other') is traj1.f_get('other'))
+        self.assertTrue(traj2.f_get('moreover') is traj1.f_get('moreover'))
+        self.assertTrue(traj2.f_get('parameter') is not traj1.f_get('parameter'))
+        self.assertTrue(traj2.hi is not traj1.hi)
+        self.assertTrue(traj2.hi.v_root is traj2)
+        self.assertEqual(traj2.hi.v_annotations['test'], 'ddd')
+        self.assertTrue(traj2.ands.test is traj2.hi.my)
+        self.assertEqual(traj2.f_get('parameter').v_comment, 'A parameter')
+        full_name = 'parameters.hi.my.parameter'
+        self.assertTrue(traj2._explored_parameters[full_name] is traj2.f_get('parameter'))
+        self.assertTrue(traj2._parameters[full_name] is traj2.f_get('parameter'))
+
+        traj2.v_idx = 1
+        self.assertEqual(traj2.parameter, 2)
+        self.assertEqual(traj1.f_get('parameter').f_get(), 42)
+
+        traj2.f_add_result('ands.new', 44)
+        traj2.hi.my.f_remove_child('other')
+        self.assertFalse('new' in traj1)
+        self.assertEqual(traj1.hi.my.other, 43)
+        self.assertFalse('other' in traj2)
+
     def test_shallow_copy_not_full_copy(self):
         traj1 = Trajectory()
         traj1.par['hi'] = ParameterGroup('hi.my.name.is')
@@ -1,5 +1,7 @@
 __author__ = 'Robert Meyer'
 
+import os
+import mmap
 import time
 import sys
 import pickle
@@ -7,6 +9,8 @@ from collections import Set, Sequence, Mapping
 
 import pandas as pd
 import numpy as np
+import tables as pt
+import scipy.sparse as spsp
 import random
 import copy as cp
 
@@ -18,11 +22,19 @@ from pypet.parameter import ArrayParameter, Parameter, SparseParameter, PicklePa
 import unittest
 
 from pypet.utils.explore import cartesian_product, find_unique_points
+from pypet.utils.hashing import value_key, range_keys, point_keys
 from pypet.utils.helpful_functions import progressbar, nest_dictionary, flatten_dictionary, \
-    result_sort, get_matching_kwargs
+    result_sort, get_matching_kwargs, get_peak_memory, get_memory_usage, make_trace_events
 from pypet.utils.comparisons import nested_equal
-from pypet.utils.helpful_classes import IteratorChain
+from pypet.utils.helpful_classes import IteratorChain, MemoryModel, PeakMemoryMeter
 from pypet.utils.decorators import retry
+from pypet.utils.resumejournal import ResumeJournal
+import pypet.utils.hdf5compression as hdf5compression
+from pypet.utils.hdf5compression import repack_hdf5_file
+from pypet.trajectory import load_trajectory
+from pypet.utils.profiling import is_profiled, profile_call, stats_to_frame, merge_stats, \
+    PROFILE_COLUMNS
+from pypet.utils.storagemetrics import StorageMetrics, LatencyHistogram, LockStatistics
 from pypet import HasSlots
 
 
@@ -79,6 +91,25 @@ class CartesianTest(unittest.TestCase):
                                                     (str(cartesian_dict),str(result_dict)))
 
 
+    def test_cartesian_product_as_arrays(self):
+        cartesian_dict = cartesian_product({'param1': [1, 2, 3],
+                                            'param2': np.array([42.0, 52.5]),
+                                            'param3': [(1, 2), (3, 4)]},
+                                           ('param1', ('param2', 'param3')),
+                                           as_arrays=True)
+
+        self.assertIsInstance(cartesian_dict['param1'], np.ndarray)
+        self.assertIsInstance(cartesian_dict['param2'], np.ndarray)
+        self.assertIsInstance(cartesian_dict['param3'], list)
+        self.assertEqual(cartesian_dict['param1'].tolist(), [1, 1, 2, 2, 3, 3])
+        self.assertEqual(cartesian_dict['param2'].tolist(), [42.0, 52.5] * 3)
+        self.assertEqual(cartesian_dict['param3'], [(1, 2), (3, 4)] * 3)
+
+    def test_cartesian_product_empty_range(self):
+        cartesian_dict = cartesian_product({'param1': [1, 2], 'param2': []})
+        self.assertEqual(cartesian_dict, {'param1': [], 'param2': []})
+
+
 class ProgressBarTest(unittest.TestCase):
 
     tags = 'unittest', 'utils', 'progress_bar'
@@ -184,6 +215,49 @@ class TestFindUnique(unittest.TestCase):
         self.assertTrue(len(unique_elements[0][1])==3)
         self.assertTrue(len(unique_elements[3][1])==1)
 
+    def test_find_unique_sparse_and_tuples(self):
+        matrix = spsp.csr_matrix(np.eye(3))
+        paramA = SparseParameter('sparse', matrix)
+        paramA._explore([matrix, spsp.csc_matrix(np.eye(3)), spsp.csr_matrix(np.ones((3, 3))),
+                         matrix.copy()])
+        paramB = PickleParameter('tup', (1, np.zeros(2)))
+        paramB._explore([(1, np.zeros(2)), (1, np.zeros(2)), (2, np.zeros(2)),
+                         (1, np.zeros(2))])
+        unique_elements = find_unique_points([paramA, paramB])
+        # Matrices of different formats are different points
+        self.assertEqual([x[1] for x in unique_elements], [[0, 3], [1], [2]])
+
+
+class TestHashing(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'hashing'
+
+    def test_value_keys(self):
+        self.assertEqual(value_key(3), 3)
+        self.assertEqual(value_key(np.ones(3)), value_key(np.ones(3)))
+        self.assertNotEqual(value_key(np.ones(3)), value_key(np.ones(3, dtype=int)))
+        self.assertNotEqual(value_key(np.ones(4)), value_key(np.ones((2, 2))))
+        self.assertEqual(value_key(np.ones((3, 2)).T), value_key(np.ones((2, 3))))
+        matrix = spsp.lil_matrix(np.eye(2))
+        self.assertEqual(value_key(matrix), value_key(spsp.lil_matrix(np.eye(2))))
+        self.assertNotEqual(value_key(matrix), value_key(spsp.csr_matrix(np.eye(2))))
+
+    def test_vectorized_range_keys(self):
+        values = [np.arange(6).reshape(2, 3) * idx for idx in range(4)] + [np.zeros((2, 3))]
+        keys = range_keys(values)
+        self.assertEqual(keys, [value_key(value) for value in values])
+        self.assertEqual(keys[0], value_key(np.zeros((2, 3), dtype=values[0].dtype)))
+        self.assertNotEqual(keys[0], keys[-1])
+
+    def test_point_keys(self):
+        paramA = Parameter('a', 1)
+        paramA._explore([1, 2, 1])
+        paramB = ArrayParameter('b', np.zeros(2))
+        keys = point_keys([paramA, paramB], 3)
+        self.assertEqual(keys[0], keys[2])
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertEqual(point_keys([], 2), [(), ()])
+
 
 class TestDictionaryMethods(unittest.TestCase):
 
@@ -230,6 +304,331 @@ class ResultSortFuncTest(unittest.TestCase):
         self.test_sort(500, 1000)
 
 
+class TraceEventsTest(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'trace_events'
+
+    def make_info(self, idx, timestamp, completed=1):
+        return {'idx': idx, 'name': 'run_%08d' % idx, 'completed': completed,
+                'timestamp': timestamp, 'finish_timestamp': timestamp + 1.0,
+                'function_time': 0.5, 'store_time': 0.25, 'dispatch_time': 0.1,
+                'process_id': 7, 'thread_id': 8}
+
+    def test_only_completed_runs(self):
+        run_information = [self.make_info(0, 1000.0), self.make_info(1, 42.0, completed=-1),
+                           self.make_info(2, 1001.0, completed=0)]
+        events = make_trace_events(run_information)['traceEvents']
+        run_events = [event for event in events if event['name'].startswith('run_')]
+        self.assertEqual([event['args']['idx'] for event in run_events], [0])
+        dispatch_event = [event for event in events if event['name'] == 'dispatch'][0]
+        self.assertAlmostEqual(dispatch_event['ts'], 0.0)
+        self.assertAlmostEqual(run_events[0]['ts'], 0.1 * 1e6)
+
+
+class MemoryModelTest(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'memory_model'
+
+    def test_prior_and_few_observations(self):
+        model = MemoryModel(prior=100.0)
+        self.assertEqual(model.predict([1, 'a']), 100.0)
+        model.add([1, 'a'], 10.0)
+        model.add([2, 'b'], 30.0)
+        self.assertEqual(len(model), 2)
+        self.assertEqual(model.predict([1, 'a']), 30.0)
+
+    def test_linear_fit(self):
+        model = MemoryModel()
+        for x in range(10):
+            for y in range(3):
+                model.add([x, y, 'ignored'], 50.0 + 10.0 * x + 2.0 * y)
+        self.assertAlmostEqual(model.predict([20, 1, 'ignored']), 252.0)
+        self.assertAlmostEqual(model.predict([0, 0, 'ignored']), 50.0)
+
+    def test_noise_increases_prediction(self):
+        model = MemoryModel()
+        for x in range(20):
+            model.add([x], 10.0 * x + (-5.0 if x % 2 else 5.0))
+        self.assertGreater(model.predict([30]), 300.0)
+
+    def test_peak_memory(self):
+        peak = get_peak_memory()
+        self.assertGreater(peak, 1.0)
+        self.assertLess(peak, 1024.0 * 1024.0)
+
+    @unittest.skipIf(get_memory_usage() == 0.0, 'Resident memory cannot be determined')
+    def test_peak_memory_meter(self):
+        meter = PeakMemoryMeter()
+        meter.start()
+        # An anonymous map is never served from memory freed by earlier tests
+        data = np.frombuffer(mmap.mmap(-1, 50 * 1024 * 1024))
+        data.fill(1.0)
+        self.assertGreater(np.sum(data), 0.0)
+        # Give the meter time to take a sample
+        time.sleep(10 * meter.interval)
+        del data
+        growth = meter.stop()
+        self.assertGreater(growth, 40.0)
+        self.assertLess(growth, 100.0)
+
+        meter.start()
+        self.assertLess(meter.stop(), 20.0)
+
+
+class ResumeJournalTest(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'resume_journal'
+
+    def setUp(self):
+        self.filename = make_temp_dir('journal_%s.jnl' % self._testMethodName)
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def make_result(self, idx):
+        return (idx, np.ones(3) * idx), {'idx': idx, 'name': 'run_%d' % idx}
+
+    def write(self, indices, **kwargs):
+        with ResumeJournal(self.filename, **kwargs) as journal:
+            for idx in indices:
+                journal.append(self.make_result(idx))
+
+    def test_append_and_read(self):
+        self.write(range(5))
+        self.write([5, 2])
+        records = ResumeJournal(self.filename).read()
+        self.assertEqual(sorted(records.keys()), list(range(6)))
+        self.assertTrue(np.all(records[3][0][1] == np.ones(3) * 3))
+        self.assertEqual(records[3][1]['name'], 'run_3')
+
+    def test_missing_journal(self):
+        self.assertEqual(ResumeJournal(self.filename).read(), {})
+
+    def test_truncated_tail(self):
+        self.write(range(5))
+        size = os.path.getsize(self.filename)
+        for cut in (3, size // 10):
+            with open(self.filename, 'r+b') as fh:
+                fh.truncate(size - cut)
+            self.assertEqual(sorted(ResumeJournal(self.filename).read().keys()),
+                             list(range(4)))
+        # New records are appended after the intact part
+        self.write([7])
+        self.assertEqual(sorted(ResumeJournal(self.filename).read().keys()),
+                         [0, 1, 2, 3, 7])
+
+    def test_corrupted_record(self):
+        self.write(range(3))
+        with open(self.filename, 'r+b') as fh:
+            fh.seek(-2, os.SEEK_END)
+            fh.write(b'xx')
+        self.assertEqual(sorted(ResumeJournal(self.filename).read().keys()), [0, 1])
+
+    def test_open_does_not_unpickle(self):
+        self.write(range(3))
+        journal = ResumeJournal(self.filename)
+
+        def fail(payload):
+            raise RuntimeError('Records must not be unpickled')
+
+        journal._loads = fail
+        journal.open()
+        journal.append(self.make_result(3))
+        journal.close()
+        self.assertEqual(sorted(ResumeJournal(self.filename).read().keys()), list(range(4)))
+
+    def test_batched_sync(self):
+        journal = ResumeJournal(self.filename, sync_every=3, sync_interval=1000.0)
+        journal.append(self.make_result(0))
+        journal.append(self.make_result(1))
+        self.assertEqual(journal._unsynced, 2)
+        # Records are flushed right away and visible before the sync
+        self.assertEqual(len(ResumeJournal(self.filename).read()), 2)
+        journal.append(self.make_result(2))
+        self.assertEqual(journal._unsynced, 0)
+        self.assertEqual(len(ResumeJournal(self.filename).read()), 3)
+        journal.close()
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+class RepackTest(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'hdf5', 'repack'
+
+    def setUp(self):
+        self.filename = make_temp_dir('repack_%s.hdf5' % self._testMethodName)
+        traj = Trajectory(name='repack', filename=self.filename, complevel=0,
+                          overwrite_file=True)
+        traj.f_add_parameter('x', 1)
+        traj.f_explore({'x': list(range(5))})
+        traj.f_store()
+        for irun in range(5):
+            traj.f_add_result('runs.run_%08d.arr' % irun,
+                              np.arange(5000.0).reshape(50, 100) * irun, comment='Ramp')
+        traj.f_add_result('other.arr', np.zeros((50, 100)))
+        traj.f_add_link('mylink', traj.f_get('results.other.arr'))
+        traj.f_store()
+        self.old_checkpoint = hdf5compression.REPACK_CHECKPOINT
+
+    def tearDown(self):
+        hdf5compression.REPACK_CHECKPOINT = self.old_checkpoint
+
+    def check_trajectory(self):
+        traj = load_trajectory(filename=self.filename, index=-1, load_all=2)
+        for irun in range(5):
+            arr = traj.f_get('results.runs.run_%08d.arr' % irun)
+            self.assertTrue(np.all(arr.arr == np.arange(5000.0).reshape(50, 100) * irun))
+        self.assertEqual(traj.f_get('results.runs.run_00000004.arr').v_comment, 'Ramp')
+        self.assertIs(traj.f_get('mylink'), traj.f_get('results.other.arr'))
+
+    def test_repack_selected_branches(self):
+        stats = repack_hdf5_file(self.filename, branches=['results.runs'], complevel=9,
+                                 complib='zlib', keep_backup=True, logger=None)
+        name_wo_ext, ext = os.path.splitext(self.filename)
+        self.assertTrue(os.path.isfile(name_wo_ext + '_backup' + ext))
+        self.assertLess(stats['bytes_written'], stats['bytes_read'])
+        with pt.open_file(self.filename, mode='r') as hdf5file:
+            repacked = hdf5file.get_node('/repack/results/runs/run_00000001/arr/arr')
+            self.assertEqual(repacked.filters.complevel, 9)
+            kept = hdf5file.get_node('/repack/results/other/arr/arr')
+            self.assertEqual(kept.filters.complevel, 0)
+        self.check_trajectory()
+
+    def test_repack_resume_after_interruption(self):
+        hdf5compression.REPACK_CHECKPOINT = 2
+        calls = []
+
+        def interrupt(node):
+            calls.append(node)
+            if len(calls) == 4:
+                raise KeyboardInterrupt()
+            return None
+
+        with self.assertRaises(KeyboardInterrupt):
+            repack_hdf5_file(self.filename, complevel=5, complib='zlib',
+                             chunkshape=interrupt, logger=None)
+        stats = repack_hdf5_file(self.filename, complevel=5, complib='zlib',
+                                 keep_backup=False, logger=None)
+        name_wo_ext, ext = os.path.splitext(self.filename)
+        self.assertFalse(os.path.isfile(name_wo_ext + '_tmp' + ext))
+        self.assertGreater(stats['leaves'], 0)
+        self.check_trajectory()
+
+    def test_several_cores_need_blosc(self):
+        with self.assertRaises(ValueError):
+            repack_hdf5_file(self.filename, complevel=5, complib='zlib', ncores=2,
+                             logger=None)
+        self.assertTrue(os.path.isfile(self.filename))
+        stats = repack_hdf5_file(self.filename, complevel=5, complib='blosc', ncores=2,
+                                 keep_backup=False, logger=None)
+        self.assertGreater(stats['leaves'], 0)
+        self.check_trajectory()
+
+
+class ProfilingTest(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'profiling'
+
+    def test_is_profiled(self):
+        self.assertFalse(is_profiled(0, None))
+        self.assertEqual([idx for idx in range(10) if is_profiled(idx, 3)], [0, 3, 6, 9])
+        self.assertEqual([idx for idx in range(10) if is_profiled(idx, frozenset([2, 5]))],
+                         [2, 5])
+
+    def test_profile_to_frame(self):
+        result, stats = profile_call(fibonacci, 10)
+        self.assertEqual(result, 55)
+        frame = stats_to_frame(stats)
+        self.assertEqual(tuple(frame.columns), PROFILE_COLUMNS)
+        fib_row = frame[frame.function.str.contains('fibonacci')].iloc[0]
+        self.assertEqual(fib_row['ncalls'], 177)
+        self.assertEqual(fib_row['primitive_calls'], 1)
+        self.assertTrue(np.all(np.diff(frame.cumtime.values) <= 0))
+
+    def test_merge_stats(self):
+        merged = None
+        for n in (5, 10):
+            merged = merge_stats(merged, profile_call(fibonacci, n)[1])
+        calls = [stat[1] for func, stat in merged.stats.items() if func[2] == 'fibonacci']
+        self.assertEqual(calls, [15 + 177])
+
+
+class StorageMetricsTest(unittest.TestCase):
+
+    tags = 'unittest', 'utils', 'storage_metrics'
+
+    def test_histogram_buckets(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.000001, 0.00001, 0.0005, 0.5, 20.0):
+            histogram.add(seconds)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.max, 20.0)
+        self.assertAlmostEqual(histogram.mean, sum((0.000001, 0.00001, 0.0005, 0.5, 20.0)) / 5)
+        self.assertEqual(histogram.buckets, [2, 0, 1, 0, 0, 1, 0, 1])
+
+    def test_merge_and_reset(self):
+        metrics = StorageMetrics()
+        metrics.increment('flushes')
+        metrics.record('store.LEAF', 0.001)
+        other = StorageMetrics()
+        other.increment('flushes', 2)
+        other.increment('nodes', 3)
+        other.record('store.LEAF', 0.1)
+        other.record('load.TRAJECTORY', 1.0)
+        merged = metrics.merge(other).merge(None)
+        self.assertIs(merged, metrics)
+        self.assertEqual(metrics.counters, {'flushes': 3, 'nodes': 3})
+        self.assertEqual(metrics.latencies['store.LEAF'].count, 2)
+        self.assertEqual(metrics.latencies['store.LEAF'].max, 0.1)
+        self.assertEqual(len(metrics), 4)
+
+        frame = metrics.latency_frame()
+        self.assertEqual(list(frame.index), ['load.TRAJECTORY', 'store.LEAF'])
+        self.assertEqual(frame.loc['store.LEAF', 'count'], 2)
+        self.assertEqual(frame.loc['load.TRAJECTORY', '<=1s'], 1)
+
+        copied = pickle.loads(pickle.dumps(metrics))
+        self.assertEqual(copied.counters, metrics.counters)
+        metrics.reset()
+        self.assertEqual(len(metrics), 0)
+        self.assertEqual(copied.latencies['store.LEAF'].count, 2)
+
+    def test_lock_statistics(self):
+        statistics = LockStatistics()
+        statistics.record_wait('a', 0.5)
+        statistics.record_hold('a', 0.25)
+        statistics.record_wait('a', 1.5)
+        statistics.record_hold('a', 0.75)
+        server_statistics = LockStatistics()
+        server_statistics.record_retry('a', 2)
+        server_statistics.record_retry('a', 1)
+        server_statistics.record_retry('b', 3)
+
+        metrics = StorageMetrics()
+        metrics.locks.merge(statistics)
+        other = StorageMetrics()
+        other.locks.merge(server_statistics)
+        metrics.merge(other)
+        self.assertEqual(len(metrics), 2)
+
+        summary = metrics.locks.summary()
+        self.assertEqual(tuple(summary.columns), LockStatistics.COLUMNS)
+        self.assertEqual(list(summary.index), ['a', 'b'])
+        self.assertEqual(list(summary.acquisitions), [2, 0])
+        self.assertEqual(list(summary.retries), [2, 1])
+        self.assertEqual(list(summary.max_queue_depth), [2, 3])
+        self.assertEqual(summary.loc['a', 'wait_total'], 2.0)
+        self.assertEqual(summary.loc['a', 'wait_max'], 1.5)
+        self.assertEqual(summary.loc['a', 'hold_mean'], 0.5)
+        self.assertIn('2 acquisitions by 2 clients', metrics.locks.report())
+
+        metrics.reset()
+        self.assertEqual(len(metrics.locks), 0)
+        self.assertEqual(len(other.locks), 2)
+
+
 class MyDummy(object):
     pass
 
@@ -28,6 +28,8 @@ import pypet.utils.dynamicimports as dynamicimports
 from pypet.utils.decorators import kwargs_api_change, not_in_run, copydoc, deprecated,\
     kwargs_mutual_exclusive, manual_run
 from pypet.utils.helpful_functions import is_debug, format_time
+from pypet.utils.helpful_classes import PeakMemoryMeter
+from pypet.utils.hashing import point_keys, point_values, equal_points
 from pypet.utils.storagefactory import storage_factory
 
 
@@ -300,6 +302,8 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
         self._run_started = False  # For manually using a trajectory
         self._run_by_environment = False  # To disable manual running of experiment
+        self._cancelled_runs = None  # Container of cancelled run indices during a run
+        self._memory_meter = None  # Measures the memory growth during a run
 
         self._full_copy = False
 
@@ -392,6 +396,7 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
             result['_updated_run_information'] = set()
 
         result['_wildcard_cache'] = {}
+        result['_memory_meter'] = None
         return result
 
     def __str__(self):
@@ -1100,6 +1105,11 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                      with_links=True):
         """Returns a *shallow* copy of a trajectory.
 
+        Leaves that are not copied are shared by both trajectories. Groups are duplicated
+        as empty shells without any name checks or searches. Thus, besides a single
+        pass over the tree, only the copied leaves add to the costs, e.g. the explored
+        parameters in case of ``copy_leaves='explored'``.
+
         :param copy_leaves:
 
             If leaves should be **shallow** copied or simply referred to by both trees.
@@ -1149,6 +1159,7 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
         new_traj._run_started = self._run_started # For manually using a trajectory
         new_traj._run_by_environment = self._run_by_environment  # To disable manual running of experiment
+        new_traj._cancelled_runs = self._cancelled_runs
 
         new_traj._full_copy = self._full_copy
 
@@ -1167,8 +1178,8 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
         new_traj._is_run = self._is_run
 
-        new_traj._copy_from(self, copy_leaves=copy_leaves,
-                                   with_links=with_links)
+        new_traj._share_tree_from(self, copy_leaves=copy_leaves,
+                                  with_links=with_links)
 
         # Copy references to new nodes and leaves
         for my_dict, new_dict in ((self._new_nodes, new_traj._new_nodes),
@@ -1188,6 +1199,82 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
         return new_traj
 
+    def _share_tree_from(self, other, copy_leaves=True, with_links=True):
+        """Builds the tree of a new and empty trajectory from the tree of `other`.
+
+        Unlike :func:`~pypet.trajectory.Trajectory._copy_from` no names are checked and
+        no nodes are searched. Leaves are shared by both trees unless they are copied
+        according to `copy_leaves`. Groups need to be duplicated since they know the
+        natural naming interface of their tree, but only as empty shells sharing
+        comments and annotations. Hence, copying costs a single pass over the
+        tree plus copies of the explored parameters only.
+
+        :param other: The trajectory to copy from
+
+        :param copy_leaves:
+
+            If leaves should be **shallow** copied or simply referred to by both trees.
+            Accepts the setting ``'explored'`` to only copy explored parameters.
+
+        :param with_links: If links should be copied as well
+
+        """
+        nn_interface = self._nn_interface
+        flat_leaves = nn_interface._flat_leaf_storage_dict
+        copied_leaves = {}
+        linking_groups = []
+
+        stack = [(other, self)]
+        while stack:
+            old_group, new_group = stack.pop()
+            children = old_group._children_
+            if not children:
+                continue
+            links = old_group._links_
+            if links:
+                linking_groups.append((old_group, new_group))
+            for name, child in children.items():
+                if links and name in links:
+                    continue
+                if child._is_leaf:
+                    if copy_leaves is True or (copy_leaves == 'explored' and
+                                               child.v_is_parameter and child.v_explored):
+                        child = cp.copy(child)
+                        copied_leaves[child._full_name] = child
+                    if child.v_is_parameter and child.v_explored:
+                        self._explored_parameters[child._full_name] = child
+                    flat_leaves[child._full_name] = child
+                    new_group._leaves[name] = child
+                    new_child = child
+                else:
+                    new_child = child._clone_group(nn_interface)
+                    self._all_groups[new_child._full_name] = new_child
+                    if name in self._run_information:
+                        self._run_parent_groups[new_group._full_name] = new_group
+                    new_group._groups[name] = new_child
+                    stack.append((child, new_child))
+                new_group._children[name] = new_child
+                nn_interface._add_to_nodes_and_leaves(new_child)
+
+        for leaf_dict_name in ('_parameters', '_config', '_derived_parameters',
+                               '_results', '_other_leaves'):
+            leaf_dict = getattr(other, leaf_dict_name)
+            setattr(self, leaf_dict_name,
+                    dict((full_name, copied_leaves.get(full_name, leaf))
+                         for full_name, leaf in leaf_dict.items()))
+
+        if with_links:
+            for old_group, new_group in linking_groups:
+                for name, target in old_group._links_.items():
+                    full_name = target._full_name
+                    if target._is_leaf:
+                        new_target = copied_leaves.get(full_name, target)
+                    elif full_name:
+                        new_target = self._all_groups[full_name]
+                    else:
+                        new_target = self
+                    nn_interface._create_link(new_group, name, new_target)
+
     def _copy_from(self, node,
                           copy_leaves=True,
                           overwrite=False,
@@ -1337,10 +1424,16 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         NOTE:
 
         Since parameters are very conservative regarding the data they accept
-        (see :ref:`type_conservation`), you sometimes won't be able to use Numpy arrays
-        for exploration as iterables.
+        (see :ref:`type_conservation`), you sometimes won't be able to use Numpy
+        data for exploration.
 
-        For instance, the following code snippet won't work:
+        One-dimensional numpy arrays are accepted if their dtype is of the same kind
+        as the default value, e.g. floats for a python float. Such an array is checked
+        only once and kept as the exploration range, so
+        :func:`~pypet.parameter.Parameter.f_get_range` returns an array. Single runs
+        still see values of the type of the default value. These arrays are also
+        returned by :func:`~pypet.utils.explore.cartesian_product` if called with
+        ``as_arrays=True``:
 
         ::
 
@@ -1353,11 +1446,11 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
             traj.f_explore( { 'my_float_parameter': np.arange(42.0, 44.876, 0.23) } )
 
 
-        This will result in a `TypeError` because your exploration iterable
-        `np.arange(42.0, 44.876, 0.23)` contains `numpy.float64` values
+        Yet, other iterables of numpy values are checked item by item. For instance,
+        ``list(np.arange(42.0, 44.876, 0.23))`` results in a `TypeError`
+        because the list contains `numpy.float64` values
         whereas you parameter is supposed to use standard python floats.
-
-        Yet, you can use Numpys `tolist()` function to overcome this problem:
+        You can use Numpys `tolist()` function to overcome this problem:
 
         ::
 
@@ -1372,7 +1465,6 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                                    comment='My value is a numpy 64 bit float')
 
 
-
         """
         for run_idx in range(len(self)):
             if self.f_is_completed(run_idx):
@@ -1429,7 +1521,9 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
     def _add_run_info(self, idx, name='', timestamp=42.0, finish_timestamp=1.337,
                       runtime='forever and ever', time='>>Maybe time`s gone on strike',
                       completed=0, parameter_summary='Not yet my friend!',
-                      short_environment_hexsha='N/A'):
+                      short_environment_hexsha='N/A', peak_memory=0.0,
+                      dispatch_time=0.0, function_time=0.0, store_time=0.0,
+                      lock_time=0.0, ipc_time=0.0, process_id=0, thread_id=0):
         """Adds a new run to the `_run_information` dict."""
 
         if idx in self._single_run_ids:
@@ -1453,10 +1547,20 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                      'completed': completed,
                      'name': name,
                      'parameter_summary': parameter_summary,
-                     'short_environment_hexsha': short_environment_hexsha}
+                     'short_environment_hexsha': short_environment_hexsha,
+                     'peak_memory': peak_memory,
+                     'dispatch_time': dispatch_time,
+                     'function_time': function_time,
+                     'store_time': store_time,
+                     'lock_time': lock_time,
+                     'ipc_time': ipc_time,
+                     'process_id': process_id,
+                     'thread_id': thread_id}
 
         self._run_information[name] = info_dict
         self._length = len(self._run_information)
+        # Names of runs are translated during searches, so resolved names may change
+        self._nn_interface._tree_generation += 1
 
     @not_in_run
     def f_lock_parameters(self):
@@ -1797,10 +1901,41 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
             The backup file will be in the same folder as your hdf5 file and
             named 'backup_XXXXX.hdf5' where 'XXXXX' is the name of your current trajectory.
 
+        :param differential:
+
+            If the backup file already contains a backup of the trajectory, only the
+            nodes that were modified since this backup are copied and nodes that were
+            deleted are removed from the backup. Thus, the backup file always mirrors
+            the trajectory at the time of the latest backup.
+            Only the latest backup is updated this way, backup files
+            that have been superseded by a newer backup are copied as a whole again.
+            Set to `False` to raise a ValueError instead. Default is `True`.
+
         """
         self._storage_service.store(pypetconstants.BACKUP, self, trajectory_name=self.v_name,
                                     **kwargs)
 
+    @not_in_run
+    def f_restore_backup(self, **kwargs):
+        """Restores the trajectory on disk from its backup, see :func:`~pypet.Trajectory.f_backup`.
+
+        Only nodes that were modified since the backup are copied back and nodes that
+        were added afterwards are removed.
+        The trajectory in memory is left untouched,
+        load it anew to see the restored data.
+
+        Arguments of ``kwargs`` are directly passed to the storage service,
+        for the HDF5StorageService you can provide the following argument:
+
+        :param backup_filename:
+
+            Name of file containing the backup, if `None` the default name
+            of :func:`~pypet.Trajectory.f_backup` is used.
+
+        """
+        self._storage_service.store(pypetconstants.RESTORE, self, trajectory_name=self.v_name,
+                                    **kwargs)
+
     def _make_reversed_wildcards(self, old_length=-1):
         """Creates a full mapping from all wildcard translations to the corresponding wildcards"""
         if len(self._reversed_wildcards) > 0:
@@ -1830,8 +1965,16 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         IMPORTANT `backup=True` only backs up the current trajectory not any of
         the `other_trajectories`. If you need a backup of these, do it manually.
 
+        Merging happens in two passes. First, the parameters and run information of all
+        `other_trajectories` are merged in RAM and the names of all data to copy are
+        determined. Secondly, the changed parameters are stored once and the data of all
+        other trajectories is copied into the current file, which is kept open
+        for the whole pass. Progress and the time needed for every trajectory are logged.
+
         Parameters as for :func:`~pypet.trajectory.Trajectory.f_merge`.
 
+        :return: List of the seconds needed to copy the data of every other trajectory
+
         """
         other_length = len(other_trajectories)
         self._logger.info('Merging %d trajectories into the current one.' % other_length)
@@ -1840,20 +1983,48 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         if backup:
             self.f_backup()
 
+        old_length = len(self)
+        plans = []
+        changed_parameters = set()
         for idx, other in enumerate(other_trajectories):
-            self.f_merge(other, ignore_data=ignore_data,
-                         move_data=move_data,
-                         delete_other_trajectory=delete_other_trajectory,
-                         keep_info=keep_info,
-                         keep_other_trajectory_info=keep_other_trajectory_info,
-                         merge_config=merge_config,
-                         backup=False,
-                         consecutive_merge=True)
-            self._logger.log(21,'Merged %d out of %d' % (idx + 1, other_length))
+            plan = self._plan_merge(other, trial_parameter=None, remove_duplicates=False,
+                                    ignore_data=ignore_data, backup=False,
+                                    consecutive_merge=True)
+            changed_parameters.update(plan['changed_parameters'])
+            plans.append(plan)
+            self._logger.log(21, 'Planned %d out of %d merges' % (idx + 1, other_length))
+
+        self._storage_service.store(pypetconstants.OPEN_FILE, None,
+                                    trajectory_name=self.v_name)
+        timings = []
+        try:
+            self._logger.info('Updating Trajectory information and changed parameters in storage')
+            self._storage_service.store(pypetconstants.PREPARE_MERGE, self,
+                                        trajectory_name=self.v_name,
+                                        changed_parameters=list(changed_parameters),
+                                        old_length=old_length)
+
+            for idx, plan in enumerate(plans):
+                start = time.time()
+                self._copy_merged_data(plan, move_data=move_data,
+                                       delete_other_trajectory=delete_other_trajectory,
+                                       slow_merge=False)
+                self._finish_merge(plan, keep_info=keep_info,
+                                   keep_other_trajectory_info=keep_other_trajectory_info,
+                                   merge_config=merge_config)
+                plan['other_trajectory']._reversed_wildcards = {}
+                timings.append(time.time() - start)
+                self._logger.log(21, 'Merged %d out of %d, `%s` took %.2fs' %
+                                 (idx + 1, other_length, plan['other_trajectory'].v_name,
+                                  timings[-1]))
+        finally:
+            self._storage_service.store(pypetconstants.CLOSE_FILE, None)
+
         self._logger.info('Storing data to disk')
         self._reversed_wildcards = {}
         self.f_store()
         self._logger.info('Finished final storage')
+        return timings
 
     @not_in_run
     @kwargs_api_change('backup_filename', 'backup')
@@ -1893,7 +2064,8 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         :param remove_duplicates:
 
             Whether you want to remove duplicate parameter points.
-            Requires N1 * N2 (quadratic complexity in single runs).
+            Parameter space points are hashed, so this requires only N1 + N2 operations
+            (linear complexity in single runs).
             A ValueError is raised if no runs would be merged.
 
         :param ignore_data:
@@ -1949,10 +2121,12 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
         :param slow_merge:
             Enforces a slow merging. This means all data is loaded one after the other to
-            memory and stored to disk. Otherwise it is tried to directly copy the data
+            memory and stored to disk. Otherwise the HDF5 nodes are directly copied
             from one file into another without explicitly loading the data.
 
-        If you cannot directly merge trajectories within one HDF5 file, a slow merging process
+        Results and derived parameters are copied in bulk by the storage service, within one
+        HDF5 file as well as across files, and the overview tables are updated accordingly.
+        Only if the storage service does not support merging, a slow merging process
         is used. Results are loaded, stored, and emptied again one after the other. Might take
         some time!
 
@@ -1969,6 +2143,52 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
             self._logger.warning('If you do a consecutive merge and backup, '
                                  'your merging will still suffer from quadratic time complexity!')
 
+        plan = self._plan_merge(other_trajectory,
+                                trial_parameter=trial_parameter,
+                                remove_duplicates=remove_duplicates,
+                                ignore_data=ignore_data,
+                                backup=backup,
+                                consecutive_merge=consecutive_merge)
+
+        # The storage service needs to prepare the file for merging.
+        # This includes updating meta information and already storing the merged parameters
+        self._logger.info('Start copying results and single run derived parameters')
+        self._logger.info('Updating Trajectory information and changed parameters in storage')
+        self._storage_service.store(pypetconstants.PREPARE_MERGE, self,
+                                    trajectory_name=self.v_name,
+                                    changed_parameters=plan['changed_parameters'],
+                                    old_length=plan['old_length'])
+
+        self._copy_merged_data(plan, move_data=move_data,
+                               delete_other_trajectory=delete_other_trajectory,
+                               slow_merge=slow_merge)
+
+        self._finish_merge(plan, keep_info=keep_info,
+                           keep_other_trajectory_info=keep_other_trajectory_info,
+                           merge_config=merge_config)
+
+        # Write out the merged data to disk
+        if not consecutive_merge:
+            self._logger.info('Writing merged data to disk')
+            self.f_store(store_data=pypetconstants.STORE_DATA)
+            self._reversed_wildcards = {}
+        other_trajectory._reversed_wildcards = {}
+
+        self._logger.info('Finished Merging!')
+
+    def _plan_merge(self, other_trajectory, trial_parameter, remove_duplicates, ignore_data,
+                    backup, consecutive_merge):
+        """Merges the parameters and run information of the other trajectory in RAM.
+
+        No data is copied, but the names of all data that needs to be copied
+        into the current trajectory are collected.
+
+        :return:
+
+            Dictionary describing the merge, its `rename_dict` maps names in the
+            other trajectory to names in the current one.
+
+        """
         # Keep the timestamp of the merge
         timestamp = time.time()
         original_ignore_data = set(ignore_data)
@@ -2028,17 +2248,22 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                              allowed_translations=allowed_translations,
                              ignore_data=ignore_data)
 
-
-
-        # The storage service needs to prepare the file for merging.
-        # This includes updating meta information and already storing the merged parameters
-        self._logger.info('Start copying results and single run derived parameters')
-        self._logger.info('Updating Trajectory information and changed parameters in storage')
-        self._storage_service.store(pypetconstants.PREPARE_MERGE, self,
-                                    trajectory_name=self.v_name,
-                                    changed_parameters=changed_parameters,
-                                    old_length=old_len)
-
+        return dict(other_trajectory=other_trajectory,
+                    timestamp=timestamp,
+                    old_length=old_len,
+                    new_length=len(self),
+                    used_runs=used_runs,
+                    changed_parameters=changed_parameters,
+                    rename_dict=rename_dict,
+                    allowed_translations=allowed_translations,
+                    original_ignore_data=original_ignore_data,
+                    trial_parameter=trial_parameter,
+                    remove_duplicates=remove_duplicates)
+
+    def _copy_merged_data(self, plan, move_data, delete_other_trajectory, slow_merge):
+        """Copies the results and derived parameters of a merge `plan` into the current file"""
+        other_trajectory = plan['other_trajectory']
+        rename_dict = plan['rename_dict']
         if not slow_merge:
             try:
                 # Merge the single run derived parameters and all results
@@ -2066,7 +2291,7 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                 slow_merge = True
 
             except ValueError as exc:
-                # If both trajectories are stored in separate files we end up here
+                # If the other trajectory cannot be found in its file we end up here
                 self._logger.exception('Could not perfom fast merging. '
                                      'I will use the `f_load` method of the other trajectory and '
                                      'store the results slowly item by item. '
@@ -2077,6 +2302,16 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         if slow_merge:
             self._merge_slowly(other_trajectory, rename_dict)
 
+    def _finish_merge(self, plan, keep_info, keep_other_trajectory_info, merge_config):
+        """Merges config data and links and adds information about the merge `plan`"""
+        other_trajectory = plan['other_trajectory']
+        used_runs = plan['used_runs']
+        timestamp = plan['timestamp']
+        original_ignore_data = plan['original_ignore_data']
+        trial_parameter = plan['trial_parameter']
+        remove_duplicates = plan['remove_duplicates']
+        allowed_translations = plan['allowed_translations']
+
         # We will merge the git commits and other config data
         if merge_config:
             self._merge_config(other_trajectory)
@@ -2123,7 +2358,7 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                                   comment='Data to ignore during merge')
 
             config_name = 'merge.%s.length_before_merge' % merge_name
-            self.f_add_config(config_name, len(self),
+            self.f_add_config(config_name, plan['new_length'],
                               comment='Length of trajectory before merge')
 
             self.config.merge.v_comment = 'Settings and information of the different merges'
@@ -2166,15 +2401,6 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                     self.f_add_config(config_name, other_trajectory.v_comment,
                                       comment='Comment of other trajectory')
 
-        # Write out the merged data to disk
-        if not consecutive_merge:
-            self._logger.info('Writing merged data to disk')
-            self.f_store(store_data=pypetconstants.STORE_DATA)
-            self._reversed_wildcards = {}
-        other_trajectory._reversed_wildcards = {}
-
-        self._logger.info('Finished Merging!')
-
     def _merge_single_runs(self, other_trajectory, used_runs):
         """  Updates the `run_information` of the current trajectory."""
         count = len(self)  # Variable to count the increasing new run indices and create
@@ -2198,6 +2424,7 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                 short_environment_hexsha = other_info_dict['short_environment_hexsha']
                 finish_timestamp = other_info_dict['finish_timestamp']
                 runtime = other_info_dict['runtime']
+                peak_memory = other_info_dict.get('peak_memory', 0.0)
 
                 new_idx = used_runs[idx]
                 new_runname = self.f_wildcard('$', new_idx)
@@ -2211,7 +2438,11 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
                     completed=completed,
                     short_environment_hexsha=short_environment_hexsha,
                     finish_timestamp=finish_timestamp,
-                    runtime=runtime)
+                    runtime=runtime,
+                    peak_memory=peak_memory)
+                for key in pypetconstants.RUN_TIMINGS + ('process_id', 'thread_id'):
+                    if key in other_info_dict:
+                        info_dict[key] = other_info_dict[key]
 
                 self._add_run_info(**info_dict)
 
@@ -2662,42 +2893,25 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
             used_runs[idx] = idx
         if remove_duplicates:
 
-            # We need to compare all parameter combinations in the current trajectory
-            # to all parameter combinations in the other trajectory to spot duplicate points.
-            # Quadratic Complexity!
-            for irun in range(len(other_trajectory)):
-                for jrun in range(len(self)):
-                    change = True
-
-                    # Check all marked parameters
-                    for my_param, other_param in params_to_change.values():
-                        if other_param.f_has_range():
-                            other_param._set_parameter_access(irun)
-
-                        if my_param.f_has_range():
-                            my_param._set_parameter_access(jrun)
-
-                        val1 = my_param.f_get()
-                        val2 = other_param.f_get()
-
-                        # If only one parameter differs, the parameter space point differs
-                        # and we can skip the rest of the parameters
-                        if not my_param._equal_values(val1, val2):
-                            change = False
-                            break
-
-                    # If we found one parameter space point in the current trajectory
-                    # that matches the ith point in the other, we do not need the ith
-                    # point. We can also skip comparing to the rest of the points in the
-                    # current trajectory
-                    if change:
-                        del used_runs[irun]
-                        break
-
-            # Restore changed default values
-            for my_param, other_param in params_to_change.values():
-                other_param._restore_default()
-                my_param._restore_default()
+            # We hash all parameter combinations in the current trajectory and look up
+            # the combinations of the other trajectory to spot duplicate points.
+            # Only combinations with equal keys need to be compared.
+            my_params = [pair[0] for pair in params_to_change.values()]
+            other_params = [pair[1] for pair in params_to_change.values()]
+            buckets = {}
+            for jrun, key in enumerate(point_keys(my_params, len(self))):
+                buckets.setdefault(key, []).append(jrun)
+
+            other_keys = point_keys(other_params, len(other_trajectory))
+            for irun, key in enumerate(other_keys):
+                if key not in buckets:
+                    continue
+                other_values = point_values(other_params, irun)
+                # If we found one parameter space point in the current trajectory
+                # that matches the ith point in the other, we do not need the ith point.
+                if any(equal_points(my_params, point_values(my_params, jrun), other_values)
+                       for jrun in buckets[key]):
+                    del used_runs[irun]
 
 
         # Merge parameters into the current trajectory
@@ -2937,7 +3151,10 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
         The information dictionaries have the following key, value pairings:
 
-            * completed: Boolean, whether a run was completed
+            * completed:
+
+                Whether a run was completed, ``1`` if completed, ``0`` if not, and
+                ``-1`` if the run was cancelled
 
             * idx: Index of a run
 
@@ -2957,6 +3174,35 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
 
             * short_environment_hexsha: The short version of the environment SHA-1 code
 
+            * peak_memory:
+
+                Peak growth in MB of the resident memory of the process that executed
+                the run over its resident memory at the start of the run.
+                Only measured if the environment checks the memory usage,
+                ``0.0`` otherwise or if unknown. Note that in case of multiple threads
+                the growth of the whole process is measured.
+
+            * dispatch_time:
+
+                Seconds between handing the run to a worker and its start,
+                i.e. copying, pickling, and unpickling of the trajectory as well as
+                waiting in a queue of a pool
+
+            * function_time: Seconds spent in the job function
+
+            * store_time: Seconds spent storing the data of the run after the job function
+
+            * lock_time: Seconds the run waited for a lock of the storage service
+
+            * ipc_time:
+
+                Seconds spent sending data to the storage service in another process
+                or thread (includes pickling)
+
+            * process_id: Process ID of the worker that executed the run
+
+            * thread_id: Identifier of the thread that executed the run
+
 
         If no name or idx is given then a nested dictionary with keys as run names and
         info dictionaries as values is returned.
@@ -3050,6 +3296,17 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
             if item:
                 yield idx
 
+    def f_is_cancelled(self):
+        """Whether the current single run was cancelled via the environment.
+
+        Long running job functions can poll this regularly and return early
+        if their run was cancelled, see :func:`~pypet.environment.Environment.cancel_runs`.
+
+        :return: ``True`` or ``False``
+
+        """
+        return self._cancelled_runs is not None and self.v_idx in self._cancelled_runs
+
     def f_idx_to_run(self, name_or_idx):
         """Converts an integer idx to the corresponding single run name and vice versa.
 
@@ -3148,6 +3405,15 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         if self._environment_hexsha is not None:
             run_info_dict['short_environment_hexsha'] = self._environment_hexsha[0:7]
 
+    def _start_memory_meter(self):
+        """Starts measuring the memory growth of the current run.
+
+        The peak growth is added to the run information when the run is finished.
+
+        """
+        self._memory_meter = PeakMemoryMeter()
+        self._memory_meter.start()
+
     def _summarize_explored_parameters(self):
         """Summarizes the parameter settings.
 
@@ -3202,9 +3468,12 @@ class Trajectory(DerivedParameterGroup, ResultGroup, ParameterGroup, ConfigGroup
         runtime_run = str(findatetime - startdatetime)
 
         run_info_dict['parameter_summary'] = run_summary
-        run_info_dict['completed'] = 1
+        run_info_dict['completed'] = pypetconstants.RUN_COMPLETED
         run_info_dict['finish_timestamp'] = finish_timestamp_run
         run_info_dict['runtime'] = runtime_run
+        if self._memory_meter is not None:
+            run_info_dict['peak_memory'] = self._memory_meter.stop()
+            self._memory_meter = None
 
     def _construct_instance(self, constructor, full_name, *args, **kwargs):
         """ Creates a new node. Checks if the new node needs to know the trajectory.
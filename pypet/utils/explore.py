@@ -1,12 +1,14 @@
 """Module containing factory functions for parameter exploration"""
 
-import logging
 import sys
-import itertools as itools
 from collections import OrderedDict
 
+import numpy as np
 
-def cartesian_product(parameter_dict, combined_parameters=()):
+from pypet.utils.hashing import point_keys, equal_points
+
+
+def cartesian_product(parameter_dict, combined_parameters=(), as_arrays=False):
     """ Generates a Cartesian product of the input parameter dictionary.
 
     For example:
@@ -31,7 +33,16 @@ def cartesian_product(parameter_dict, combined_parameters=()):
         >>> print cartesian_product( {'param1': [42.0, 52.5], 'param2':['a', 'b'], 'param3' : [1,2,3]}, ('param3',('param1', 'param2')))
         {param3':[1,1,2,2,3,3],'param1' : [42.0,52.5,42.0,52.5,42.0,52.5], 'param2':['a','b','a','b','a','b']}
 
-    :returns: Dictionary with cartesian product lists.
+    :param as_arrays:
+
+        If homogeneous data should be returned as one-dimensional numpy arrays instead
+        of lists. Data that cannot be turned into such an array is still returned as a list.
+        Parameters keep these arrays as their exploration range without checking every
+        item, as long as the dtype is of the same kind as the default value
+        (e.g. floats for a python float or ``np.float64``). Their ``f_get_range()``
+        returns a numpy array then.
+
+    :returns: Dictionary with cartesian product lists (or arrays).
 
     """
     if not combined_parameters:
@@ -43,30 +54,58 @@ def cartesian_product(parameter_dict, combined_parameters=()):
         if isinstance(item, str):
             combined_parameters[idx] = (item,)
 
-    iterator_list = []
+    values_dict = {}
+    lengths = []
     for item_tuple in combined_parameters:
-        inner_iterator_list = [parameter_dict[key] for key in item_tuple]
-        zipped_iterator = zip(*inner_iterator_list)
-        iterator_list.append(zipped_iterator)
+        for key in item_tuple:
+            values = parameter_dict[key]
+            if not isinstance(values, np.ndarray):
+                values = list(values)
+            values_dict[key] = values
+        # Linked parameters are zipped, so the shortest one determines the length
+        lengths.append(min(len(values_dict[key]) for key in item_tuple))
 
     result_dict = {}
     for key in parameter_dict:
         result_dict[key] = []
 
-    cartesian_iterator = itools.product(*iterator_list)
-
-    for cartesian_tuple in cartesian_iterator:
-        for idx, item_tuple in enumerate(combined_parameters):
-            for inneridx, key in enumerate(item_tuple):
-                result_dict[key].append(cartesian_tuple[idx][inneridx])
+    # The first parameters change slowest, like in `itertools.product`
+    total_length = int(np.prod(lengths, dtype=np.int64))
+    if total_length == 0:
+        return result_dict
+    repeats = total_length
+    for item_tuple, length in zip(combined_parameters, lengths):
+        repeats //= length
+        indices = np.tile(np.repeat(np.arange(length), repeats),
+                          total_length // (length * repeats))
+        for key in item_tuple:
+            result_dict[key] = _take(values_dict[key], indices, as_arrays)
 
     return result_dict
 
 
+def _take(values, indices, as_arrays):
+    """Returns the `values` at positions `indices` as list or, if possible, as array"""
+    if as_arrays:
+        if isinstance(values, np.ndarray):
+            array = values
+        elif len(set(type(value) for value in values)) == 1:
+            array = np.array(values)
+        else:
+            array = None
+        if array is not None and array.ndim == 1 and not array.dtype.hasobject:
+            return array[indices]
+    if isinstance(values, np.ndarray):
+        return list(values[indices])
+    return list(map(values.__getitem__, indices.tolist()))
+
+
 def find_unique_points(explored_parameters):
     """Takes a list of explored parameters and finds unique parameter combinations.
 
-    If parameter ranges are hashable operates in O(N), otherwise O(N**2).
+    Operates in O(N). Unhashable values like numpy arrays are replaced by digests
+    of their data (see :mod:`pypet.utils.hashing`) and only combinations sharing
+    the same digests are compared via the parameters' `_equal_values`.
 
     :param explored_parameters:
 
@@ -88,23 +127,22 @@ def find_unique_points(explored_parameters):
             unique_elements[val_tuple].append(idx)
         return list(unique_elements.items())
     except TypeError:
-        logger = logging.getLogger('pypet.find_unique')
-        logger.error('Your parameter entries could not be hashed, '
-                     'now I am sorting slowly in O(N**2).')
-        unique_elements = []
-        for idx, val_tuple in enumerate(zipped_tuples):
-            matches = False
-            for added_tuple, pos_list in unique_elements:
-                matches = True
-                for idx2, val in enumerate(added_tuple):
-                    if not explored_parameters[idx2]._equal_values(val_tuple[idx2], val):
-                        matches = False
-                        break
-                if matches:
-                    pos_list.append(idx)
-                    break
-            if not matches:
-                unique_elements.append((val_tuple, [idx]))
-        return unique_elements
+        pass
+
+    # Every bucket contains the unique combinations sharing the same keys
+    buckets = {}
+    unique_elements = []
+    keys = point_keys(explored_parameters, len(zipped_tuples))
+    for idx, val_tuple in enumerate(zipped_tuples):
+        bucket = buckets.setdefault(keys[idx], [])
+        for added_tuple, pos_list in bucket:
+            if equal_points(explored_parameters, val_tuple, added_tuple):
+                pos_list.append(idx)
+                break
+        else:
+            element = (val_tuple, [idx])
+            bucket.append(element)
+            unique_elements.append(element)
+    return unique_elements
 
 
@@ -0,0 +1,148 @@
+"""Module to turn parameter values into stable keys for hashing.
+
+Many parameter values, like numpy arrays, sparse matrices, or tuples containing these,
+cannot be used as dictionary keys. Such values are canonicalized into SHA-1 digests
+of their type, dtype, shape, and raw data. Values that are equal yield the same digest,
+so duplicate parameter points can be found in linear time by looking up keys.
+Since different values may in principle share a digest, candidates found via a key
+should still be compared with the parameter's `_equal_values`.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import pickle
+import hashlib
+
+import numpy as np
+import scipy.sparse as spsp
+
+
+DIGEST = 'DIGEST'
+"""Marks keys that are digests of unhashable values"""
+
+
+def update_hash(hasher, value):
+    """Feeds a parameter value into a `hashlib` object.
+
+    Numpy arrays are digested via their dtype, shape, and raw data because their `repr` is
+    truncated for large arrays. Sparse matrices are digested via their format and
+    canonical CSR representation. Containers are handled recursively and everything else
+    is pickled.
+
+    """
+    if isinstance(value, np.ndarray):
+        _update_array_header(hasher, value.dtype, value.shape)
+        if value.dtype.hasobject:
+            hasher.update(pickle.dumps(value.tolist(), protocol=2))
+        else:
+            hasher.update(np.ascontiguousarray(value).tobytes())
+    elif spsp.isspmatrix(value):
+        # Matrices of different formats are not considered equal
+        csr = value.tocsr(copy=True)
+        csr.sum_duplicates()
+        csr.sort_indices()
+        hasher.update(b'spmatrix')
+        hasher.update(value.format.encode('utf-8'))
+        hasher.update(str(csr.shape).encode('utf-8'))
+        for array in (csr.data, csr.indices, csr.indptr):
+            update_hash(hasher, array)
+    elif isinstance(value, (list, tuple)):
+        hasher.update(type(value).__name__.encode('utf-8'))
+        hasher.update(str(len(value)).encode('utf-8'))
+        for item in value:
+            update_hash(hasher, item)
+    elif isinstance(value, str):
+        hasher.update(b'str')
+        hasher.update(value.encode('utf-8'))
+    else:
+        hasher.update(pickle.dumps(value, protocol=2))
+
+
+def _update_array_header(hasher, dtype, shape):
+    hasher.update(b'ndarray')
+    hasher.update(dtype.str.encode('utf-8'))
+    hasher.update(str(shape).encode('utf-8'))
+
+
+def value_digest(value):
+    """Returns the SHA-1 hex digest of a value, see :func:`update_hash`"""
+    hasher = hashlib.sha1()
+    update_hash(hasher, value)
+    return hasher.hexdigest()
+
+
+def value_key(value):
+    """Returns a key for `value` that can be used in dictionaries and sets.
+
+    Hashable values are their own key, unhashable values are replaced by their digest.
+
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return DIGEST, value_digest(value)
+
+
+def range_keys(values):
+    """Returns the keys of all values of a parameter range.
+
+    If the range consists of numpy arrays of the same dtype and shape, the arrays are
+    stacked once and the rows are digested directly from the stacked data.
+    The keys are the same as computed by :func:`value_key`.
+
+    """
+    values = list(values)
+    if (len(values) > 1 and
+            all(isinstance(value, np.ndarray) for value in values)):
+        first = values[0]
+        if (not first.dtype.hasobject and
+                all(value.dtype == first.dtype and value.shape == first.shape
+                    for value in values)):
+            header = hashlib.sha1()
+            _update_array_header(header, first.dtype, first.shape)
+            rows = np.stack(values).reshape(len(values), -1)
+            keys = []
+            for row in rows:
+                hasher = header.copy()
+                hasher.update(row.tobytes())
+                keys.append((DIGEST, hasher.hexdigest()))
+            return keys
+    return [value_key(value) for value in values]
+
+
+def point_keys(parameters, length):
+    """Returns one key per run for the parameter space points spanned by `parameters`.
+
+    :param parameters:
+
+        List of parameters, parameters without a range contribute their
+        default value to every point.
+
+    :param length: Number of runs
+
+    :return: List of tuples containing the keys of every parameter
+
+    """
+    if not parameters:
+        return [()] * length
+    columns = []
+    for param in parameters:
+        if param.f_has_range():
+            columns.append(range_keys(param.f_get_range(copy=False)))
+        else:
+            columns.append([value_key(param.f_get())] * length)
+    return list(zip(*columns))
+
+
+def point_values(parameters, idx):
+    """Returns the values of all `parameters` in run `idx`"""
+    return tuple(param.f_get_range(copy=False)[idx] if param.f_has_range()
+                 else param.f_get() for param in parameters)
+
+
+def equal_points(parameters, values1, values2):
+    """Checks if two parameter space points are equal according to the `parameters`"""
+    return all(param._equal_values(val1, val2)
+               for param, val1, val2 in zip(parameters, values1, values2))
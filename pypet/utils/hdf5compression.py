@@ -1,12 +1,33 @@
-"""Module to allow hdf5 compression via ptrepack directly within python scripts"""
+"""Module to allow hdf5 compression via ptrepack or an in-process repacker
+directly within python scripts"""
 
 __author__ = 'Robert Meyer'
 
 import os
 import subprocess
+import time
+
+import tables as pt
 
 from pypet.trajectory import load_trajectory
 from pypet import pypetconstants
+from pypet.utils.helpful_functions import progressbar
+from pypet.utils.resumejournal import ResumeJournal
+
+
+REPACK_CHECKPOINT = 100
+"""Number of copied leaves after which the progress of repacking is saved to disk"""
+
+
+def _get_compression_properties(filename, name, index):
+    """Returns complevel, complib, shuffle, and fletcher32 of a trajectory in the file"""
+    if name is None and index is None:
+        index = -1
+
+    tmp_traj = load_trajectory(name, index, as_new=False, load_all=pypetconstants.LOAD_NOTHING,
+                               force=True, filename=filename)
+    service = tmp_traj.v_storage_service
+    return service.complevel, service.complib, service.shuffle, service.fletcher32
 
 
 def compact_hdf5_file(filename, name=None, index=None, keep_backup=True):
@@ -42,16 +63,7 @@ def compact_hdf5_file(filename, name=None, index=None, keep_backup=True):
         The return/error code of ptrepack
 
     """
-    if name is None and index is None:
-        index = -1
-
-    tmp_traj = load_trajectory(name, index, as_new=False, load_all=pypetconstants.LOAD_NOTHING,
-                               force=True, filename=filename)
-    service = tmp_traj.v_storage_service
-    complevel = service.complevel
-    complib = service.complib
-    shuffle = service.shuffle
-    fletcher32 = service.fletcher32
+    complevel, complib, shuffle, fletcher32 = _get_compression_properties(filename, name, index)
 
     name_wo_ext, ext = os.path.splitext(filename)
     tmp_filename = name_wo_ext + '_tmp' + ext
@@ -83,4 +95,221 @@ def compact_hdf5_file(filename, name=None, index=None, keep_backup=True):
         os.rename(tmp_filename, filename)
         print('### Compacting and Renaming finished ####')
 
-    return retcode
\ No newline at end of file
+    return retcode
+
+
+def _log(logger, msg):
+    if logger == 'print':
+        print(msg)
+    elif logger is not None:
+        logger.info(msg)
+
+
+def repack_hdf5_file(filename, name=None, index=None, branches=None,
+                     complevel=None, complib=None, shuffle=None, fletcher32=None,
+                     chunkshape=None, ncores=1, resume=True, keep_backup=True,
+                     logger='print'):
+    """Repacks an HDF5 file within python to change compression and reduce file size.
+
+    In contrast to :func:`~pypet.utils.hdf5compression.compact_hdf5_file` no
+    ``ptrepack`` process is started. The nodes are copied one after the other into
+    a temporary file that is renamed to `filename` in the end. Progress and throughput
+    are reported to the `logger`.
+
+    The repacking can be resumed after an interruption. Every `REPACK_CHECKPOINT` leaves
+    the temporary file is flushed and the names of the copied leaves are appended to a
+    :class:`~pypet.utils.resumejournal.ResumeJournal` next to the temporary file. Calling the function again with `resume=True`
+    skips the leaves in the journal and copies the rest.
+
+    HDF5 itself is not thread safe, so chunks cannot be written from several python
+    threads. Instead, blosc is allowed to compress every chunk with `ncores` threads.
+    Thus, more than one core can only be used if `complib` is one of the blosc
+    compressors, other libraries like pypet's default zlib always compress with
+    a single thread.
+
+    :param filename:
+
+        Name of the file to repack
+
+    :param name:
+
+        The name of the trajectory from which default compression properties are taken
+
+    :param index:
+
+        Instead of a name you could also specify an index, i.e -1 for the last trajectory
+        in the file.
+
+    :param branches:
+
+        List of branches within the trajectories that should be repacked with the
+        new compression properties, e.g. ``['results.runs']``.
+        All other nodes are copied with their original filters.
+        Leave `None` to repack everything.
+
+    :param complevel: Compression level, `None` to take the one of the trajectory
+
+    :param complib: Compression library, `None` to take the one of the trajectory
+
+    :param shuffle: Whether to use shuffle filtering, `None` to take the one of the trajectory
+
+    :param fletcher32: Whether to add checksums, `None` to take the one of the trajectory
+
+    :param chunkshape:
+
+        Function that is passed every chunked leaf of the repacked branches and returns the
+        new chunk shape or `None` to keep the original one.
+
+    :param ncores:
+
+        Number of threads used by blosc to compress chunks. Values larger than 1
+        raise a ValueError if `complib` is not a blosc compressor.
+
+    :param resume:
+
+        If the repacking should continue from a previously interrupted one.
+        Otherwise a temporary file of a previous run is discarded.
+
+    :param keep_backup:
+
+        If a back up version of the original file should be kept.
+        The backup file is named as the original but `_backup` is appended to the end.
+
+    :param logger:
+
+        Logger to report progress to, use 'print' for the print statement or `None`
+        to stay silent.
+
+    :return:
+
+        Dictionary with the number of copied `leaves`, the `bytes_read` and
+        `bytes_written` as well as the elapsed `seconds`.
+
+    """
+    if ncores < 1:
+        raise ValueError('You need at least one core for repacking, not `%d`.' % ncores)
+
+    if any(prop is None for prop in (complevel, complib, shuffle, fletcher32)):
+        properties = _get_compression_properties(filename, name, index)
+        complevel, complib, shuffle, fletcher32 = [new if new is not None else old
+                                                   for new, old in
+                                                   zip((complevel, complib, shuffle, fletcher32),
+                                                       properties)]
+    if ncores > 1 and not complib.startswith('blosc'):
+        raise ValueError('Only blosc compressors can use several cores, not `%s`. Please '
+                         'choose a blosc `complib` or set `ncores=1`.' % complib)
+    filters = pt.Filters(complevel=complevel, complib=complib,
+                         shuffle=shuffle, fletcher32=fletcher32)
+
+    name_wo_ext, ext = os.path.splitext(filename)
+    tmp_filename = name_wo_ext + '_tmp' + ext
+    journal_filename = tmp_filename + '.journal'
+
+    journal = ResumeJournal(journal_filename, sync_every=1)
+    if resume and os.path.isfile(tmp_filename) and os.path.isfile(journal_filename):
+        done = set(pathname for record in journal.read_records() for pathname in record)
+        mode = 'a'
+        _log(logger, 'Resuming repacking of `%s`, %d leaves are already done.' %
+             (filename, len(done)))
+    else:
+        done = set()
+        mode = 'w'
+        if os.path.isfile(journal_filename):
+            os.remove(journal_filename)
+
+    if ncores > 1:
+        old_blosc_threads = pt.set_blosc_max_threads(ncores)
+    else:
+        old_blosc_threads = None
+
+    leaves = 0
+    bytes_read = 0
+    bytes_written = 0
+    start = time.time()
+    try:
+        with pt.open_file(filename, mode='r') as src_file, \
+                pt.open_file(tmp_filename, mode=mode, title=src_file.title) as dst_file, \
+                journal:
+
+            prefixes = None
+            if branches is not None:
+                prefixes = ['/' + group._v_name + '/' + branch.replace('.', '/')
+                            for group in src_file.root._f_iter_nodes('Group')
+                            for branch in branches]
+
+            def is_selected(pathname):
+                if prefixes is None:
+                    return True
+                return any(pathname == prefix or pathname.startswith(prefix + '/')
+                           for prefix in prefixes)
+
+            src_file.root._v_attrs._f_copy(dst_file.root)
+            nodes = list(src_file.walk_nodes('/'))
+            total = len(nodes)
+            pending = []
+            for idx, node in enumerate(nodes):
+                if node is src_file.root:
+                    continue
+                pathname = node._v_pathname
+                parent = dst_file.get_node(node._v_parent._v_pathname)
+                selected = is_selected(pathname)
+
+                if isinstance(node, pt.Group):
+                    if pathname in dst_file:
+                        new_group = dst_file.get_node(pathname)
+                    else:
+                        new_group = dst_file.create_group(parent, node._v_name,
+                                                          title=node._v_title,
+                                                          filters=filters if selected
+                                                          else node._v_filters)
+                    node._v_attrs._f_copy(new_group)
+                elif pathname not in done:
+                    if pathname in dst_file:
+                        # Leftover of an interrupted copy
+                        dst_file.remove_node(pathname, recursive=True)
+                    if isinstance(node, pt.Leaf):
+                        kwargs = {}
+                        if selected:
+                            kwargs['filters'] = filters
+                            if chunkshape is not None and node.chunkshape is not None:
+                                new_chunkshape = chunkshape(node)
+                                if new_chunkshape is not None:
+                                    kwargs['chunkshape'] = new_chunkshape
+                        new_leaf = node.copy(newparent=parent, newname=node._v_name,
+                                             **kwargs)
+                        leaves += 1
+                        bytes_read += node.size_on_disk
+                        bytes_written += new_leaf.size_on_disk
+                    else:
+                        # Soft and external links
+                        node._f_copy(newparent=parent, newname=node._v_name)
+                    pending.append(pathname)
+
+                if len(pending) >= REPACK_CHECKPOINT:
+                    dst_file.flush()
+                    journal.append(pending)
+                    pending = []
+
+                progressbar(idx, total, logger=logger, reprint=False)
+
+            dst_file.flush()
+            journal.append(pending)
+    finally:
+        if old_blosc_threads is not None:
+            pt.set_blosc_max_threads(old_blosc_threads)
+
+    seconds = time.time() - start
+    _log(logger, 'Repacked %d leaves (%.1f MB to %.1f MB) in %.2fs, %.1f MB/s' %
+         (leaves, bytes_read / 1e6, bytes_written / 1e6, seconds,
+          bytes_read / 1e6 / max(seconds, 1e-6)))
+
+    if keep_backup:
+        backup_file_name = name_wo_ext + '_backup' + ext
+        os.rename(filename, backup_file_name)
+    else:
+        os.remove(filename)
+    os.rename(tmp_filename, filename)
+    os.remove(journal_filename)
+
+    return dict(leaves=leaves, bytes_read=bytes_read, bytes_written=bytes_written,
+                seconds=seconds)
@@ -3,8 +3,11 @@ __author__ = 'Robert Meyer'
 import numpy as np
 import itertools as itools
 import hashlib
+import threading
 from collections import deque
 
+from pypet.utils.helpful_functions import get_memory_usage, get_peak_memory
+
 
 class Universe(object):
     """Contains everything"""
@@ -115,6 +118,121 @@ class HashArray(object):
         return int(hashlib.sha1(self._ndarray.view(np.uint8)).hexdigest(), 16)
 
 
+class PeakMemoryMeter(object):
+    """Measures by how much the resident memory of the process grows during a run.
+
+    The resident set size at :func:`~pypet.utils.helpful_classes.PeakMemoryMeter.start`
+    is the baseline and a daemon thread samples the resident set size every `interval`
+    seconds until :func:`~pypet.utils.helpful_classes.PeakMemoryMeter.stop`.
+    If the run raises the lifetime peak of the process, this exact peak is used instead.
+    Note that the growth of the whole process is measured, so concurrent threads
+    add to each other's measurements.
+
+    :param interval: Seconds between two samples
+
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self._baseline = 0.0
+        self._lifetime_peak = 0.0
+        self._peak = 0.0
+        self._stop_event = None
+        self._thread = None
+
+    def start(self):
+        """Takes the baseline and starts sampling"""
+        self._baseline = get_memory_usage()
+        self._lifetime_peak = get_peak_memory()
+        self._peak = self._baseline
+        if self._baseline > 0.0:
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._sample)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            self._peak = max(self._peak, get_memory_usage())
+
+    def stop(self):
+        """Stops sampling.
+
+        :return: Peak growth of resident memory in MB since the start, ``0.0`` if unknown
+
+        """
+        if self._thread is None:
+            return 0.0
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        peak = max(self._peak, get_memory_usage())
+        lifetime_peak = get_peak_memory()
+        if lifetime_peak > self._lifetime_peak:
+            peak = max(peak, lifetime_peak)
+        return max(0.0, peak - self._baseline)
+
+
+class MemoryModel(object):
+    """Predicts the memory footprint of single runs from their explored parameter values.
+
+    The footprint is modelled as a linear function of all numerical explored values
+    and fitted via least squares to the peak memory of completed runs.
+    As long as there are too few observations for a fit, the maximum
+    observed footprint or the `prior` is returned.
+    Predictions are increased by the standard deviation of the residuals
+    to err on the safe side.
+
+    :param prior: Estimate in MB used before any run has completed
+
+    """
+    def __init__(self, prior=0.0):
+        self.prior = prior
+        self._features = []
+        self._targets = []
+        self._coefficients = None
+        self._margin = 0.0
+
+    def __len__(self):
+        return len(self._targets)
+
+    @staticmethod
+    def make_features(values):
+        """Turns explored values into a feature vector, non-numerical values are ignored"""
+        features = [1.0]
+        for value in values:
+            if isinstance(value, (bool, np.bool_)):
+                features.append(float(value))
+            elif isinstance(value, (int, float, np.number)):
+                features.append(float(value))
+        return features
+
+    def add(self, values, peak_memory):
+        """Adds the peak memory in MB of a completed run with the given explored `values`"""
+        self._features.append(self.make_features(values))
+        self._targets.append(float(peak_memory))
+        self._coefficients = None
+
+    def _fit(self):
+        features = np.array(self._features)
+        targets = np.array(self._targets)
+        self._coefficients = np.linalg.lstsq(features, targets, rcond=-1)[0]
+        residuals = targets - features.dot(self._coefficients)
+        self._margin = float(np.std(residuals))
+
+    def predict(self, values):
+        """Predicts the peak memory in MB of a run with the given explored `values`"""
+        if not self._targets:
+            return self.prior
+        features = self.make_features(values)
+        if len(self._targets) <= len(features):
+            # Too few data points for a reliable fit
+            return max(self._targets)
+        if self._coefficients is None:
+            self._fit()
+        prediction = float(np.dot(features, self._coefficients)) + self._margin
+        return max(prediction, 0.0)
+
+
 class TrajectoryMock(object):
     """Helper class that mocks properties of a trajectory.
 
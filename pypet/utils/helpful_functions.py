@@ -11,6 +11,16 @@ try:
     import zmq
 except ImportError:
     zmq = None
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available under Windows
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from pypet import pypetconstants
 
 
 def is_debug():
@@ -292,7 +302,7 @@ def result_sort(result_list, start_index=0):
     :param start_index: Index with which to start, every entry before `start_index` is ignored
 
     """
-    if len(result_list) < 2:
+    if len(result_list) - start_index < 2:
         return result_list
     to_sort = result_list[start_index:]
     minmax = [x[0] for x in to_sort]
@@ -377,3 +387,105 @@ def racedirs(path):
                 # This error won't be any good
                 raise
 
+
+def get_memory_usage():
+    """Returns the current resident set size of the current process in MB.
+
+    Uses psutil_ if available and ``/proc/self/statm`` otherwise.
+
+    :return: Resident memory in MB or ``0.0`` if it cannot be determined
+
+    """
+    if psutil is not None:
+        try:
+            return psutil.Process().memory_info().rss / 1024.0 / 1024.0
+        except (psutil.Error, OSError):
+            pass
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+def get_peak_memory():
+    """Returns the peak resident set size of the current process in MB.
+
+    Uses ``resource.getrusage`` if available and psutil_ otherwise.
+    Note that the peak is taken over the entire lifetime of the process,
+    use :class:`~pypet.utils.helpful_classes.PeakMemoryMeter` to measure single runs.
+
+    :return: Peak memory in MB or ``0.0`` if it cannot be determined
+
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            # Bytes under OSX but kilobytes under Linux
+            return peak / 1024.0 / 1024.0
+        return peak / 1024.0
+    if psutil is not None:
+        try:
+            memory_info = psutil.Process().memory_info()
+            # `peak_wset` only exists under Windows
+            peak = getattr(memory_info, 'peak_wset', memory_info.rss)
+            return peak / 1024.0 / 1024.0
+        except (psutil.Error, OSError):
+            pass
+    return 0.0
+
+
+def make_trace_events(run_information):
+    """Turns run information dictionaries into a timeline in the Chrome trace event format.
+
+    The timeline can be viewed with ``chrome://tracing`` or https://ui.perfetto.dev.
+    Every worker process and thread gets its own track. A single run is shown as a slice
+    containing the job function and storage phases. Dispatching is shown
+    as a separate slice before the run.
+    Since only durations of phases are measured, phases within a run are laid out
+    one after the other.
+
+    :param run_information: Iterable of run information dictionaries of finished runs
+
+    :return: Dictionary that can be dumped as JSON
+
+    """
+    events = []
+    workers = set()
+    # Cancelled runs have a start time but were never executed
+    run_information = [info for info in run_information
+                       if info['completed'] == pypetconstants.RUN_COMPLETED]
+    if run_information:
+        origin = min(info['timestamp'] - info.get('dispatch_time', 0.0)
+                     for info in run_information)
+    for info in run_information:
+        pid = info.get('process_id', 0)
+        tid = info.get('thread_id', 0)
+        if pid not in workers:
+            workers.add(pid)
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': 'Worker %d' % pid}})
+
+        def _add_slice(name, start, duration, args=None):
+            event = {'name': name, 'cat': 'pypet', 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': (start - origin) * 1e6, 'dur': max(duration, 0.0) * 1e6}
+            if args:
+                event['args'] = args
+            events.append(event)
+
+        start = info['timestamp']
+        dispatch_time = info.get('dispatch_time', 0.0)
+        function_time = info.get('function_time', 0.0)
+        if dispatch_time > 0.0:
+            _add_slice('dispatch', start - dispatch_time, dispatch_time)
+        _add_slice(info['name'], start, info['finish_timestamp'] - start,
+                   {'idx': info['idx'],
+                    'completed': info['completed'],
+                    'parameter_summary': info.get('parameter_summary', ''),
+                    'peak_memory': info.get('peak_memory', 0.0)})
+        _add_slice('function', start, function_time)
+        _add_slice('store', start + function_time, info.get('store_time', 0.0),
+                   {'lock_time': info.get('lock_time', 0.0),
+                    'ipc_time': info.get('ipc_time', 0.0)})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -3,17 +3,25 @@
 __author__ = 'Robert Meyer', 'Mehmet Nevvaf Timur'
 
 
-from threading import ThreadError
+from threading import ThreadError, local
 import queue
 import pickle
 try:
     import zmq
 except ImportError:
     zmq = None
+if pickle.HIGHEST_PROTOCOL >= 5:
+    oob_pickle = pickle
+else:
+    try:
+        import pickle5 as oob_pickle
+    except ImportError:
+        oob_pickle = None
 
 from collections import deque
 import copy as cp
 import gc
+import multiprocessing.util as mputil
 import sys
 from threading import Thread
 import time
@@ -24,6 +32,22 @@ import pypet.pypetconstants as pypetconstants
 from pypet.pypetlogging import HasLogger
 from pypet.utils.decorators import retry
 from pypet.utils.helpful_functions import is_ipv6
+from pypet.utils.storagemetrics import StorageMetrics, LockStatistics
+
+
+class WaitTimes(local):
+    """Thread-local accumulators of the seconds spent waiting for locks and in
+    inter-process communication with the storage service.
+
+    Single runs take the difference of the accumulators before and after the run.
+
+    """
+    def __init__(self):
+        self.lock = 0.0
+        self.ipc = 0.0
+
+
+wait_times = WaitTimes()
 
 
 class MultiprocWrapper(object):
@@ -49,6 +73,22 @@ class MultiprocWrapper(object):
         """This wrapper guarantees multiprocessing safety"""
         return True
 
+    def pop_metrics(self):
+        """Returns storage metrics collected by this wrapper since the last call.
+
+        Wrappers that do not store data themselves have no metrics and return `None`.
+
+        """
+        return None
+
+    def sync(self):
+        """Blocks until all data sent so far has been received by the storing process.
+
+        Only needed for wrappers that send data without waiting for a response.
+
+        """
+        pass
+
     def store(self, *args, **kwargs):
         raise NotImplementedError('Implement this!')
 
@@ -97,6 +137,8 @@ class LockerServer(ZMQServer):
     def __init__(self, url="tcp://127.0.0.1:7777"):
         super(LockerServer, self).__init__(url)
         self._locks = {}  # lock DB, format 'lock_name': ('client_id', 'request_id')
+        self._waiting = {}  # clients waiting for a lock, format 'lock_name': {'client_id'}
+        self.metrics = StorageMetrics()  # Retries and queue depths are in `metrics.locks`
 
     def _pre_respond_hook(self, response):
         """ Hook that can be used to temper with the server before responding
@@ -131,6 +173,15 @@ class LockerServer(ZMQServer):
             self._locks[name] = (client_id, request_id)
             return self.GO
 
+    def _track_waiting(self, name, client_id, response):
+        """Records retries and the number of waiting clients for a lock request"""
+        waiting = self._waiting.setdefault(name, set())
+        if response == self.WAIT:
+            waiting.add(client_id)
+            self.metrics.locks.record_retry(client_id, len(waiting))
+        else:
+            waiting.discard(client_id)
+
     def _unlock(self, name, client_id, request_id):
         """Handles unlocking
 
@@ -183,6 +234,7 @@ class LockerServer(ZMQServer):
 
                 if msg == self.LOCK:
                     response = self._lock(name, client_id, request_id)
+                    self._track_waiting(name, client_id, response)
 
                 elif msg == self.UNLOCK:
                     response = self._unlock(name, client_id, request_id)
@@ -545,6 +597,7 @@ class QueuingServer(HasLogger):
         self._storage_service = storage_service
         self._queue_maxsize = queue_maxsize
         self._gc_interval = gc_interval
+        self.metrics = None
 
     def run(self):
         main_queue = queue.Queue(maxsize=self._queue_maxsize)
@@ -556,6 +609,7 @@ class QueuingServer(HasLogger):
 
         storage_writer.run()
         server_queue.join()
+        self.metrics = storage_writer.metrics
 
 
 class QueuingClient(ReliableClient):
@@ -647,6 +701,302 @@ class ForkAwareLockerClient(LockerClient, ForkDetector):
         super(ForkAwareLockerClient, self).start(test_connection)
 
 
+def dump_frames(obj):
+    """Pickles `obj` into a list of frames.
+
+    With pickle protocol 5 large buffers, like the data of numpy arrays,
+    are not copied into the pickle but become frames of their own.
+
+    """
+    if oob_pickle is None:
+        return [pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)]
+    buffers = []
+    dump = oob_pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    return [dump] + [buffer.raw() for buffer in buffers]
+
+
+def load_frames(frames):
+    """Inverse of :func:`~pypet.utils.mpwrappers.dump_frames`.
+
+    Accepts bytes or zmq frames, the latter are unpickled without copying their data.
+
+    """
+    frames = [getattr(frame, 'buffer', frame) for frame in frames]
+    if oob_pickle is None:
+        return pickle.loads(frames[0])
+    return oob_pickle.loads(frames[0], buffers=frames[1:])
+
+
+class CreditQueue(queue.Queue):
+    """Queue of items sent by streaming clients.
+
+    Items are put together with the identity of their client. Whenever an item is taken
+    from the queue, the identity is remembered in `consumed` so that the client
+    can be granted a new credit.
+
+    """
+
+    def __init__(self, maxsize=0):
+        super(CreditQueue, self).__init__(maxsize=maxsize)
+        self.consumed = deque()
+
+    def get(self, block=True, timeout=None):
+        identity, item = super(CreditQueue, self).get(block=block, timeout=timeout)
+        if identity is not None:
+            self.consumed.append(identity)
+        return item
+
+
+class StreamingServerMessageListener(ZMQServer):
+    """Receives streamed data and grants credits to the clients.
+
+    Every client is granted `window` credits when it connects. Every message sent
+    costs one credit and the credit is returned as soon as the message is
+    taken from the queue for storing. Accordingly, clients never wait for
+    a response unless they run out of credits or explicitly synchronize.
+
+    """
+
+    HELLO = 'HELLO'  # registers a new client
+    CREDIT = 'CREDIT'  # grants credits to a client
+    DATA = 'DATA'  # batch of messages
+    SYNC = 'SYNC'  # asks for confirmation that all previous data was received
+    SYNCED = 'SYNCED'  # confirms receipt of all previous data
+    UNLIMITED = 2 ** 31  # credits in case of an unlimited window
+    POLL_TIMEOUT = 10  # milliseconds between checking for consumed messages
+
+    def __init__(self, url, queue, window):
+        super(StreamingServerMessageListener, self).__init__(url)
+        self.queue = queue
+        if window == 0:
+            window = self.UNLIMITED
+        self.window = window
+
+    def _start(self):
+        self._logger.info('Starting Streaming Server at `%s`' % self._url)
+        self._context = zmq.Context()
+        self._socket = self._context.socket(zmq.ROUTER)
+        self._socket.ipv6 = is_ipv6(self._url)
+        self._socket.bind(self._url)
+
+    def _send(self, identity, *frames):
+        self._socket.send_multipart([identity] + [frame.encode() for frame in frames])
+
+    def _grant_credits(self):
+        """Returns the credits of all consumed messages to their clients"""
+        credits = {}
+        while self.queue.consumed:
+            identity = self.queue.consumed.popleft()
+            credits[identity] = credits.get(identity, 0) + 1
+        for identity, credit in credits.items():
+            self._send(identity, self.CREDIT, str(credit))
+
+    def _put_data(self, identity, frames):
+        """Unpickles a batch of messages and puts them on the queue"""
+        counts = pickle.loads(frames[0].bytes)
+        position = 1
+        for count in counts:
+            self.queue.put((identity, load_frames(frames[position:position + count])))
+            position += count
+
+    def listen(self):
+        """Handles the requests of the clients until one of them sends `DONE`"""
+        self._start()
+        poll = zmq.Poller()
+        poll.register(self._socket, zmq.POLLIN)
+        while True:
+            self._grant_credits()
+            if not poll.poll(self.POLL_TIMEOUT):
+                continue
+            frames = self._socket.recv_multipart(copy=False)
+            identity = frames[0].bytes
+            request = frames[1].bytes.decode()
+
+            if request == self.DATA:
+                self._put_data(identity, frames[2:])
+
+            elif request == self.HELLO:
+                self._send(identity, self.CREDIT, str(self.window))
+
+            elif request == self.SYNC:
+                self._send(identity, self.SYNCED, frames[2].bytes.decode())
+
+            elif request == self.PING:
+                self._send(identity, self.PONG)
+
+            elif request == self.DONE:
+                self._send(identity, self.CLOSED)
+                self.queue.put((None, ('DONE', [], {})))
+                self._close()
+                break
+
+            else:
+                raise RuntimeError('I did not understand your request %s' % request)
+
+
+class StreamingQueuingServer(QueuingServer):
+    """Implements server architecture for streaming with credit based flow control"""
+
+    def run(self):
+        main_queue = CreditQueue()
+        server_message_listener = StreamingServerMessageListener(self._url, main_queue,
+                                                                 self._queue_maxsize)
+        storage_writer = QueueStorageServiceWriter(self._storage_service, main_queue,
+                                                   self._gc_interval)
+
+        server_queue = Thread(target=server_message_listener.listen, args=())
+        server_queue.start()
+
+        storage_writer.run()
+        server_queue.join()
+        self.metrics = storage_writer.metrics
+
+
+class StreamingQueuingClient(ReliableClient):
+    """Streams data to a :class:`~pypet.utils.mpwrappers.StreamingQueuingServer`.
+
+    In contrast to the :class:`~pypet.utils.mpwrappers.QueuingClient` data is sent without
+    waiting for a response as long as the client has credits left.
+    If `batch_size` is larger than 1, messages are collected and sent together.
+    Call `sync` to make sure all data put so far has been received by the server.
+
+    """
+
+    def __init__(self, url='tcp://127.0.0.1:22334', batch_size=1):
+        super(StreamingQueuingClient, self).__init__(url)
+        self.batch_size = batch_size
+        self._window = 0
+        self._credits = 0
+        self._batch = []
+        self._sync_count = 0
+
+    def __getstate__(self):
+        result_dict = super(StreamingQueuingClient, self).__getstate__()
+        result_dict['_window'] = 0
+        result_dict['_credits'] = 0
+        result_dict['_batch'] = []
+        return result_dict
+
+    def start(self, test_connection=True):
+        if self._context is None:
+            self._window = 0
+            self._credits = 0
+            self._batch = []
+            super(StreamingQueuingClient, self).start(test_connection)
+            self._socket.send_string(StreamingServerMessageListener.HELLO)
+            self._window = int(self._wait_for(StreamingServerMessageListener.CREDIT)[1])
+
+    def _start_socket(self):
+        self._socket = self._context.socket(zmq.DEALER)
+        self._socket.ipv6 = is_ipv6(self.url)
+        self._socket.connect(self.url)
+        self._poll.register(self._socket, zmq.POLLIN)
+
+    def _receive(self):
+        """Receives a message and books the credits if it grants any"""
+        frames = self._socket.recv_multipart()
+        response = [frame.decode() for frame in frames]
+        if response[0] == StreamingServerMessageListener.CREDIT:
+            self._credits += int(response[1])
+        return response
+
+    def _wait_for(self, expected):
+        """Waits for the response `expected` and returns it.
+
+        The server is pinged whenever it stays quiet for a while,
+        e.g. because the storage of data takes long.
+
+        """
+        retries_left = self.RETRIES
+        while True:
+            socks = dict(self._poll.poll(self.TIMEOUT))
+            if socks.get(self._socket) == zmq.POLLIN:
+                retries_left = self.RETRIES
+                response = self._receive()
+                self._logger.log(1, 'Received `%s`', response)
+                if response[0] == expected:
+                    return response
+            else:
+                retries_left -= 1
+                self._logger.debug('No response from server (%d retries left)' %
+                                   retries_left)
+                if retries_left == 0:
+                    raise RuntimeError('Server seems to be offline!')
+                self._socket.send_string(ZMQServer.PING)
+
+    def _drain(self):
+        """Books all credits that have arrived so far"""
+        while self._poll.poll(0):
+            self._receive()
+
+    def _req_rep(self, request):
+        self._flush()
+        self._socket.send_string(request)
+        if request == ZMQServer.PING:
+            expected = ZMQServer.PONG
+        elif request == ZMQServer.DONE:
+            expected = ZMQServer.CLOSED
+        else:
+            raise RuntimeError('I do not know the response to %s' % request)
+        return self._wait_for(expected)[0]
+
+    def _flush(self):
+        """Sends the current batch as soon as there are enough credits"""
+        if not self._batch:
+            return
+        needed = len(self._batch)
+        self._drain()
+        while self._credits < needed:
+            self._wait_for(StreamingServerMessageListener.CREDIT)
+        frames = [StreamingServerMessageListener.DATA.encode(),
+                  pickle.dumps([len(item) for item in self._batch])]
+        for item in self._batch:
+            frames.extend(item)
+        self._socket.send_multipart(frames, copy=False)
+        self._credits -= needed
+        self._batch = []
+
+    def put(self, data, block=True):
+        """Sends data to the server, blocks only if there are no credits left"""
+        self.start(test_connection=False)
+        self._batch.append(dump_frames(data))
+        if len(self._batch) >= min(self.batch_size, self._window):
+            self._flush()
+
+    def sync(self):
+        """Sends all remaining data and waits until the server confirms receiving it"""
+        self.start(test_connection=False)
+        self._flush()
+        self._sync_count += 1
+        token = str(self._sync_count)
+        self._socket.send_multipart([StreamingServerMessageListener.SYNC.encode(),
+                                     token.encode()])
+        while self._wait_for(StreamingServerMessageListener.SYNCED)[1] != token:
+            pass
+
+
+class ForkAwareStreamingQueuingClient(StreamingQueuingClient, ForkDetector):
+    """Streaming Client that can detect forking of processes.
+
+    In this case the context and socket are restarted and data not yet
+    sent by the parent process is discarded.
+
+    """
+
+    def __init__(self, url='tcp://127.0.0.1:22334', batch_size=1):
+        super(ForkAwareStreamingQueuingClient, self).__init__(url, batch_size)
+        self._pid = None
+
+    def __getstate__(self):
+        result_dict = super(ForkAwareStreamingQueuingClient, self).__getstate__()
+        result_dict['_pid'] = None
+        return result_dict
+
+    def start(self, test_connection=True):
+        self._detect_fork()
+        super(ForkAwareStreamingQueuingClient, self).start(test_connection)
+
+
 class QueueStorageServiceSender(MultiprocWrapper, HasLogger):
     """ For multiprocessing with :const:`~pypet.pypetconstants.WRAP_MODE_QUEUE`, replaces the
         original storage service.
@@ -679,10 +1029,12 @@ class QueueStorageServiceSender(MultiprocWrapper, HasLogger):
         """Puts data on queue"""
         old = self.pickle_queue
         self.pickle_queue = False
+        start = time.time()
         try:
             self.queue.put(to_put, block=True)
         finally:
             self.pickle_queue = old
+            wait_times.ipc += time.time() - start
 
     def store(self, *args, **kwargs):
         """Puts data to store on queue.
@@ -692,16 +1044,46 @@ class QueueStorageServiceSender(MultiprocWrapper, HasLogger):
         """
         self._put_on_queue(('STORE', args, kwargs))
 
+    def sync(self):
+        """Waits until the queue confirms receiving all data, if the queue supports it"""
+        if hasattr(self.queue, 'sync'):
+            start = time.time()
+            try:
+                self.queue.sync()
+            finally:
+                wait_times.ipc += time.time() - start
+
     def send_done(self):
         """Signals the writer that it can stop listening to the queue"""
         self._put_on_queue(('DONE', [], {}))
 
 
+class PicklingQueue(queue.Queue):
+    """Queue for threads that pickles items when they are put on the queue.
+
+    Can be used together with the
+    :class:`~pypet.utils.mpwrappers.QueueStorageServiceSender` and
+    the :class:`~pypet.utils.mpwrappers.QueueStorageServiceWriter` to store data
+    in a thread without blocking the producers.
+    Pickling decouples the stored data from objects that are still modified
+    by the producers, like trajectories after the storage request was sent.
+
+    """
+
+    def put(self, item, block=True, timeout=None):
+        dump = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        super(PicklingQueue, self).put(dump, block=block, timeout=timeout)
+
+    def get(self, block=True, timeout=None):
+        dump = super(PicklingQueue, self).get(block=block, timeout=timeout)
+        return pickle.loads(dump)
+
+
 class LockAcquisition(HasLogger):
     """Abstract class to allow lock acquisition and release.
 
-    Assumes that implementing classes have a ``lock``, ``is_locked`` and
-    ``is_open`` attribute.
+    Assumes that implementing classes have a ``lock``, ``is_locked``,
+    ``is_open``, and ``lock_statistics`` attribute.
 
     Requires a ``_logger`` for error messaging.
 
@@ -709,7 +1091,12 @@ class LockAcquisition(HasLogger):
     @retry(9, TypeError, 0.01, 'pypet.retry')
     def acquire_lock(self):
         if not self.is_locked:
+            start = time.time()
             self.is_locked = self.lock.acquire()
+            self._lock_acquired_at = time.time()
+            wait = self._lock_acquired_at - start
+            wait_times.lock += wait
+            self.lock_statistics.record_wait(self._get_lock_client_id(), wait)
 
     @retry(9, TypeError, 0.01, 'pypet.retry')
     def release_lock(self):
@@ -720,6 +1107,27 @@ class LockAcquisition(HasLogger):
                 self._logger.exception('Could not release lock, '
                                        'probably has been released already!')
             self.is_locked = False
+            self.lock_statistics.record_hold(self._get_lock_client_id(),
+                                             time.time() - self._lock_acquired_at)
+
+    def _get_lock_client_id(self):
+        """Returns the id of the lock client or the host and process id of the current process"""
+        client_id = getattr(self.lock, 'id', None)
+        if client_id is None:
+            pid = os.getpid()
+            if self._lock_client_id is None or self._lock_client_id[0] != pid:
+                self._lock_client_id = (pid, LockerClient._get_id())
+            client_id = self._lock_client_id[1]
+        return client_id
+
+    def _reset_lock_statistics(self):
+        self.lock_statistics.reset()
+
+    def _pop_lock_metrics(self, metrics):
+        """Moves the lock statistics into `metrics`"""
+        metrics.locks.merge(self.lock_statistics)
+        self.lock_statistics.reset()
+        return metrics
 
 
 class PipeStorageServiceSender(MultiprocWrapper, LockAcquisition):
@@ -727,15 +1135,25 @@ class PipeStorageServiceSender(MultiprocWrapper, LockAcquisition):
         self.conn = storage_connection
         self.lock = lock
         self.is_locked = False
+        self.lock_statistics = LockStatistics()
+        self._lock_acquired_at = None
+        self._lock_client_id = None
         self._set_logger()
+        # Forked processes should only count their own lock usage
+        mputil.register_after_fork(self, PipeStorageServiceSender._reset_lock_statistics)
 
     def __getstate__(self):
         # result = super(PipeStorageServiceSender, self).__getstate__()
         result = self.__dict__.copy()
         result['conn'] = None
         result['lock'] = None
+        result['lock_statistics'] = LockStatistics()
         return result
 
+    def pop_metrics(self):
+        """Returns the lock statistics of sending data over the pipe"""
+        return self._pop_lock_metrics(StorageMetrics())
+
     def load(self, *args, **kwargs):
         raise NotImplementedError('Pipe wrapping does not support loading. If you want to '
                                   'load data in a multiprocessing environment, use the Lock '
@@ -745,7 +1163,9 @@ class PipeStorageServiceSender(MultiprocWrapper, LockAcquisition):
     def _put_on_pipe(self, to_put):
         """Puts data on queue"""
         self.acquire_lock()
+        start = time.time()
         self._send_chunks(to_put)
+        wait_times.ipc += time.time() - start
         self.release_lock()
 
     def _make_chunk_iterator(self, to_chunk, chunksize):
@@ -796,6 +1216,8 @@ class StorageServiceDataHandler(HasLogger):
         self._trajectory_name = ''
         self.gc_interval = gc_interval
         self.operation_counter = 0
+        self.metrics = StorageMetrics()
+        self.error = None  # Exception that stopped listening, if any
         self._set_logger()
 
     def __repr__(self):
@@ -840,8 +1262,11 @@ class StorageServiceDataHandler(HasLogger):
                         self._close_file()
                     self._trajectory_name = trajectory_name
                     self._open_file()
+                start = time.time()
                 self._storage_service.store(store_msg, stuff_to_store, *args, **kwargs)
                 self._storage_service.store(pypetconstants.FLUSH, None)
+                self.metrics.record('handle.%s' % store_msg, time.time() - start)
+                self.metrics.increment('messages')
                 self._check_and_collect_garbage()
             else:
                 raise RuntimeError('You queued something that was not '
@@ -855,17 +1280,29 @@ class StorageServiceDataHandler(HasLogger):
         return stop
 
     def run(self):
-        """Starts listening to the queue."""
+        """Starts listening to the queue.
+
+        If listening fails, the exception is kept as `error` before it is raised,
+        so that it can be re-raised by the thread or process that started the handler.
+
+        """
         try:
             while True:
+                start = time.time()
                 msg, args, kwargs = self._receive_data()
+                self.metrics.record('receive', time.time() - start)
                 stop = self._handle_data(msg, args, kwargs)
                 if stop:
                     break
+        except Exception as exc:
+            self.error = exc
+            raise
         finally:
             if self._storage_service.is_open:
                 self._close_file()
             self._trajectory_name = ''
+            if hasattr(self._storage_service, 'pop_metrics'):
+                self.metrics.merge(self._storage_service.pop_metrics())
 
     def _receive_data(self):
         raise NotImplementedError('Implement this!')
@@ -952,12 +1389,18 @@ class LockWrapper(MultiprocWrapper, LockAcquisition):
         self.lock = lock
         self.is_locked = False
         self.pickle_lock = True
+        self.lock_statistics = LockStatistics()
+        self._lock_acquired_at = None
+        self._lock_client_id = None
         self._set_logger()
+        # Forked processes should only count their own lock usage
+        mputil.register_after_fork(self, LockWrapper._reset_lock_statistics)
 
     def __getstate__(self):
         result = super(LockWrapper, self).__getstate__()
         if not self.pickle_lock:
             result['lock'] = None
+        result['lock_statistics'] = LockStatistics()
         return result
 
     def __repr__(self):
@@ -979,6 +1422,14 @@ class LockWrapper(MultiprocWrapper, LockAcquisition):
         """Usually storage services are not supposed to be multiprocessing safe"""
         return True
 
+    def pop_metrics(self):
+        """Returns the metrics of the wrapped storage service, if it collects any,
+        together with the lock statistics"""
+        metrics = StorageMetrics()
+        if hasattr(self._storage_service, 'pop_metrics'):
+            metrics.merge(self._storage_service.pop_metrics())
+        return self._pop_lock_metrics(metrics)
+
     def store(self, *args, **kwargs):
         """Acquires a lock before storage and releases it afterwards."""
         try:
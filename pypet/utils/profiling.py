@@ -0,0 +1,80 @@
+"""Module containing helpers to profile single runs with :mod:`cProfile`.
+
+Statistics are passed around as the raw dictionaries of :mod:`cProfile`, i.e.
+``{(filename, line, function): (primitive_calls, calls, tottime, cumtime, callers)}``,
+because these are picklable and can be sent from worker processes to the main process.
+There they can be merged into a single :class:`pstats.Stats` object.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import cProfile
+import pstats
+
+import pandas as pd
+
+
+PROFILE_COLUMNS = ('function', 'ncalls', 'primitive_calls', 'tottime', 'cumtime')
+"""Columns of the data frames created by :func:`~pypet.utils.profiling.stats_to_frame`"""
+
+
+class _RawStats(object):
+    """Wraps a raw statistics dictionary such that :class:`pstats.Stats` can digest it"""
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def is_profiled(idx, profile_runs):
+    """Checks if the run with index `idx` should be profiled.
+
+    :param profile_runs:
+
+        `None` to profile no run, an integer `N` to profile every Nth run,
+        or a container of run indices
+
+    """
+    if profile_runs is None:
+        return False
+    if isinstance(profile_runs, int):
+        return idx % profile_runs == 0
+    return idx in profile_runs
+
+
+def profile_call(func, *args, **kwargs):
+    """Calls `func` with the given arguments under :mod:`cProfile`.
+
+    :return: Tuple of the return value of `func` and the raw statistics dictionary
+
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def stats_to_frame(stats):
+    """Turns a raw statistics dictionary into a data frame sorted by cumulative time"""
+    rows = [(pstats.func_std_string(func), calls, primitive_calls, tottime, cumtime)
+            for func, (primitive_calls, calls, tottime, cumtime, _) in stats.items()]
+    frame = pd.DataFrame(rows, columns=PROFILE_COLUMNS)
+    frame.sort_values('cumtime', ascending=False, inplace=True)
+    frame.reset_index(drop=True, inplace=True)
+    return frame
+
+
+def merge_stats(merged, stats):
+    """Adds a raw statistics dictionary to a :class:`pstats.Stats` object.
+
+    :param merged: The :class:`pstats.Stats` to add to or `None` to create a new one
+
+    :return: The merged :class:`pstats.Stats`
+
+    """
+    if merged is None:
+        return pstats.Stats(_RawStats(stats))
+    merged.add(_RawStats(stats))
+    return merged
@@ -0,0 +1,165 @@
+"""Module containing an append-only journal of finished single runs.
+
+If an environment is `resumable`, the results and run information of every finished run
+are appended to a single journal file. Each record is framed by a header containing a
+magic marker, the length of the payload, and a CRC32 checksum. Accordingly,
+a journal can be read sequentially and a partially written trailing record,
+for instance, due to a power failure, is detected and dropped.
+
+Every record is flushed to the operating system right away, so it survives a crash
+of the python process. To avoid an expensive `fsync` for every run, the journal
+is only synced to disk in batches. Hence, only a crash of the whole machine may lose
+the most recent records.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import os
+import time
+import struct
+import zlib
+import pickle
+try:
+    import dill
+except ImportError:
+    dill = None
+
+from pypet.pypetlogging import HasLogger
+
+
+class ResumeJournal(HasLogger):
+    """Append-only journal of result tuples ``((idx, result), run_information)``.
+
+    Other picklable records can be journaled as well, but then they must be read
+    via :func:`~pypet.utils.resumejournal.ResumeJournal.read_records`.
+
+    :param filename:
+
+        The journal file, it is created if it does not exist.
+
+    :param sync_every:
+
+        The file is synced to disk via `fsync` after `sync_every` appended records...
+
+    :param sync_interval:
+
+        ...or if the last sync is longer ago than `sync_interval` seconds.
+
+    """
+
+    MAGIC = b'PJRN'
+    HEADER = struct.Struct('<4sII')  # Magic marker, payload length, and CRC32 of the payload
+
+    def __init__(self, filename, sync_every=100, sync_interval=1.0):
+        self._set_logger()
+        self.filename = filename
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._dumps = pickle.dumps if dill is None else dill.dumps
+        self._loads = pickle.loads if dill is None else dill.loads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read(self):
+        """Reads all intact result tuples from the journal.
+
+        If a run was recorded more than once, only the last record is kept.
+
+        :return: Dictionary mapping run indices to result tuples
+
+        """
+        return dict((result_tuple[0][0], result_tuple) for result_tuple in self.read_records())
+
+    def read_records(self):
+        """Reads all intact records from the journal in the order they were appended"""
+        records, _ = self._read()
+        return records
+
+    def _read(self, load=True):
+        """Returns the records and the size of the intact part of the journal
+
+        :param load:
+
+            If the records should be unpickled, otherwise only the headers and checksums
+            are verified and an empty list of records is returned.
+
+        """
+        records = []
+        valid_size = 0
+        if not os.path.isfile(self.filename):
+            return records, valid_size
+        with open(self.filename, 'rb') as fh:
+            while True:
+                header = fh.read(self.HEADER.size)
+                if not header:
+                    break
+                if len(header) < self.HEADER.size:
+                    self._logger.warning('Found truncated record header in journal `%s`, '
+                                         'I will ignore it.' % self.filename)
+                    break
+                magic, length, checksum = self.HEADER.unpack(header)
+                if magic != self.MAGIC:
+                    self._logger.warning('Found corrupted record in journal `%s`, I will '
+                                         'ignore all following records.' % self.filename)
+                    break
+                payload = fh.read(length)
+                if len(payload) < length or zlib.crc32(payload) & 0xffffffff != checksum:
+                    self._logger.warning('Found truncated or corrupted record in '
+                                         'journal `%s`, I will ignore it.' % self.filename)
+                    break
+                if load:
+                    records.append(self._loads(payload))
+                valid_size = fh.tell()
+        return records, valid_size
+
+    def open(self):
+        """Opens the journal for appending.
+
+        A damaged tail of an existing journal is cut off before new records are appended.
+
+        """
+        if self._file is not None:
+            return
+        _, valid_size = self._read(load=False)
+        self._file = open(self.filename, 'ab')
+        if self._file.tell() > valid_size:
+            self._file.truncate(valid_size)
+            self._file.seek(valid_size)
+        self._last_sync = time.time()
+
+    def append(self, record):
+        """Appends a record, usually the result tuple of a finished run"""
+        if self._file is None:
+            self.open()
+        payload = self._dumps(record, protocol=2)
+        self._file.write(self.HEADER.pack(self.MAGIC, len(payload),
+                                          zlib.crc32(payload) & 0xffffffff))
+        self._file.write(payload)
+        self._file.flush()
+        self._unsynced += 1
+        if (self._unsynced >= self.sync_every or
+                time.time() - self._last_sync >= self.sync_interval):
+            self.sync()
+
+    def sync(self):
+        """Forces all appended records to disk"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def close(self):
+        """Syncs and closes the journal"""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,290 @@
+"""Module containing a content-addressed cache for results of single runs.
+
+A :class:`~pypet.utils.runcache.RunCache` maps a hash of all parameter values of a run
+(explored and non-explored) plus a code version to the results and the return value
+computed by the user's job function. If an environment is given a cache, runs
+whose parameter combination has already been computed by the same code are no longer
+executed but the results are copied from the cache instead.
+
+The cache lives in a local folder. Every entry is a pickle file and an
+`sqlite3` index keeps track of sizes and access times to allow eviction by
+total size and age.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import os
+import time
+import pickle
+import hashlib
+import sqlite3
+import threading
+
+from pypet.pypetlogging import HasLogger
+from pypet.utils.hashing import update_hash
+
+
+class RunCache(HasLogger):
+    """Content-addressed cache for results of single runs.
+
+    :param folder:
+
+        Local folder the cache lives in. Is created if it does not exist.
+        The cache can be shared among different trajectories and environments.
+
+    :param max_size:
+
+        Maximum size of the cache in MB. If the cache grows beyond this size,
+        least recently used entries are evicted. `None` means no limit.
+
+    :param max_age:
+
+        Maximum age of entries in seconds. Older entries are evicted. `None` means
+        entries never expire.
+
+    :param timeout:
+
+        Timeout in seconds to wait for the lock of the `sqlite3` index if several
+        processes access the cache concurrently.
+
+    """
+
+    INDEX_NAME = 'index.sqlite'
+
+    def __init__(self, folder, max_size=None, max_age=None, timeout=60.0):
+        self._set_logger()
+        self.folder = os.path.abspath(folder)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.timeout = timeout
+        # Connections are opened lazily, one per thread and process
+        self._local = None
+        self._pid = None
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+    def __getstate__(self):
+        result = super(RunCache, self).__getstate__()
+        # Connections cannot be pickled, every process opens its own
+        result['_local'] = None
+        result['_pid'] = None
+        return result
+
+    def __repr__(self):
+        return '<%s at `%s`>' % (self.__class__.__name__, self.folder)
+
+    def __len__(self):
+        return self._execute('SELECT COUNT(*) FROM entries')[0][0]
+
+    def __contains__(self, key):
+        return len(self._execute('SELECT key FROM entries WHERE key=?', (key,))) > 0
+
+    @property
+    def size(self):
+        """Total size of all entries in bytes"""
+        size = self._execute('SELECT SUM(size) FROM entries')[0][0]
+        return 0 if size is None else size
+
+    def _connect(self):
+        """Returns the connection of the current thread and opens it if necessary.
+
+        `sqlite3` connections must not be used by other threads and
+        forked processes must not use the connections of their parent.
+
+        """
+        pid = os.getpid()
+        if self._local is None or self._pid != pid:
+            self._local = threading.local()
+            self._pid = pid
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(os.path.join(self.folder, self.INDEX_NAME),
+                                         timeout=self.timeout)
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                                   '(key TEXT PRIMARY KEY, size INTEGER, '
+                                   'created REAL, accessed REAL)')
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, statement, args=()):
+        connection = self._connect()
+        with connection:
+            return connection.execute(statement, args).fetchall()
+
+    def _filename(self, key):
+        return os.path.join(self.folder, key + '.pkl')
+
+    def close(self):
+        """Closes the connection of the current thread to the index"""
+        if self._local is not None and self._pid == os.getpid():
+            connection = getattr(self._local, 'connection', None)
+            if connection is not None:
+                connection.close()
+                self._local.connection = None
+
+    @staticmethod
+    def make_key(traj, code_version):
+        """Computes the key of the current run of a trajectory.
+
+        The key is the SHA-1 hash of the `code_version` and the names and values of all
+        parameters of the trajectory.
+
+        :return:
+
+            The key or `None` if a parameter is empty, e.g. because its data was not loaded.
+            Such runs cannot be identified and are not cached.
+
+        """
+        hasher = hashlib.sha1()
+        hasher.update(str(code_version).encode('utf-8'))
+        for full_name in sorted(traj._parameters.keys()):
+            param = traj._parameters[full_name]
+            if param.f_is_empty():
+                return None
+            hasher.update(full_name.encode('utf-8'))
+            update_hash(hasher, param.f_get())
+        return hasher.hexdigest()
+
+    def load(self, key):
+        """Returns the entry stored under `key` or `None` if there is no such entry"""
+        if key not in self:
+            return None
+        try:
+            with open(self._filename(key), 'rb') as fh:
+                entry = pickle.load(fh)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            self._logger.warning('Could not read cache entry `%s`, '
+                                 'removing it from the cache.' % key)
+            self.remove(key)
+            return None
+        self._execute('UPDATE entries SET accessed=? WHERE key=?', (time.time(), key))
+        return entry
+
+    def save(self, key, entry):
+        """Stores a new entry under `key` and evicts old entries if necessary.
+
+        :return: `True` if the entry could be stored, `False` if it could not be pickled.
+
+        """
+        try:
+            dump = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            self._logger.warning('Could not pickle cache entry `%s`, the run is not '
+                                 'cached: %s' % (key, repr(exc)))
+            return False
+        filename = self._filename(key)
+        tmp_filename = filename + '.%d.tmp' % os.getpid()
+        with open(tmp_filename, 'wb') as fh:
+            fh.write(dump)
+        # Renaming is atomic, so other processes never read half written entries
+        os.replace(tmp_filename, filename)
+        now = time.time()
+        self._execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                      (key, len(dump), now, now))
+        self.evict()
+        return True
+
+    @staticmethod
+    def make_run_entry(traj, result):
+        """Collects all leaves added during the current run of `traj` and the `result`.
+
+        Needs to be called before the run is finalized and its data is removed from
+        the trajectory. Links are not cached.
+
+        """
+        leaves = [child for _, child in traj._new_nodes.values() if child.v_is_leaf]
+        return {'result': result,
+                'leaves': leaves,
+                'trajectory': traj.v_name,
+                'run_name': traj.v_crun,
+                'run_set': traj.f_wildcard('$set')}
+
+    def save_run(self, key, entry, run_information):
+        """Caches an `entry` of :func:`~pypet.utils.runcache.RunCache.make_run_entry`.
+
+        :param run_information:
+
+            Run information dictionary of the finalized run
+
+        """
+        entry['run_information'] = run_information
+        return self.save(key, entry)
+
+    def restore_run(self, traj, entry):
+        """Adds the cached leaves of an `entry` to the current run of `traj`.
+
+        The leaves are renamed, i.e. the run (and run set) names of the cached run
+        are replaced by the ones of the current run.
+
+        The cached run information is restored as well.
+
+        :return: The cached result of the user's job function
+
+        """
+        self.restore_run_information(traj, entry)
+        replacements = {entry['run_name']: traj.v_crun,
+                        entry['run_set']: traj.f_wildcard('$set')}
+        for leaf in entry['leaves']:
+            split_names = [replacements.get(name, name)
+                           for name in leaf.v_full_name.split('.')]
+            leaf._rename('.'.join(split_names))
+            leaf._stored = False
+            traj.f_add_leaf(leaf)
+        self._logger.info('Found run `%s` in the cache, copied results of run `%s` '
+                          'of trajectory `%s`.' % (traj.v_crun, entry['run_name'],
+                                                   entry['trajectory']))
+        return entry['result']
+
+    @staticmethod
+    def restore_run_information(traj, entry):
+        """Copies the cached run information to the current run of `traj`.
+
+        The index and name of the current run are kept. Since finalizing a run
+        updates its timing fields, the environment restores them once more afterwards.
+
+        """
+        run_information = traj.f_get_run_information(traj.v_idx, copy=False)
+        for key, value in entry['run_information'].items():
+            if key not in ('idx', 'name'):
+                run_information[key] = value
+
+    def remove(self, key):
+        """Removes a single entry"""
+        self._execute('DELETE FROM entries WHERE key=?', (key,))
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Evicts entries older than `max_age` and least recently used
+        entries until the cache is smaller than `max_size`.
+
+        :return: Number of evicted entries
+
+        """
+        evicted = []
+        if self.max_age is not None:
+            rows = self._execute('SELECT key FROM entries WHERE created<?',
+                                 (time.time() - self.max_age,))
+            evicted.extend(row[0] for row in rows)
+        if self.max_size is not None:
+            max_bytes = self.max_size * 1024.0 * 1024.0
+            rows = self._execute('SELECT key, size FROM entries ORDER BY accessed DESC')
+            total = 0
+            for key, size in rows:
+                total += size
+                if total > max_bytes and key not in evicted:
+                    evicted.append(key)
+        for key in evicted:
+            self.remove(key)
+        if evicted:
+            self._logger.debug('Evicted %d entries from the run cache.' % len(evicted))
+        return len(evicted)
+
+    def clear(self):
+        """Removes all entries"""
+        for row in self._execute('SELECT key FROM entries'):
+            self.remove(row[0])
@@ -0,0 +1,218 @@
+"""Module containing counters and latency histograms of storage operations.
+
+The :class:`~pypet.storageservice.HDF5StorageService` and the multiprocessing writers
+(see :mod:`pypet.utils.mpwrappers`) record their operations into
+:class:`~pypet.utils.storagemetrics.StorageMetrics`. Metrics are picklable and
+can be merged, so the metrics collected in different processes can be combined
+by the environment.
+
+"""
+
+__author__ = 'Robert Meyer'
+
+import bisect
+
+import pandas as pd
+
+
+class LatencyHistogram(object):
+    """Histogram of latencies with logarithmically spaced buckets.
+
+    A latency falls into the first bucket whose upper bound is not exceeded,
+    the last bucket collects all latencies longer than 10 seconds.
+
+    """
+
+    BOUNDS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+    """Upper bounds of the buckets in seconds"""
+
+    LABELS = ('<=10us', '<=100us', '<=1ms', '<=10ms', '<=100ms', '<=1s', '<=10s', '>10s')
+    """Names of the buckets"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    def add(self, seconds):
+        """Adds a latency in seconds"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+    def merge(self, other):
+        """Adds all latencies of another histogram"""
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [x + y for x, y in zip(self.buckets, other.buckets)]
+
+    @property
+    def mean(self):
+        """Mean latency in seconds"""
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        """Summary of the histogram as a dictionary"""
+        result = dict(count=self.count, total=self.total, mean=self.mean, max=self.max)
+        result.update(zip(self.LABELS, self.buckets))
+        return result
+
+
+class LockStatistics(object):
+    """Contention statistics of a storage lock per client.
+
+    Clients, i.e. processes identified by host name and process id, record how long they
+    waited for the lock and how long they held it. Lock servers additionally record
+    how often a client was told to wait and retry, and the number of clients that
+    were waiting at the same time (queue depth).
+
+    """
+
+    COLUMNS = ('acquisitions', 'retries', 'max_queue_depth',
+               'wait_total', 'wait_mean', 'wait_max',
+               'hold_total', 'hold_mean', 'hold_max')
+    """Columns of the data frame returned by :func:`~LockStatistics.summary`"""
+
+    def __init__(self):
+        self.clients = {}
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __repr__(self):
+        return '<%s of %d clients>' % (self.__class__.__name__, len(self.clients))
+
+    def _get_client(self, client_id):
+        try:
+            return self.clients[client_id]
+        except KeyError:
+            client = dict(acquisitions=0, retries=0, max_queue_depth=0,
+                          wait=LatencyHistogram(), hold=LatencyHistogram())
+            self.clients[client_id] = client
+            return client
+
+    def record_wait(self, client_id, seconds):
+        """Records a lock acquisition and the seconds waited for it"""
+        client = self._get_client(client_id)
+        client['acquisitions'] += 1
+        client['wait'].add(seconds)
+
+    def record_hold(self, client_id, seconds):
+        """Records the seconds a lock was held before releasing it"""
+        self._get_client(client_id)['hold'].add(seconds)
+
+    def record_retry(self, client_id, queue_depth):
+        """Records that a client has to retry and the number of clients waiting"""
+        client = self._get_client(client_id)
+        client['retries'] += 1
+        client['max_queue_depth'] = max(client['max_queue_depth'], queue_depth)
+
+    def merge(self, other):
+        """Adds the statistics of all clients of other statistics, `None` is ignored"""
+        if other is None:
+            return self
+        for client_id, other_client in other.clients.items():
+            client = self._get_client(client_id)
+            client['acquisitions'] += other_client['acquisitions']
+            client['retries'] += other_client['retries']
+            client['max_queue_depth'] = max(client['max_queue_depth'],
+                                            other_client['max_queue_depth'])
+            client['wait'].merge(other_client['wait'])
+            client['hold'].merge(other_client['hold'])
+        return self
+
+    def reset(self):
+        """Removes the statistics of all clients"""
+        self.clients = {}
+
+    def summary(self):
+        """Returns a data frame with one row of statistics per client"""
+        names = sorted(self.clients.keys())
+        rows = []
+        for name in names:
+            client = self.clients[name]
+            wait = client['wait']
+            hold = client['hold']
+            rows.append((client['acquisitions'], client['retries'], client['max_queue_depth'],
+                         wait.total, wait.mean, wait.max, hold.total, hold.mean, hold.max))
+        return pd.DataFrame(rows, index=names, columns=self.COLUMNS)
+
+    def report(self):
+        """Returns a human readable summary of the lock contention"""
+        frame = self.summary()
+        return ('%d acquisitions by %d clients, waited %.3f seconds and held the lock '
+                '%.3f seconds in total, %d retries, maximum queue depth %d.\n%s' %
+                (frame.acquisitions.sum(), len(frame), frame.wait_total.sum(),
+                 frame.hold_total.sum(), frame.retries.sum(),
+                 frame.max_queue_depth.max() if len(frame) else 0,
+                 frame.to_string()))
+
+
+class StorageMetrics(object):
+    """Counters and latency histograms per operation type of storage services.
+
+    Counters are, for instance, the number of processed nodes, flushes,
+    table rows appended, or bytes written. Latencies are recorded per message type,
+    e.g. ``'store.LEAF'`` or ``'load.TRAJECTORY'``.
+    Contention of the storage lock is recorded in ``locks``, see
+    :class:`~pypet.utils.storagemetrics.LockStatistics`.
+
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.latencies = {}
+        self.locks = LockStatistics()
+
+    def __len__(self):
+        return len(self.counters) + len(self.latencies) + len(self.locks)
+
+    def __repr__(self):
+        return ('<%s with counters %s, %d latency histograms, '
+                'and lock statistics of %d clients>' % (self.__class__.__name__,
+                                                        str(self.counters),
+                                                        len(self.latencies),
+                                                        len(self.locks)))
+
+    def increment(self, name, value=1):
+        """Increments the counter `name` by `value`"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, seconds):
+        """Records the latency in seconds of an operation of type `name`"""
+        try:
+            histogram = self.latencies[name]
+        except KeyError:
+            histogram = LatencyHistogram()
+            self.latencies[name] = histogram
+        histogram.add(seconds)
+
+    def merge(self, other):
+        """Adds all counters and latencies of other metrics, `None` is ignored"""
+        if other is None:
+            return self
+        for name, value in other.counters.items():
+            self.increment(name, value)
+        for name, histogram in other.latencies.items():
+            if name not in self.latencies:
+                self.latencies[name] = LatencyHistogram()
+            self.latencies[name].merge(histogram)
+        self.locks.merge(other.locks)
+        return self
+
+    def reset(self):
+        """Removes all counters, latencies, and lock statistics"""
+        self.counters = {}
+        self.latencies = {}
+        self.locks.reset()
+
+    def latency_frame(self):
+        """Returns a data frame with one row of latency statistics per operation type"""
+        names = sorted(self.latencies.keys())
+        columns = ('count', 'total', 'mean', 'max') + LatencyHistogram.LABELS
+        rows = [self.latencies[name].as_dict() for name in names]
+        return pd.DataFrame(rows, index=names, columns=columns)
@@ -1,9 +1,35 @@
 __author__ = 'Robert Meyer'
 
 import os
+import time
+import logging
+import multiprocessing as multip
+
+import pypet.pypetconstants as pypetconstants
 from pypet.trajectory import load_trajectory
 
 
+def _load_for_merge(kwargs):
+    """Loads a trajectory with all (derived) parameters needed to plan a merge.
+
+    Module level function to be usable by a multiprocessing pool,
+    used for serial loading as well to load the very same data.
+
+    :return: Tuple of the loaded trajectory and the seconds needed for loading
+
+    """
+    start = time.time()
+    traj = load_trajectory(index=-1,
+                           load_parameters=pypetconstants.LOAD_DATA,
+                           load_derived_parameters=pypetconstants.LOAD_DATA,
+                           load_results=pypetconstants.LOAD_SKELETON,
+                           load_other_data=pypetconstants.LOAD_SKELETON,
+                           **kwargs)
+    # The run information has to be pickled as well
+    traj.v_full_copy = True
+    return traj, time.time() - start
+
+
 def merge_all_in_folder(folder, ext='.hdf5',
                         dynamic_imports=None,
                         storage_service=None,
@@ -14,7 +40,8 @@ def merge_all_in_folder(folder, ext='.hdf5',
                         keep_info=True,
                         keep_other_trajectory_info=True,
                         merge_config=True,
-                        backup=True):
+                        backup=True,
+                        ncores=1):
     """Merges all files in a given folder.
 
     IMPORTANT: Does not check if there are more than 1 trajectory in a file. Always
@@ -30,12 +57,19 @@ def merge_all_in_folder(folder, ext='.hdf5',
     :param storage_service: storage service to use, leave `None` to use the default one
     :param force: If loading should be forced.
     :param delete_other_files: Deletes files of merged trajectories
+    :param ncores:
+
+        Number of processes that load the trajectories in parallel.
+        With ``1`` all trajectories are loaded one after the other in the current process.
+        In both cases the same data is loaded, so the merged trajectory does not depend
+        on `ncores`. The merging itself always happens in the current process.
 
     All other parameters as in `f_merge_many` of the trajectory.
 
     :return: The merged traj
 
     """
+    logger = logging.getLogger('pypet.merge_all_in_folder')
     in_dir = os.listdir(folder)
     all_files = []
     # Find all files with matching extension
@@ -47,16 +81,34 @@ def merge_all_in_folder(folder, ext='.hdf5',
                 all_files.append(full_file)
     all_files = sorted(all_files)
 
-    # Open all trajectories
-    trajs = []
-    for full_file in all_files:
-        traj = load_trajectory(index=-1,
-                               storage_service=storage_service,
-                               filename=full_file,
-                               load_data=0,
-                               force=force,
-                               dynamic_imports=dynamic_imports)
-        trajs.append(traj)
+    # Open all trajectories, the first one is the target and is loaded as usual
+    first_traj = load_trajectory(index=-1,
+                                 storage_service=storage_service,
+                                 filename=all_files[0],
+                                 load_data=0,
+                                 force=force,
+                                 dynamic_imports=dynamic_imports)
+    trajs = [first_traj]
+    # The other ones are loaded alike, no matter if in parallel or not
+    load_kwargs = [dict(storage_service=storage_service,
+                        filename=full_file,
+                        force=force,
+                        dynamic_imports=dynamic_imports) for full_file in all_files[1:]]
+    if ncores > 1:
+        pool = multip.Pool(ncores)
+        loaded = pool.imap(_load_for_merge, load_kwargs)
+    else:
+        pool = None
+        loaded = map(_load_for_merge, load_kwargs)
+    try:
+        for idx, (traj, load_time) in enumerate(loaded):
+            trajs.append(traj)
+            logger.log(21, 'Loaded %d out of %d, `%s` took %.2fs' %
+                       (idx + 1, len(load_kwargs), all_files[idx + 1], load_time))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     # Merge all trajectories
     first_traj = trajs.pop(0)
@@ -34,6 +34,7 @@ setup(
               'pypet.tests.unittests',
               'pypet.tests.integration',
               'pypet.tests.profiling',
+              'pypet.tests.benchmarks',
               'pypet.tests.testutils',
               'pypet.tests.unittests.brian2tests',
               'pypet.tests.integration.brian2tests',